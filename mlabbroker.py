@@ -0,0 +1,310 @@
+##############################################################################
+######## mlabbroker: share warm matlab(tm) engines between processes #########
+##############################################################################
+##
+## o created: 2026-10-19
+## o keywords: matlab engine pool
+## o license: MIT
+## o XXX:
+##   - an engine is leased to a client for as long as it stays connected
+##     (its workspace, and hence its proxies, are private to that client), so
+##     there can't be more connected clients than engines; others wait
+##   - requests are pickled, so only trusted clients (the socket is only
+##     accessible to the broker's user) may connect
+
+"""
+mlabbroker
+==========
+
+A broker process that owns a pool of warm matlab(tm) engines and serves the
+engine operations (``eval``, ``put``, ``get`` etc.) of many python processes
+over a unix domain socket. Start it with::
+
+  python mlabbroker.py [-n SESSIONS] SOCKET
+
+and make `MlabWrap` use it by setting the environment variable
+``MLABWRAP_BROKER`` to the socket's path (before importing `mlabwrap`) --
+``from mlabwrap import mlab`` will then lease an engine from the broker
+instead of starting matlab itself.
+
+Each client connection leases an engine for as long as it lasts; afterwards
+the engine's workspace is cleared and the engine handed to the next client
+(an engine that died, e.g. because a call timed out, is replaced by a fresh
+one). Thus short-lived or restarted worker processes don't pay matlab's
+startup time and the number of engines stays bounded.
+
+Large arrays aren't sent through the socket but handed over as files in
+shared memory (``/dev/shm``, if it exists), see `SHM_THRESHOLD`.
+"""
+
+__docformat__ = "restructuredtext en"
+__version__ = '1.1'
+
+import sys, os
+import socket
+import struct
+import threading
+import tempfile
+import Queue
+import SocketServer
+import cPickle
+import numpy
+import mlabraw
+
+SHM_THRESHOLD = 1 << 16
+"""Arrays with at least this many bytes are transferred via shared memory."""
+SHM_DIR = (os.path.isdir('/dev/shm') and '/dev/shm') or tempfile.gettempdir()
+
+class BrokerError(mlabraw.error):
+    """Raised if the broker can't be reached or has no engine to spare."""
+    pass
+
+_EXCEPTIONS = {'TypeError': TypeError, 'ValueError': ValueError,
+               'BrokerError': BrokerError}
+"""Exceptions passed on to the client as they are (everything else becomes
+an ``mlabraw.error``)."""
+
+class _ShmArray(object):
+    """An array stored in a (shared memory) file, in C or Fortran order."""
+    def __init__(self, value):
+        fd, self.path = tempfile.mkstemp(prefix='mlabbroker', dir=SHM_DIR)
+        os.close(fd)
+        self.dtype, self.shape = value.dtype.str, value.shape
+        self.fortran = value.flags.f_contiguous and not value.flags.c_contiguous
+        try:
+            # avoid copying F-contiguous arrays (which matlab wants anyway)
+            if self.fortran:
+                value.T.tofile(self.path)
+            else:
+                numpy.ascontiguousarray(value).tofile(self.path)
+        except:
+            os.remove(self.path)
+            raise
+    def load(self):
+        try:
+            data = numpy.fromfile(self.path, self.dtype)
+        finally:
+            os.remove(self.path)
+        if self.fortran:
+            return data.reshape(self.shape[::-1]).T
+        return data.reshape(self.shape)
+    def discard(self):
+        """Remove the file, unless `load` already did."""
+        try:
+            os.remove(self.path)
+        except OSError: pass
+
+def _pack(value):
+    if isinstance(value, numpy.ndarray) and value.nbytes >= SHM_THRESHOLD \
+       and value.dtype.kind != 'O':
+        return _ShmArray(value)
+    return value
+
+def _unpack(value):
+    if isinstance(value, _ShmArray):
+        return value.load()
+    return value
+
+def _shm_arrays(obj):
+    """The `_ShmArray`\ s in a request or reply."""
+    if isinstance(obj, _ShmArray):
+        return [obj]
+    if isinstance(obj, dict):
+        obj = obj.values()
+    if isinstance(obj, (list, tuple)):
+        return sum(map(_shm_arrays, obj), [])
+    return []
+
+def _send(sock, obj):
+    data = cPickle.dumps(obj, 2)
+    sock.sendall(struct.pack('!Q', len(data)) + data)
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n:
+        chunk = sock.recv(min(n, 1 << 20))
+        if not chunk: raise EOFError("Connection closed")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return "".join(chunks)
+
+def _recv(sock):
+    n, = struct.unpack('!Q', _recv_exactly(sock, 8))
+    return cPickle.loads(_recv_exactly(sock, n))
+
+
+class _Handler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        broker = self.server.broker
+        session = None
+        done = False
+        sent = [] # in case the client goes away before loading them
+        try:
+            while not done:
+                try:
+                    request = _recv(self.request)
+                except EOFError:
+                    break
+                sent = [shm for shm in sent if os.path.exists(shm.path)]
+                op, args = request[0], request[1:]
+                try:
+                    if op == 'open':
+                        if session is None: session = broker.lease()
+                        result = None
+                    elif op == 'close':
+                        result, done = None, True
+                    elif session is None:
+                        raise BrokerError("No engine leased")
+                    elif op == 'eval':
+                        result = mlabraw.eval(session, args[0])
+                    elif op == 'put':
+                        name, value, native = args
+                        result = mlabraw.put(session, name, _unpack(value), native)
+                    elif op == 'get':
+                        result = _pack(mlabraw.get(session, args[0]))
+                    elif op == 'put_many':
+                        values, native = args
+                        result = mlabraw.put_many(session, dict(
+                            [(name, _unpack(value)) for (name, value) in values.items()]), native)
+                    elif op == 'get_many':
+                        result = dict([(name, _pack(value)) for (name, value)
+                                       in mlabraw.get_many(session, args[0]).items()])
+                    else:
+                        raise ValueError("Unknown operation: %r" % (op,))
+                    reply = ('ok', result)
+                except Exception, e:
+                    reply = ('error', type(e).__name__, str(e))
+                # whatever the request failed to load is of no use anymore
+                for shm in _shm_arrays(args): shm.discard()
+                sent.extend(_shm_arrays(reply))
+                _send(self.request, reply)
+        finally:
+            for shm in sent: shm.discard()
+            if session is not None:
+                broker.release(session)
+
+class _Server(SocketServer.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+class Broker(object):
+    """Owns `size` engine sessions and serves clients at the unix socket
+    `address`."""
+    def __init__(self, address, size=2, cmd_str=None, lease_timeout=None):
+        if cmd_str is None: cmd_str = os.getenv("MLABRAW_CMD_STR", "")
+        self.address = address
+        self.cmd_str = cmd_str
+        self.lease_timeout = lease_timeout
+        """How many seconds a client waits for an engine (`None`: forever)."""
+        self._idle = Queue.Queue()
+        for i in range(size):
+            self._idle.put(mlabraw.open(cmd_str))
+    def lease(self):
+        try:
+            return self._idle.get(True, self.lease_timeout)
+        except Queue.Empty:
+            raise BrokerError("No matlab engine became free within %s seconds"
+                              % self.lease_timeout)
+    def release(self, session):
+        """Clean up `session` for its next client (or replace it if it died)."""
+        try:
+            mlabraw.eval(session, "clear all; fclose all;")
+        except mlabraw.error:
+            try:
+                mlabraw.close(session)
+            except mlabraw.error: pass
+            session = mlabraw.open(self.cmd_str)
+        self._idle.put(session)
+    def serve_forever(self):
+        if os.path.exists(self.address): os.remove(self.address)
+        old_umask = os.umask(0077)
+        try:
+            server = _Server(self.address, _Handler)
+        finally:
+            os.umask(old_umask)
+        server.broker = self
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(self.address): os.remove(self.address)
+            while not self._idle.empty():
+                mlabraw.close(self._idle.get())
+
+
+class _Connection(object):
+    """An engine leased from the broker (a session handle for `BrokerClient`)."""
+    def __init__(self, address):
+        self._lock = threading.Lock()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(address)
+        except socket.error, msg:
+            raise BrokerError("Can't connect to broker at %r: %s" % (address, msg))
+    def request(self, *request):
+        self._lock.acquire()
+        try:
+            try:
+                _send(self._sock, request)
+                reply = _recv(self._sock)
+            except (socket.error, EOFError), msg:
+                # the broker might not have loaded them
+                for shm in _shm_arrays(request): shm.discard()
+                raise BrokerError("Lost connection to broker: %s" % (msg,))
+        finally:
+            self._lock.release()
+        if reply[0] == 'ok':
+            return _unpack(reply[1])
+        raise _EXCEPTIONS.get(reply[1], mlabraw.error)(reply[2])
+    def close(self):
+        self._sock.close()
+
+class BrokerClient(object):
+    """Talks to a `Broker` at `address`; has the same interface as
+    ``mlabraw``, so it can be used as `MlabWrap`'s engine."""
+    error = mlabraw.error
+    def __init__(self, address):
+        self.address = address
+    def open(self, cmd_str=""):
+        # the broker starts its engines itself, so `cmd_str` is ignored
+        connection = _Connection(self.address)
+        try:
+            connection.request('open')
+        except:
+            connection.close()
+            raise
+        return connection
+    def close(self, connection):
+        try:
+            connection.request('close')
+        finally:
+            connection.close()
+    def eval(self, connection, cmd):
+        return connection.request('eval', cmd)
+    def put(self, connection, name, value, native=False):
+        return connection.request('put', name, _pack(value), native)
+    def get(self, connection, name, shared=False):
+        # the value has to be copied out of the broker anyway, so `shared`
+        # makes no difference
+        return connection.request('get', name)
+    def put_many(self, connection, values, native=False):
+        return connection.request('put_many', dict(
+            [(name, _pack(value)) for (name, value) in values.items()]), native)
+    def get_many(self, connection, names):
+        values = connection.request('get_many', list(names))
+        try:
+            return dict([(name, _unpack(value)) for (name, value) in values.items()])
+        finally:
+            for shm in _shm_arrays(values): shm.discard()
+
+if __name__ == '__main__':
+    import optparse
+    parser = optparse.OptionParser(usage="python mlabbroker.py [-n SESSIONS] SOCKET")
+    parser.add_option('-n', '--sessions', type='int', default=2,
+                      help="number of matlab engines to start (default: 2)")
+    parser.add_option('-t', '--lease-timeout', type='float', default=None,
+                      help="seconds a client waits for a free engine (default: forever)")
+    options, args = parser.parse_args()
+    if len(args) != 1: parser.error("need exactly one socket path")
+    # so that pickled classes refer to `mlabbroker`, not `__main__`
+    import mlabbroker
+    mlabbroker.Broker(args[0], options.sessions, lease_timeout=options.lease_timeout).serve_forever()
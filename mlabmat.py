@@ -0,0 +1,424 @@
+##############################################################################
+################ mlabmat: read and write matlab(tm) .mat files ###############
+##############################################################################
+##
+## o created: 2026-10-19
+## o keywords: matlab mat-file
+## o license: MIT
+## o XXX:
+##   - sparse arrays can only be read (and only if scipy is installed)
+##   - objects, function handles and other opaque classes are skipped on
+##     reading (with a warning)
+##   - v7.3 (i.e. HDF5 based) files are not supported
+
+"""
+mlabmat
+=======
+
+A pure python reader and writer for level 5 (i.e. v5 to v7) matlab(tm)
+MAT-files, for exchanging data with matlab jobs without needing a live
+matlab session::
+
+  >>> from mlabmat import saveMat, loadMat
+  >>> saveMat('/tmp/foo.mat', {'x': numpy.arange(3.), 'name': 'foo',
+  ...                          'opts': {'tol': 1e-6}, 'labels': ['a', 1.]})
+  >>> loadMat('/tmp/foo.mat')['opts']
+  {'tol': array([[  1.00000000e-06]])}
+
+Conversions follow ``mlabwrap`` where sensible: 1D arrays become column
+vectors, strings become char arrays, dicts scalar structs and non-numeric
+lists and tuples (1xN) cell arrays. Unlike ``mlabraw``, numeric arrays keep
+their type (e.g. ``int32`` or ``single``), unless ``saveMat`` is told to cast
+them to double.
+
+Large uncompressed numeric variables are loaded as read-only views into a
+memory map of the file, so that loading them costs no copying at all; see
+``loadMat``.
+"""
+
+__docformat__ = "restructuredtext en"
+__version__ = '1.1'
+
+import sys, os, re
+import struct
+import zlib
+import mmap
+import time
+import warnings
+import numpy
+
+class MatFileError(Exception):
+    """Raised for malformed or unsupported .mat files and values."""
+    pass
+
+# data element types
+miINT8, miUINT8, miINT16, miUINT16, miINT32, miUINT32 = 1, 2, 3, 4, 5, 6
+miSINGLE, miDOUBLE, miINT64, miUINT64 = 7, 9, 12, 13
+miMATRIX, miCOMPRESSED, miUTF8, miUTF16, miUTF32 = 14, 15, 16, 17, 18
+# array classes
+mxCELL, mxSTRUCT, mxOBJECT, mxCHAR, mxSPARSE = 1, 2, 3, 4, 5
+mxDOUBLE, mxSINGLE, mxINT8, mxUINT8, mxINT16, mxUINT16 = 6, 7, 8, 9, 10, 11
+mxINT32, mxUINT32, mxINT64, mxUINT64 = 12, 13, 14, 15
+# array flags
+_COMPLEX, _GLOBAL, _LOGICAL = 0x800, 0x400, 0x200
+
+_MI_DTYPES = {miINT8: 'i1', miUINT8: 'u1', miINT16: 'i2', miUINT16: 'u2',
+              miINT32: 'i4', miUINT32: 'u4', miSINGLE: 'f4', miDOUBLE: 'f8',
+              miINT64: 'i8', miUINT64: 'u8', miUTF8: 'u1', miUTF16: 'u2',
+              miUTF32: 'u4'}
+_DTYPE_CLASSES = {'f8': (mxDOUBLE, miDOUBLE), 'f4': (mxSINGLE, miSINGLE),
+                  'i1': (mxINT8, miINT8),     'u1': (mxUINT8, miUINT8),
+                  'i2': (mxINT16, miINT16),   'u2': (mxUINT16, miUINT16),
+                  'i4': (mxINT32, miINT32),   'u4': (mxUINT32, miUINT32),
+                  'i8': (mxINT64, miINT64),   'u8': (mxUINT64, miUINT64)}
+"""Maps dtype strings like ``'f8'`` to (array class, data element type)."""
+_MX_DTYPES = dict([(mx, dt) for (dt, (mx, mi)) in _DTYPE_CLASSES.items()])
+
+_VALID_NAME = re.compile(r'^[A-Za-z]\w{0,62}$')
+
+def _pad8(n):
+    return (8 - n % 8) % 8
+
+##############################################################################
+################################### writing ##################################
+##############################################################################
+
+class _MatWriter(object):
+    def __init__(self, cast_to_double=False):
+        self.cast_to_double = cast_to_double
+
+    def element(self, mi_type, data):
+        """Returns the data element of type `mi_type` for the string `data`."""
+        n = len(data)
+        if n <= 4: # small data element format
+            return struct.pack('=I', (n << 16) | mi_type) + data + '\0' * (4 - n)
+        return struct.pack('=II', mi_type, n) + data + '\0' * _pad8(n)
+
+    def array_element(self, dtype_str, values):
+        a = numpy.asarray(values, dtype='=' + dtype_str)
+        return self.element(_DTYPE_CLASSES[dtype_str][1],
+                            a.ravel(order='F').tostring())
+
+    def header(self, mx_class, flags, dims, name):
+        return (self.element(miUINT32, struct.pack('=II', mx_class | flags, 0)) +
+                self.element(miINT32, numpy.asarray(dims, '=i4').tostring()) +
+                self.element(miINT8, name))
+
+    def matrix(self, value, name=''):
+        return self.element(miMATRIX, self.matrix_body(value, name))
+
+    def matrix_body(self, value, name):
+        if value is None:
+            value = numpy.zeros((0, 0))
+        if isinstance(value, basestring):
+            return self.char_body(value, name)
+        if isinstance(value, dict):
+            return self.struct_body(numpy.array([value], dtype=object).reshape(1, 1), name)
+        if isinstance(value, (list, tuple)):
+            try:
+                a = numpy.array(value)
+            except ValueError:
+                a = None
+            if a is None or a.dtype.kind not in 'biufc':
+                cells = numpy.empty((1, len(value)), dtype=object)
+                for i, v in enumerate(value): cells[0, i] = v
+                return self.cell_body(cells, name)
+            value = a
+        a = numpy.asarray(value)
+        if a.ndim == 0:
+            a = a.reshape(1, 1)
+        elif a.ndim == 1: # same as mlabraw: 1D -> column vector, empty -> 0x0
+            if len(a): a = a.reshape(-1, 1)
+            else:      a = a.reshape(0, 0)
+        if a.dtype.kind == 'O':
+            if a.size and all([isinstance(x, dict) for x in a.flat]):
+                return self.struct_body(a, name)
+            return self.cell_body(a, name)
+        if a.dtype.kind in 'SU':
+            if a.size == 1:
+                return self.char_body(a.flat[0], name)
+            return self.cell_body(a.astype(object), name)
+        if a.dtype.kind not in 'biufc':
+            raise MatFileError("Can't save values of type %s" % a.dtype)
+        return self.numeric_body(a, name)
+
+    def numeric_body(self, a, name):
+        flags = 0
+        if a.dtype.kind == 'b' and not self.cast_to_double:
+            flags |= _LOGICAL
+            a = a.astype('u1')
+        if a.dtype.kind == 'c':
+            flags |= _COMPLEX
+            parts = [a.real, a.imag]
+        else:
+            parts = [a]
+        dtype_str = parts[0].dtype.str[1:]
+        if self.cast_to_double or dtype_str not in _DTYPE_CLASSES:
+            dtype_str = 'f8'
+        mx_class = _DTYPE_CLASSES[dtype_str][0]
+        return (self.header(mx_class, flags, a.shape, name) +
+                "".join([self.array_element(dtype_str, p) for p in parts]))
+
+    def char_body(self, s, name):
+        if not isinstance(s, unicode):
+            s = s.decode('latin-1')
+        data = numpy.fromstring(s.encode('utf-16-le'), '<u2').astype('=u2')
+        return (self.header(mxCHAR, 0, (min(1, len(s)), len(s)), name) +
+                self.element(miUINT16, data.tostring()))
+
+    def cell_body(self, cells, name):
+        return (self.header(mxCELL, 0, cells.shape, name) +
+                "".join([self.matrix(v) for v in cells.ravel(order='F')]))
+
+    def struct_body(self, structs, name):
+        fieldnames = []
+        for s in structs.flat:
+            for k in sorted(s):
+                if k not in fieldnames: fieldnames.append(k)
+        for k in fieldnames:
+            if not _VALID_NAME.match(k):
+                raise MatFileError("Illegal struct field name: %r" % k)
+        width = max([len(k) for k in fieldnames] + [31]) + 1
+        return (self.header(mxSTRUCT, 0, structs.shape, name) +
+                self.element(miINT32, struct.pack('=i', width)) +
+                self.element(miINT8, "".join([k.ljust(width, '\0')
+                                              for k in fieldnames])) +
+                "".join([self.matrix(s.get(k)) for s in structs.ravel(order='F')
+                         for k in fieldnames]))
+
+def saveMat(filename, variables, compress=False, cast_to_double=False):
+    r"""Saves the dict `variables` as a level 5 matlab(tm) .mat file called
+    `filename`, without the help of matlab.
+
+    If `compress` is true, all variables are zlib compressed (like matlab's
+    default) -- note that compressed variables can't be memory-mapped by
+    `loadMat`. If `cast_to_double` is true, all (non-logical) numeric arrays
+    are saved as doubles, mimicking the conversion done by ``mlabraw``."""
+    writer = _MatWriter(cast_to_double)
+    header = ('MATLAB 5.0 MAT-file, Platform: %s, Created on: %s, by mlabmat' % (
+        sys.platform, time.asctime()))[:116].ljust(116)
+    f = open(filename, 'wb')
+    try:
+        if sys.byteorder == 'little': endian_indicator = 'IM'
+        else:                         endian_indicator = 'MI'
+        f.write(header + '\0' * 8 + struct.pack('=H', 0x0100) + endian_indicator)
+        names = variables.keys()
+        names.sort()
+        for name in names:
+            if not _VALID_NAME.match(name):
+                raise MatFileError("Illegal matlab variable name: %r" % name)
+            data = writer.matrix(variables[name], name)
+            if compress: # compressed elements are not padded
+                data = zlib.compress(data)
+                data = struct.pack('=II', miCOMPRESSED, len(data)) + data
+            f.write(data)
+    finally:
+        f.close()
+
+##############################################################################
+################################### reading ##################################
+##############################################################################
+
+class _MatReader(object):
+    def __init__(self, buf, byteorder, mmap_threshold):
+        self.buf = buf
+        self.bo = byteorder
+        self.mmap_threshold = mmap_threshold
+
+    def tag(self, pos):
+        """Returns ``(mi_type, nbytes, data_pos, next_pos)`` for the data
+        element at `pos`."""
+        mi_type, nbytes = struct.unpack(self.bo + 'II', self.buf[pos:pos+8])
+        if mi_type >> 16: # small data element format
+            return (mi_type & 0xffff, mi_type >> 16, pos + 4, pos + 8)
+        if mi_type == miCOMPRESSED:
+            return mi_type, nbytes, pos + 8, pos + 8 + nbytes
+        return mi_type, nbytes, pos + 8, pos + 8 + nbytes + _pad8(nbytes)
+
+    def data(self, pos, copy=True):
+        """Returns ``(array, next_pos)`` for the data element at `pos`."""
+        mi_type, nbytes, start, next_pos = self.tag(pos)
+        if mi_type not in _MI_DTYPES:
+            raise MatFileError("Unexpected data element type %d" % mi_type)
+        dtype = numpy.dtype(self.bo + _MI_DTYPES[mi_type])
+        a = numpy.frombuffer(self.buf, dtype, nbytes // dtype.itemsize, start)
+        if copy: a = a.copy()
+        return a, next_pos
+
+    def string(self, pos):
+        mi_type, nbytes, start, next_pos = self.tag(pos)
+        return str(self.buf[start:start+nbytes]), next_pos
+
+    def matrix(self, pos, top_level=False):
+        """Returns ``(name, value, next_pos)`` for the miMATRIX at `pos`."""
+        mi_type, nbytes, start, next_pos = self.tag(pos)
+        if mi_type != miMATRIX:
+            raise MatFileError("Expected miMATRIX, got data element type %d" % mi_type)
+        if nbytes == 0: # empty cell contents
+            return '', numpy.zeros((0, 0)), next_pos
+        flags, pos = self.data(start)
+        mx_class, flags = flags[0] & 0xff, flags[0] & 0xff00
+        dims, pos = self.data(pos)
+        dims = tuple([int(d) for d in dims])
+        name, pos = self.string(pos)
+        if mx_class in _MX_DTYPES:
+            value = self.numeric(pos, mx_class, flags, dims, top_level)
+        elif mx_class == mxCHAR:
+            value = self.char(pos, dims)
+        elif mx_class == mxCELL:
+            value = self.cell(pos, dims)
+        elif mx_class == mxSTRUCT:
+            value = self.struct(pos, dims)
+        elif mx_class == mxSPARSE:
+            value = self.sparse(pos, flags, dims)
+        else:
+            raise MatFileError("Unsupported matlab class %d for %r" % (mx_class, name))
+        return name, value, next_pos
+
+    def numeric(self, pos, mx_class, flags, dims, top_level):
+        dtype = numpy.dtype(self.bo + _MX_DTYPES[mx_class])
+        mi_type, nbytes, start, _ = self.tag(pos)
+        # zero-copy: map large, uncompressed real data stored in its own type
+        if (top_level and self.mmap_threshold is not None and
+            isinstance(self.buf, mmap.mmap) and not flags & (_COMPLEX | _LOGICAL) and
+            _MI_DTYPES.get(mi_type) == dtype.str[1:] and
+            nbytes >= self.mmap_threshold):
+            real = numpy.frombuffer(self.buf, dtype, nbytes // dtype.itemsize, start)
+            return real.reshape(dims, order='F')
+        real, pos = self.data(pos, copy=False)
+        if flags & _LOGICAL:
+            return real.astype(bool).reshape(dims, order='F')
+        if flags & _COMPLEX:
+            imag, pos = self.data(pos, copy=False)
+            ctype = numpy.dtype((dtype.itemsize == 4 and 'c8') or 'c16')
+            value = numpy.empty(real.shape, ctype)
+            value.real = real
+            value.imag = imag
+        else: # matlab stores e.g. integral doubles as smaller types
+            value = real.astype(dtype)
+        return value.reshape(dims, order='F')
+
+    def char(self, pos, dims):
+        mi_type, nbytes, start, _ = self.tag(pos)
+        if mi_type == miUTF8 or mi_type == miINT8 or mi_type == miUINT8:
+            chars = numpy.array(list(
+                str(self.buf[start:start+nbytes]).decode('utf-8')))
+        elif mi_type == miUTF32:
+            codes, pos = self.data(pos)
+            chars = numpy.array(list(codes.astype('<u4').tostring().decode('utf-32-le')))
+        else:
+            codes, pos = self.data(pos)
+            chars = numpy.array(list(codes.astype('<u2').tostring().decode('utf-16-le')))
+        if not chars.size: return ''
+        rows = [_narrow(u"".join(row))
+                for row in chars.reshape(dims, order='F').reshape(dims[0], -1)]
+        if len(rows) == 1: return rows[0]
+        return rows
+
+    def cell(self, pos, dims):
+        n = int(numpy.prod(dims))
+        cells = numpy.empty(n, dtype=object)
+        for i in range(n):
+            _, cells[i], pos = self.matrix(pos)
+        return _as_list_or_array(cells, dims)
+
+    def struct(self, pos, dims):
+        width, pos = self.data(pos)
+        names, pos = self.string(pos)
+        width = int(width[0])
+        fieldnames = [names[i:i+width].split('\0', 1)[0]
+                      for i in range(0, len(names), width)]
+        n = int(numpy.prod(dims))
+        structs = numpy.empty(n, dtype=object)
+        for i in range(n):
+            s = {}
+            for k in fieldnames:
+                _, s[k], pos = self.matrix(pos)
+            structs[i] = s
+        if n == 1: return structs[0]
+        return _as_list_or_array(structs, dims)
+
+    def sparse(self, pos, flags, dims):
+        try:
+            import scipy.sparse
+        except ImportError:
+            raise MatFileError("Reading sparse arrays requires scipy")
+        ir, pos = self.data(pos)
+        jc, pos = self.data(pos)
+        real, pos = self.data(pos)
+        if flags & _COMPLEX:
+            imag, pos = self.data(pos)
+            real = real + 1j * imag
+        elif flags & _LOGICAL:
+            real = real.astype(bool)
+        else:
+            real = real.astype(float)
+        nnz = jc[-1]
+        return scipy.sparse.csc_matrix((real[:nnz], ir[:nnz], jc), shape=dims)
+
+def _narrow(u):
+    """Returns plain ascii strings as `str`, everything else as `unicode`."""
+    try:
+        return u.encode('ascii')
+    except UnicodeError:
+        return u
+
+def _as_list_or_array(values, dims):
+    # like mlabwrap's cell conversion: vectors become lists
+    if len(dims) == 2 and min(dims) <= 1:
+        return list(values)
+    return values.reshape(dims, order='F')
+
+def loadMat(filename, mmap_threshold=1024**2, variable_names=None):
+    r"""Loads the variables in the level 5 matlab(tm) .mat file `filename`
+    into a dict, without the help of matlab.
+
+    Uncompressed real numeric arrays of at least `mmap_threshold` bytes are
+    returned as read-only (fortran ordered) arrays that directly reference a
+    memory map of the file (which stays open as long as one of them is
+    alive); use ``mmap_threshold=None`` to always read variables into
+    memory. Note that matlab's ``save`` compresses by default, use ``save
+    -v6`` to create files that can be mapped.
+
+    If `variable_names` is given, only the named variables are loaded.
+    Variables of unsupported classes (e.g. objects) are skipped with a
+    warning."""
+    f = open(filename, 'rb')
+    try:
+        header = f.read(128)
+        if len(header) < 128 or header[:4] == '\0\0\0\0':
+            raise MatFileError("%r is not a level 5 .mat file" % filename)
+        if header.startswith('MATLAB 7.3'):
+            raise MatFileError("v7.3 (HDF5) .mat files are not supported")
+        byteorder = {'IM': '<', 'MI': '>'}.get(header[126:128])
+        if byteorder is None:
+            raise MatFileError("%r is not a level 5 .mat file" % filename)
+        size = os.fstat(f.fileno()).st_size
+        if mmap_threshold is not None and size > 128:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = f.read()
+            buf = header + buf
+    finally:
+        f.close()
+    reader = _MatReader(buf, byteorder, mmap_threshold)
+    res = {}
+    pos = 128
+    while pos < len(buf):
+        mi_type, nbytes, start, next_pos = reader.tag(pos)
+        try:
+            if mi_type == miCOMPRESSED:
+                sub = _MatReader(zlib.decompress(buf[start:start+nbytes]),
+                                 byteorder, None)
+                name, value, _ = sub.matrix(0)
+            else:
+                name, value, _ = reader.matrix(pos, top_level=True)
+        except MatFileError, msg:
+            warnings.warn("Skipping variable: %s" % msg)
+        else:
+            if variable_names is None or name in variable_names:
+                res[name] = value
+        pos = next_pos
+    return res
+
+__all__ = ['saveMat', 'loadMat', 'MatFileError']
@@ -0,0 +1,193 @@
+##############################################################################
+######### mlabprofile: where the time of bridged matlab(tm) calls goes #######
+##############################################################################
+##
+## o created: 2026-10-19
+## o keywords: matlab profiling
+## o license: MIT
+## o XXX:
+##   - matlab's profiler is global, so profiled calls are serialized
+##   - the profiler itself slows matlab down; compare calls with each other,
+##     not with unprofiled timings
+##   - times of functions with several callers are split between the callers
+##     in proportion to their time (matlab doesn't record more than that)
+
+"""
+mlabprofile
+===========
+
+Profiles calls of matlab functions through `MlabWrap` (i.e. ``mlab.foo(...)``)
+to tell whether slow calls are due to the bridge or the matlab code::
+
+  >>> mlab._profile(True)
+  >>> ... # the workload
+  >>> profiler = mlab._profile(False)
+  >>> profiler.report()
+  >>> profiler.write_collapsed('/tmp/mlab.folded')
+
+Every call is run with matlab's ``profile`` turned on and the function table
+of ``profile('info')`` is fetched in one transfer afterwards. For each command
+(the matlab function name) the report shows the total wall-clock time seen by
+python, the time matlab spent in the function itself, the time spent in other
+matlab functions the bridge called (``cd``, ``class`` etc.) and the remainder,
+i.e. the bridge overhead proper (conversion and transfer of arguments and
+results), followed by the matlab functions with the highest self time.
+
+The collapsed stacks (one ``command;function;subfunction microseconds`` line
+per stack, with ``command;[bridge]`` for the bridge overhead) can be fed
+directly to flame graph tools such as ``flamegraph.pl``.
+"""
+
+__docformat__ = "restructuredtext en"
+__version__ = '1.1'
+
+import sys
+import time
+import threading
+import warnings
+import numpy
+import mlabraw
+
+BRIDGE_FRAME = '[bridge]'
+
+_COLLECT = ("profile('off'); %(ft)s = profile('info'); %(ft)s = %(ft)s.FunctionTable;"
+            "%(tmp)s = struct('names', {{%(ft)s.FunctionName}},"
+            " 'total', [%(ft)s.TotalTime], 'edges', zeros(0, 3));"
+            "for %(i)s=1:numel(%(ft)s),"
+            " %(tmp)s.edges = [%(tmp)s.edges;"
+            " repmat(%(i)s, numel(%(ft)s(%(i)s).Children), 1),"
+            " reshape([%(ft)s(%(i)s).Children.Index], [], 1),"
+            " reshape([%(ft)s(%(i)s).Children.TotalTime], [], 1)];"
+            "end;")
+
+class MlabProfiler(object):
+    """Collects matlab-side and bridge timings per command; see
+    `MlabWrap._profile`."""
+    def __init__(self, mlabwrap):
+        self._mlabwrap = mlabwrap
+        self._lock = threading.RLock()
+        self.calls = {}
+        """Maps command names to ``[count, wall, matlab, other]``: the number
+        of calls, and the seconds spent in total, in the command's matlab
+        function and in other matlab functions called by the bridge."""
+        self.stacks = {}
+        """Maps collapsed stacks (``'command;function;subfunction'``) to
+        their self time in seconds."""
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.calls.clear()
+            self.stacks.clear()
+        finally:
+            self._lock.release()
+
+    def profile(self, name, fn, *args, **kwargs):
+        """Return ``fn(*args, **kwargs)``, profiling it as the command `name`."""
+        self._lock.acquire()
+        try:
+            self._mlabwrap._eval("profile('clear'); profile('on');")
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._collect(name, time.time() - start)
+        finally:
+            self._lock.release()
+
+    def _collect(self, name, wall):
+        mlab = self._mlabwrap
+        tmp, ft, i = [mlab._tmp_name(prefix)
+                      for prefix in ("TMP_PROFILE", "TMP_FT", "TMP_I")]
+        mlab._enter()
+        try:
+            try:
+                try:
+                    mlab._eval(_COLLECT % dict(tmp=tmp, ft=ft, i=i))
+                    info = mlab._raw_get(tmp)
+                finally:
+                    mlab._clear_vars([tmp, ft, i])
+            except (mlabraw.error, TypeError), msg:
+                # don't mask the call's own exception (e.g. a timeout)
+                warnings.warn("Couldn't collect profile for %r: %s" % (name, msg))
+                return
+        finally:
+            mlab._leave()
+        self._add(name, wall, info['names'], numpy.ravel(info['total']),
+                  numpy.reshape(info['edges'], (-1, 3)))
+
+    def _add(self, name, wall, names, totals, edges):
+        """Merge the function table of one call of `name` (`names` and
+        `totals` of the functions and caller/callee/time `edges`, 1-based)."""
+        children = {}
+        called = {}
+        for (caller, callee, seconds) in edges:
+            caller, callee = int(caller) - 1, int(callee) - 1
+            children.setdefault(caller, []).append((callee, seconds))
+            if caller != callee: called[callee] = True
+        own = other = 0.
+        stacks = {}
+        def walk(i, path, seconds):
+            frames = path + [names[i].replace(';', ':')]
+            # scale callee times if `i` had other callers, too
+            scale = seconds / max(totals[i], 1e-12)
+            kids = [(callee, t * scale) for (callee, t) in children.get(i, [])
+                    if callee != i and names[callee].replace(';', ':') not in frames]
+            key = ";".join(frames)
+            stacks[key] = stacks.get(key, 0.) + max(
+                seconds - sum([t for (callee, t) in kids]), 0.)
+            for callee, t in kids:
+                walk(callee, frames, t)
+        for i in range(len(names)):
+            if i in called: continue
+            if names[i] == name: own += totals[i]
+            else:                other += totals[i]
+            walk(i, [name], totals[i])
+        stacks["%s;%s" % (name, BRIDGE_FRAME)] = max(wall - own - other, 0.)
+        self._lock.acquire()
+        try:
+            count, total_wall, total_own, total_other = self.calls.get(name, (0, 0., 0., 0.))
+            self.calls[name] = [count + 1, total_wall + wall,
+                                total_own + own, total_other + other]
+            for key, seconds in stacks.items():
+                self.stacks[key] = self.stacks.get(key, 0.) + seconds
+        finally:
+            self._lock.release()
+
+    def report(self, top=5, out=None):
+        """Print the timings per command (slowest first), each followed by
+        the `top` matlab functions by self time."""
+        if out is None: out = sys.stdout
+        print >> out, "%-24s %6s %11s %11s %11s %11s" % (
+            "command", "calls", "wall ms", "matlab ms", "other ms", "bridge ms")
+        by_wall = [(-calls[1], name) for (name, calls) in self.calls.items()]
+        by_wall.sort()
+        for _, name in by_wall:
+            count, wall, own, other = self.calls[name]
+            print >> out, "%-24s %6d %11.1f %11.1f %11.1f %11.1f" % (
+                name, count, wall * 1e3, own * 1e3, other * 1e3,
+                max(wall - own - other, 0.) * 1e3)
+            selfs = {}
+            for key, seconds in self.stacks.items():
+                frames = key.split(';')
+                if frames[0] != name or frames[-1] == BRIDGE_FRAME: continue
+                selfs[frames[-1]] = selfs.get(frames[-1], 0.) + seconds
+            selfs = [(-seconds, fn) for (fn, seconds) in selfs.items()]
+            selfs.sort()
+            for minus_seconds, fn in selfs[:top]:
+                print >> out, "    %-36s %11.1f" % (fn, -minus_seconds * 1e3)
+
+    def write_collapsed(self, file_or_name):
+        """Write the collapsed stacks (with self times in microseconds), as
+        understood by flame graph tools."""
+        if isinstance(file_or_name, basestring):
+            f = open(file_or_name, 'w')
+        else:
+            f = file_or_name
+        try:
+            keys = self.stacks.keys()
+            keys.sort()
+            for key in keys:
+                micros = int(round(self.stacks[key] * 1e6))
+                if micros: f.write("%s %d\n" % (key, micros))
+        finally:
+            if f is not file_or_name: f.close()
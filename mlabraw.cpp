@@ -38,6 +38,35 @@
   Revision History
   ================
 
+  mlabraw revision 1.2 -- unreleased
+  ----------------------------------------------------------------------------
+  - the blocking engine calls now release the GIL.
+  - python numbers, flat lists/tuples of real numbers and flat typed buffers
+    (e.g. `array.array`) are now converted directly, without the complex
+    temporary array `makeMxFromSeq` needs.
+  - if built against the interleaved complex API (matlab >= R2018a, see
+    setup.py), complex arrays are transferred with a single bulk copy rather
+    than being split into/merged from separate real and imaginary parts.
+    Real arrays are always bulk copied on `get`.
+  - fixed a crash when putting complex 0-d arrays.
+  - char arrays are now converted without loss from/to UTF-16 (ascii strings
+    still become `str`, others `unicode`); multi-row char arrays are returned
+    as lists of rows. Vector cell arrays of strings are converted from/to
+    lists of strings in a single transfer, as are 1D numpy string arrays.
+  - `get` now also converts the other numeric classes and logicals (keeping
+    their type) and scalar structs (to dicts); dicts are `put` as scalar
+    structs. `put` takes an optional `native` flag to store (non-complex)
+    numpy arrays with their own type rather than as double.
+  - large arrays are converted by several threads (with the GIL released,
+    see `set_copy_threads`) and with loops the compiler can vectorize;
+    matrices are transposed to C order directly on `get`. Unsigned, 64 bit
+    integer and bool arrays are now widened to double on `put` (rather
+    than being left as zeros).
+  - `get_many` and `put_many` transfer whole sets of variables (packed into
+    a struct), with a fixed number of engine calls.
+  - `get` takes an optional `shared` flag to return numeric arrays as
+    read-only views of the engine's memory, without copying them.
+
   mlabraw revision 1.1 -- 2009-09-14 Vivek Rathod & Alexander Schmolck
   ----------------------------------------------------------------------------
   - Vivek Rathod implemented n-d array support (this also marks the
@@ -119,6 +148,7 @@
 #include <Python.h> // !!! must come before standard includes
 #include <stdarg.h>
 #include <cstdio>
+#include <cstring>
 #define MLABRAW_VERSION "1.0.1"
 // We're not building a MEX file, we're building a standalone app.
 #undef MATLAB_MEX_FILE
@@ -131,6 +161,9 @@
 #define vsnprintf _vsnprintf
 #endif
 
+#else
+#include <pthread.h>
+#include <unistd.h>
 #endif
 
 #include <numpy/arrayobject.h>
@@ -145,20 +178,63 @@
 #define mwSize int
 #define mwIndex int
 #endif
+// matrix.h defines this if we're built with ``MATLAB_DEFAULT_RELEASE=R2018a``
+// (i.e. ``mex -R2018a``); then complex data is stored interleaved, like in
+// numpy, and ``mxGetPi`` is gone.
+#if defined(MX_HAS_INTERLEAVED_COMPLEX) && MX_HAS_INTERLEAVED_COMPLEX
+#define MLABRAW_INTERLEAVED_COMPLEX 1
+#endif
 
 #include<iostream>
 
+#if defined(__GNUC__) || defined(_MSC_VER)
+#define MLABRAW_RESTRICT __restrict
+#else
+#define MLABRAW_RESTRICT
+#endif
+
 #ifndef max
 #define max(x,y) ((x) > (y) ? (x) : (y))
 #define min(x,y) ((x) < (y) ? (x) : (y))
 #endif
 
+// The engine calls below talk to a separate matlab process and can block for
+// arbitrarily long, so they release the GIL to let other python threads
+// (e.g. prefetching workers) run in the meantime.
 static inline mxArray* _getMatlabVar(PyObject *lHandle, char *lName){
+  mxArray *lArray;
+  Engine *ep = (Engine *)PyCObject_AsVoidPtr(lHandle);
+  Py_BEGIN_ALLOW_THREADS
+#ifdef _V6_5_OR_LATER
+  lArray = engGetVariable(ep, lName);
+#else
+  lArray = engGetArray(ep, lName);
+#endif
+  Py_END_ALLOW_THREADS
+  return lArray;
+}
+
+static inline int _evalMatlabString(PyObject *lHandle, const char *lStr){
+  int lStatus;
+  Engine *ep = (Engine *)PyCObject_AsVoidPtr(lHandle);
+  Py_BEGIN_ALLOW_THREADS
+  lStatus = engEvalString(ep, lStr);
+  Py_END_ALLOW_THREADS
+  return lStatus;
+}
+
+static inline int _putMatlabVar(PyObject *lHandle, char *lName, mxArray *lArray){
+  int lStatus;
+  Engine *ep = (Engine *)PyCObject_AsVoidPtr(lHandle);
+  Py_BEGIN_ALLOW_THREADS
 #ifdef _V6_5_OR_LATER
-  return engGetVariable((Engine *)PyCObject_AsVoidPtr(lHandle), lName);
+  lStatus = engPutVariable(ep, lName, lArray);
 #else
-  return engGetArray((Engine *)PyCObject_AsVoidPtr(lHandle), lName);
+  mxSetName(lArray, lName);
+  lStatus = engPutArray(ep, lArray);
 #endif
+  Py_END_ALLOW_THREADS
+  return lStatus;
 }
 
 static PyObject *mlabraw_error;
@@ -181,32 +257,371 @@ static inline bool my_snprintf(char *dst, size_t size, const char *fmt, ...)
 	return n >- 1 && static_cast<size_t>(n) < size;
 }
 
-// FIXME: add string array support
-static PyStringObject *mx2char(const mxArray *pArray)
+// the native byte order for python's UTF-16 codecs (so that no BOM is involved)
+static int utf16ByteOrder(void)
 {
-  size_t buflen;
-  char *buf;
-  PyStringObject *lRetval;
-  if (mxGetM(pArray) > 1) {
-    PyErr_SetString(mlabraw_error, "Only 1 Dimensional strings are currently supported");
-    return NULL;
+  const unsigned short lProbe = 1;
+  return *(const char *)&lProbe ? -1 : 1;
+}
+
+// Converts `pLen` characters (`pStride` apart) to a str if they're all ascii
+// or to a unicode object otherwise.
+static PyObject *mxChars2py(const mxChar *pChars, mwSize pLen, mwSize pStride)
+{
+  PyObject *lRetval = NULL;
+  mwSize i;
+  for (i = 0; i != pLen && pChars[i*pStride] < 128; i++);
+  if (i == pLen) {
+    lRetval = PyString_FromStringAndSize(NULL, static_cast<Py_ssize_t>(pLen));
+    if (lRetval == NULL) return NULL;
+    char *lDst = PyString_AS_STRING(lRetval);
+    for (i = 0; i != pLen; i++) lDst[i] = static_cast<char>(pChars[i*pStride]);
+  } else {
+    int lByteOrder = utf16ByteOrder();
+    mxChar *lRow = (mxChar *)PyMem_Malloc(pLen * sizeof(mxChar));
+    if (lRow == NULL) return PyErr_NoMemory();
+    for (i = 0; i != pLen; i++) lRow[i] = pChars[i*pStride];
+    lRetval = PyUnicode_DecodeUTF16((const char *)lRow, pLen * sizeof(mxChar),
+                                    "replace", &lByteOrder);
+    PyMem_Free(lRow);
   }
-  buflen = mxGetN(pArray) + 1;
-  buf = (char *)mxCalloc(buflen, sizeof(char));
-  pyassert(buf, "Out of MATLAB(TM) memory");
+  return lRetval;
+}
 
-  if (mxGetString(pArray, buf, buflen)) {
-    PyErr_SetString(mlabraw_error, "Unable to extract MATLAB(TM) string");
-    mxFree(buf);
+// 1-row (or empty) char arrays become strings, others lists of their rows.
+static PyObject *mx2char(const mxArray *pArray)
+{
+  mwSize lRows, lCols;
+  const mxChar *lChars;
+  PyObject *lRetval;
+  if (mxGetNumberOfDimensions(pArray) > 2) {
+    PyErr_SetString(mlabraw_error, "Only 2 Dimensional strings are currently supported");
     return NULL;
   }
+  lRows = mxGetM(pArray);
+  lCols = mxGetN(pArray);
+  lChars = mxGetChars(pArray);
+  if (lRows <= 1) return mxChars2py(lChars, lRows ? lCols : 0, 1);
+  lRetval = PyList_New(static_cast<Py_ssize_t>(lRows));
+  if (lRetval == NULL) return NULL;
+  for (mwSize i = 0; i != lRows; i++) {
+    // column-major, so the characters of a row are `lRows` apart
+    PyObject *lRow = mxChars2py(lChars + i, lCols, lRows);
+    if (lRow == NULL) { Py_DECREF(lRetval); return NULL; }
+    PyList_SET_ITEM(lRetval, i, lRow);
+  }
+  return lRetval;
+}
 
-  lRetval = (PyStringObject *)PyString_FromString(buf);
-  mxFree(buf);
+// Vector cell arrays of (1-row) strings become lists of strings.
+static PyObject *mx2cellstr(const mxArray *pArray)
+{
+  mwSize lSize = mxGetNumberOfElements(pArray);
+  PyObject *lRetval;
+  if (mxGetNumberOfDimensions(pArray) > 2 ||
+      (mxGetM(pArray) > 1 && mxGetN(pArray) > 1)) {
+    PyErr_SetString(PyExc_TypeError, "Only vector cell arrays of strings are supported.");
+    return NULL;
+  }
+  lRetval = PyList_New(static_cast<Py_ssize_t>(lSize));
+  if (lRetval == NULL) return NULL;
+  for (mwIndex i = 0; i != lSize; i++) {
+    const mxArray *lCell = mxGetCell(pArray, i);
+    PyObject *lItem = NULL;
+    if (lCell == NULL || ! mxIsChar(lCell) || mxGetM(lCell) > 1) {
+      PyErr_SetString(PyExc_TypeError, "Only cell arrays of strings are supported.");
+    } else {
+      lItem = mx2char(lCell);
+    }
+    if (lItem == NULL) { Py_DECREF(lRetval); return NULL; }
+    PyList_SET_ITEM(lRetval, i, lItem);
+  }
   return lRetval;
-	error_return: return NULL;
 }
 
+// the numpy type for a (real) numeric or logical matlab class, or -1
+static int mxClass2npy(mxClassID pClass)
+{
+  switch (pClass) {
+  case mxDOUBLE_CLASS:  return NPY_FLOAT64;
+  case mxSINGLE_CLASS:  return NPY_FLOAT32;
+  case mxINT8_CLASS:    return NPY_INT8;
+  case mxUINT8_CLASS:   return NPY_UINT8;
+  case mxINT16_CLASS:   return NPY_INT16;
+  case mxUINT16_CLASS:  return NPY_UINT16;
+  case mxINT32_CLASS:   return NPY_INT32;
+  case mxUINT32_CLASS:  return NPY_UINT32;
+  case mxINT64_CLASS:   return NPY_INT64;
+  case mxUINT64_CLASS:  return NPY_UINT64;
+  case mxLOGICAL_CLASS: return NPY_BOOL;
+  default:              return -1;
+  }
+}
+
+// the matlab class corresponding to a real numpy array's type (if any)
+static mxClassID npy2mxClass(const PyArrayObject *pArray)
+{
+  const int lSize = PyArray_ITEMSIZE(pArray);
+  switch (PyArray_DESCR(pArray)->kind) {
+  case 'b': return mxLOGICAL_CLASS;
+  case 'f':
+    if (lSize == 8) return mxDOUBLE_CLASS;
+    if (lSize == 4) return mxSINGLE_CLASS;
+    break;
+  case 'i':
+    if (lSize == 1) return mxINT8_CLASS;
+    if (lSize == 2) return mxINT16_CLASS;
+    if (lSize == 4) return mxINT32_CLASS;
+    if (lSize == 8) return mxINT64_CLASS;
+    break;
+  case 'u':
+    if (lSize == 1) return mxUINT8_CLASS;
+    if (lSize == 2) return mxUINT16_CLASS;
+    if (lSize == 4) return mxUINT32_CLASS;
+    if (lSize == 8) return mxUINT64_CLASS;
+    break;
+  }
+  return mxUNKNOWN_CLASS;
+}
+
+// Conversion kernels
+// ==================
+//
+// Converting large arrays is dominated by memory bandwidth, which a single
+// core can't saturate, so copies of at least `gCopyThreshold` bytes are split
+// between `gCopyThreads` threads (with the GIL released); see
+// `set_copy_threads`. The per-chunk loops are kept simple enough for the
+// compiler to vectorize them (source and destination never overlap).
+
+#define MLABRAW_MAX_COPY_THREADS 64
+static int gCopyThreads = 0;                // 0: one per CPU
+static npy_intp gCopyThreshold = 1 << 22;   // bytes
+
+#ifdef WIN32
+typedef HANDLE copy_thread_t;
+#else
+typedef pthread_t copy_thread_t;
+#endif
+
+// A copy of `pSize` elements that can be done in independent chunks.
+class CopyTask {
+public:
+  virtual ~CopyTask() {}
+  virtual void run(npy_intp pFrom, npy_intp pTo) = 0;
+};
+
+struct CopyChunk {
+  CopyTask *task;
+  npy_intp from, to;
+};
+
+static int cpuCount(void)
+{
+  static int sCount = 0;
+  if (! sCount) {
+#ifdef WIN32
+    SYSTEM_INFO lInfo;
+    GetSystemInfo(&lInfo);
+    sCount = static_cast<int>(lInfo.dwNumberOfProcessors);
+#else
+    sCount = static_cast<int>(sysconf(_SC_NPROCESSORS_ONLN));
+#endif
+    if (sCount < 1) sCount = 1;
+  }
+  return sCount;
+}
+
+#ifdef WIN32
+static DWORD WINAPI copyThreadMain(LPVOID pChunk)
+#else
+static void *copyThreadMain(void *pChunk)
+#endif
+{
+  CopyChunk *lChunk = static_cast<CopyChunk *>(pChunk);
+  lChunk->task->run(lChunk->from, lChunk->to);
+  return 0;
+}
+
+static bool startCopyThread(copy_thread_t *pThread, CopyChunk *pChunk)
+{
+#ifdef WIN32
+  *pThread = CreateThread(NULL, 0, copyThreadMain, pChunk, 0, NULL);
+  return *pThread != NULL;
+#else
+  return pthread_create(pThread, NULL, copyThreadMain, pChunk) == 0;
+#endif
+}
+
+static void joinCopyThread(copy_thread_t pThread)
+{
+#ifdef WIN32
+  WaitForSingleObject(pThread, INFINITE);
+  CloseHandle(pThread);
+#else
+  pthread_join(pThread, NULL);
+#endif
+}
+
+// Runs `pTask` over `pSize` elements (`pBytes` bytes written in total), in
+// parallel if it's large enough. The GIL is only released if
+// `pAllowThreads` (i.e. if no other python thread can free the data).
+static void runCopy(CopyTask &pTask, npy_intp pSize, npy_intp pBytes,
+                    bool pAllowThreads = true)
+{
+  int lThreads = min(gCopyThreads > 0 ? gCopyThreads : cpuCount(),
+                     MLABRAW_MAX_COPY_THREADS);
+  if (pBytes < gCopyThreshold || lThreads < 2 || pSize < lThreads) {
+    pTask.run(0, pSize);
+    return;
+  }
+  CopyChunk lChunks[MLABRAW_MAX_COPY_THREADS];
+  copy_thread_t lThreadIds[MLABRAW_MAX_COPY_THREADS];
+  bool lStarted[MLABRAW_MAX_COPY_THREADS];
+  PyThreadState *lState = pAllowThreads ? PyEval_SaveThread() : NULL;
+  for (int i = 0; i != lThreads; i++) {
+    lChunks[i].task = &pTask;
+    lChunks[i].from = pSize / lThreads * i;
+    lChunks[i].to = (i == lThreads - 1) ? pSize : pSize / lThreads * (i + 1);
+  }
+  for (int i = 1; i != lThreads; i++) {
+    lStarted[i] = startCopyThread(&lThreadIds[i], &lChunks[i]);
+  }
+  pTask.run(lChunks[0].from, lChunks[0].to);
+  for (int i = 1; i != lThreads; i++) {
+    if (lStarted[i]) joinCopyThread(lThreadIds[i]);
+    else pTask.run(lChunks[i].from, lChunks[i].to); // out of threads
+  }
+  if (lState) PyEval_RestoreThread(lState);
+}
+
+template <class T>
+static inline void copyNumeric2Mx(const T * MLABRAW_RESTRICT p, npy_intp size,
+                                  double * MLABRAW_RESTRICT pRData)
+{
+  for (npy_intp i = 0; i < size; i++) {
+    pRData[i] = p[i];
+  }
+}
+// With interleaved complex data `pIData` is just ``pRData + 1`` and `pStep` 2.
+template <class T>
+static inline void copyCplxNumeric2Mx(const T *p, npy_intp size, double *pRData,
+                                      double *pIData, npy_intp pStep)
+{
+  for (npy_intp i = 0; i < size; i++) {
+    pRData[i * pStep] = p[2 * i];
+    pIData[i * pStep] = p[2 * i + 1];
+  }
+}
+
+template <class T>
+class NumericCopy : public CopyTask {
+  const T *mSrc;
+  double *mDst;
+public:
+  NumericCopy(const T *pSrc, double *pDst) : mSrc(pSrc), mDst(pDst) {}
+  void run(npy_intp pFrom, npy_intp pTo) {
+    copyNumeric2Mx(mSrc + pFrom, pTo - pFrom, mDst + pFrom);
+  }
+};
+
+template <class T>
+class CplxNumericCopy : public CopyTask {
+  const T *mSrc;
+  double *mR, *mI;
+  npy_intp mStep;
+public:
+  CplxNumericCopy(const T *pSrc, double *pR, double *pI, npy_intp pStep)
+    : mSrc(pSrc), mR(pR), mI(pI), mStep(pStep) {}
+  void run(npy_intp pFrom, npy_intp pTo) {
+    copyCplxNumeric2Mx(mSrc + 2 * pFrom, pTo - pFrom,
+                       mR + pFrom * mStep, mI + pFrom * mStep, mStep);
+  }
+};
+
+class BytesCopy : public CopyTask {
+  char *mDst;
+  const char *mSrc;
+public:
+  BytesCopy(void *pDst, const void *pSrc)
+    : mDst(static_cast<char *>(pDst)), mSrc(static_cast<const char *>(pSrc)) {}
+  void run(npy_intp pFrom, npy_intp pTo) {
+    memcpy(mDst + pFrom, mSrc + pFrom, pTo - pFrom);
+  }
+};
+
+#ifndef MLABRAW_INTERLEAVED_COMPLEX
+// Merges matlab's separate real and imaginary parts into numpy's layout.
+class CplxMerge : public CopyTask {
+  const double *mR, *mI;
+  double *mDst;
+public:
+  CplxMerge(const double *pR, const double *pI, double *pDst)
+    : mR(pR), mI(pI), mDst(pDst) {}
+  void run(npy_intp pFrom, npy_intp pTo) {
+    for (npy_intp i = pFrom; i < pTo; i++) {
+      mDst[2 * i] = mR[i];
+      mDst[2 * i + 1] = mI[i];
+    }
+  }
+};
+#endif
+
+// Copies a fortran-ordered `pRows` x `pCols` matrix to C order, in blocks
+// (to make good use of the cache); chunks are ranges of rows.
+template <class T>
+class Transpose : public CopyTask {
+  const T *mSrc;
+  T *mDst;
+  npy_intp mRows, mCols;
+public:
+  Transpose(const void *pSrc, void *pDst, npy_intp pRows, npy_intp pCols)
+    : mSrc(static_cast<const T *>(pSrc)), mDst(static_cast<T *>(pDst)),
+      mRows(pRows), mCols(pCols) {}
+  void run(npy_intp pFrom, npy_intp pTo) {
+    const npy_intp lBlock = 32;
+    for (npy_intp r0 = pFrom; r0 < pTo; r0 += lBlock) {
+      npy_intp r1 = min(r0 + lBlock, pTo);
+      for (npy_intp c0 = 0; c0 < mCols; c0 += lBlock) {
+        npy_intp c1 = min(c0 + lBlock, mCols);
+        for (npy_intp r = r0; r < r1; r++) {
+          for (npy_intp c = c0; c < c1; c++) {
+            mDst[r * mCols + c] = mSrc[c * mRows + r];
+          }
+        }
+      }
+    }
+  }
+};
+
+template <class T>
+static inline void copyToDoubles(const T *pSrc, npy_intp pSize, double *pDst,
+                                 bool pAllowThreads = true)
+{
+  NumericCopy<T> lTask(pSrc, pDst);
+  runCopy(lTask, pSize, pSize * sizeof(double), pAllowThreads);
+}
+
+template <class T>
+static inline void copyCplxToDoubles(const T *pSrc, npy_intp pSize, double *pR,
+                                     double *pI, npy_intp pStep)
+{
+  CplxNumericCopy<T> lTask(pSrc, pR, pI, pStep);
+  runCopy(lTask, pSize, pSize * 2 * sizeof(double));
+}
+
+static void copyBytes(void *pDst, const void *pSrc, npy_intp pBytes,
+                      bool pAllowThreads = true)
+{
+  BytesCopy lTask(pDst, pSrc);
+  runCopy(lTask, pBytes, pBytes, pAllowThreads);
+}
+
+template <class T>
+static inline void transposeToC(const void *pSrc, void *pDst, npy_intp pRows, npy_intp pCols)
+{
+  Transpose<T> lTask(pSrc, pDst, pRows, pCols);
+  runCopy(lTask, pRows, pRows * pCols * sizeof(T));
+}
 
 static PyArrayObject *mx2numeric(const mxArray *pArray)
 {
@@ -214,10 +629,13 @@ static PyArrayObject *mx2numeric(const mxArray *pArray)
   mwSize nd;
   npy_intp  pydims[NPY_MAXDIMS];
   PyArrayObject *lRetval = NULL,*t=NULL;
-  const double *lPR;
-  const double *lPI;
+  int lType = mxIsComplex(pArray) ? PyArray_CDOUBLE : mxClass2npy(mxGetClassID(pArray));
   pyassert(PyArray_API,
            "Unable to perform this function without NumPy installed");
+  if (lType == -1 || (mxIsComplex(pArray) && ! mxIsDouble(pArray))) {
+    PyErr_SetString(PyExc_TypeError, "Unsupported MATLAB(TM) array type");
+    return NULL;
+  }
 
   nd = mxGetNumberOfDimensions(pArray);
   {
@@ -227,10 +645,30 @@ static PyArrayObject *mx2numeric(const mxArray *pArray)
         pydims[i] = static_cast<npy_intp>(dims[i]);
     }
   }
+  // matrices are transposed into a C-ordered array right away, rather than
+  // via a fortran-ordered copy
+  if (nd == 2 && pydims[0] > 1 && pydims[1] > 1
+#ifndef MLABRAW_INTERLEAVED_COMPLEX
+      && ! mxIsComplex(pArray)
+#endif
+      ) {
+    lRetval = (PyArrayObject *)PyArray_SimpleNew(2, pydims, lType);
+    if (lRetval == NULL) return NULL;
+    const void *lSrc = mxGetData(pArray); // interleaved, if complex
+    void *lDst = PyArray_DATA(lRetval);
+    switch (PyArray_ITEMSIZE(lRetval)) {
+    case 1: transposeToC<npy_int8>(lSrc, lDst, pydims[0], pydims[1]); break;
+    case 2: transposeToC<npy_int16>(lSrc, lDst, pydims[0], pydims[1]); break;
+    case 4: transposeToC<npy_int32>(lSrc, lDst, pydims[0], pydims[1]); break;
+    case 8: transposeToC<npy_int64>(lSrc, lDst, pydims[0], pydims[1]); break;
+    case 16: transposeToC<npy_cdouble>(lSrc, lDst, pydims[0], pydims[1]); break;
+    }
+    return lRetval;
+  }
  //this function creates a fortran array
   t = (PyArrayObject *)
     PyArray_New(&PyArray_Type,static_cast<npy_intp>(nd), pydims,
-                mxIsComplex(pArray) ? PyArray_CDOUBLE : PyArray_DOUBLE,
+                lType,
                 NULL, // strides
                 NULL, // data
                 0,    //(ignored itemsize),
@@ -238,23 +676,17 @@ static PyArrayObject *mx2numeric(const mxArray *pArray)
                 NULL); //  obj
   if (t == NULL) return NULL;
   
-  lPR  = mxGetPr(pArray);
   if (mxIsComplex(pArray)) {
-    double *lDst = (double *)PyArray_DATA(t);
-    // AWMS unsigned int almost certainly can overflow on some platforms!
-    npy_intp numberOfElements = PyArray_SIZE(t);
-    lPI = mxGetPi(pArray);
-    for (mwIndex i = 0; i != numberOfElements; i++) {
-      *lDst++ = *lPR++;
-      *lDst++ = *lPI++;
-    }
+#ifdef MLABRAW_INTERLEAVED_COMPLEX
+    // same layout as numpy's complex128
+    copyBytes(PyArray_DATA(t), mxGetComplexDoubles(pArray), PyArray_NBYTES(t));
+#else
+    CplxMerge lTask(mxGetPr(pArray), mxGetPi(pArray), (double *)PyArray_DATA(t));
+    runCopy(lTask, PyArray_SIZE(t), PyArray_NBYTES(t));
+#endif
   }
   else {
-    double *lDst = (double *)PyArray_DATA(t);
-    npy_intp numberOfElements = PyArray_SIZE(t);
-    for (mwIndex i = 0; i != numberOfElements; i++) {
-      *lDst++ = *lPR++;
-    }
+    copyBytes(PyArray_DATA(t), mxGetData(pArray), PyArray_NBYTES(t));
   }
   
   lRetval = (PyArrayObject *)PyArray_FromArray(t,NULL,NPY_C_CONTIGUOUS|NPY_ALIGNED|NPY_WRITEABLE);
@@ -265,49 +697,144 @@ static PyArrayObject *mx2numeric(const mxArray *pArray)
   return NULL;
 }
 
-//FIXME check complex case
-template <class T>
-static inline void copyNumericVector2Mx(T *pSrc, npy_intp pRows, double *pDst, npy_intp *pStrides)
+// Shared (zero-copy) `get`
+// ========================
+//
+// With ``get(..., shared=True)`` numeric arrays aren't copied at all: they
+// are returned as read-only, fortran-ordered views of the data of the mxArray
+// that `engGetVariable` returned. An `MxOwner` (the views' base object) keeps
+// that mxArray alive and destroys it once the last view has been collected.
+
+typedef struct {
+  PyObject_HEAD
+  mxArray *array;
+} MxOwner;
+
+static void MxOwner_dealloc(MxOwner *self)
 {
-  // this is a horrible HACK for 0-D arrays (which have no strides);
-  // it should also work for shape (1,) 1D arrays.
-  // XXX: check that 1Ds are always OK!
-  if (pRows == 1){
-    *pDst = *pSrc;
-  }
-  else {
-    npy_intp lRowDelta = pStrides[0]/sizeof(T);
-    for (npy_intp lRow=0; lRow != pRows; lRow++, pSrc += lRowDelta) {
-      *pDst++ = *pSrc;
-    }
+  if (self->array != NULL) mxDestroyArray(self->array);
+  PyObject_Del(self);
+}
+
+static PyTypeObject MxOwnerType = {
+  PyObject_HEAD_INIT(NULL)
+}; // the remaining slots are filled in by `initmlabraw`
+
+// takes over `pArray` (and destroys it if this fails)
+static PyObject *newMxOwner(mxArray *pArray)
+{
+  MxOwner *lOwner = PyObject_New(MxOwner, &MxOwnerType);
+  if (lOwner == NULL) {
+    mxDestroyArray(pArray);
+    return NULL;
   }
+  lOwner->array = pArray;
+  return (PyObject *)lOwner;
 }
 
-template <class T>
-static inline void copyNumeric2Mx(T *p,int size,double * pRData)
+static bool canShare(const mxArray *pArray)
 {
-  while(size --){
-    *pRData++ = *p++;
+  if (mxIsSparse(pArray) || mxGetNumberOfElements(pArray) == 0) return false;
+  if (mxIsComplex(pArray)) {
+#ifdef MLABRAW_INTERLEAVED_COMPLEX
+    return mxIsDouble(pArray);
+#else
+    return false; // real and imaginary parts have to be merged
+#endif
   }
+  return mxClass2npy(mxGetClassID(pArray)) != -1;
 }
-template <class T>
-static inline void copyCplxNumericVector2Mx(T *pSrc, npy_intp pRows, double *pRData,
-                              double *pIData, npy_intp *pStrides)
+
+// a read-only view of the data of `pArray`, which `pOwner` owns (directly or
+// as part of a struct)
+static PyObject *mx2shared(const mxArray *pArray, PyObject *pOwner)
 {
-  npy_intp lRowDelta = pStrides[0]/sizeof(T);
-  for (npy_intp lRow=0; lRow != pRows; lRow++, pSrc += lRowDelta) {
-    *pRData++ = pSrc[0];
-    *pIData++ = pSrc[1];
+  npy_intp lDims[NPY_MAXDIMS];
+  const mwSize *lMxDims = mxGetDimensions(pArray);
+  const mwSize lNd = mxGetNumberOfDimensions(pArray);
+  const int lType = mxIsComplex(pArray) ? PyArray_CDOUBLE : mxClass2npy(mxGetClassID(pArray));
+  PyObject *lRetval;
+  for (mwSize i=0; i != lNd; i++) lDims[i] = static_cast<npy_intp>(lMxDims[i]);
+  lRetval = PyArray_New(&PyArray_Type, static_cast<int>(lNd), lDims, lType,
+                        NULL, // strides
+                        mxGetData(pArray),
+                        0,    //(ignored itemsize)
+                        NPY_F_CONTIGUOUS | NPY_ALIGNED, // but not writeable
+                        NULL);
+  if (lRetval == NULL) return NULL;
+  Py_INCREF(pOwner);
+#if NPY_API_VERSION >= 0x00000007
+  if (PyArray_SetBaseObject((PyArrayObject *)lRetval, pOwner) != 0) { // steals pOwner
+    Py_DECREF(lRetval);
+    return NULL;
   }
+#else
+  PyArray_BASE(lRetval) = pOwner;
+#endif
+  return lRetval;
 }
 
-template <class T>
-static inline void copyCplxNumeric2Mx(T *p,int size,double *pRData,double *pIData)
+// `pOwner` is the `MxOwner` of `pArray` for a shared `get`, else NULL
+static PyObject *mx2py(const mxArray *pArray, PyObject *pOwner = NULL);
+
+// Scalar structs become dicts.
+static PyObject *mx2struct(const mxArray *pArray, PyObject *pOwner)
 {
-    while(size--){
-      *pRData++ = *p++;
-      *pIData++ = *p++;
+  PyObject *lRetval;
+  if (mxGetNumberOfElements(pArray) != 1) {
+    PyErr_SetString(PyExc_TypeError, "Only scalar structs are supported.");
+    return NULL;
+  }
+  lRetval = PyDict_New();
+  if (lRetval == NULL) return NULL;
+  for (int i = 0; i != mxGetNumberOfFields(pArray); i++) {
+    const mxArray *lField = mxGetFieldByNumber(pArray, 0, i);
+    PyObject *lValue;
+    if (lField == NULL) { // an unset field, i.e. []
+      npy_intp lDims[2] = {0, 0};
+      lValue = PyArray_SimpleNew(2, lDims, PyArray_DOUBLE);
+    } else {
+      lValue = mx2py(lField, pOwner);
     }
+    if (lValue == NULL ||
+        PyDict_SetItemString(lRetval, mxGetFieldNameByNumber(pArray, i), lValue) != 0) {
+      Py_XDECREF(lValue);
+      Py_DECREF(lRetval);
+      return NULL;
+    }
+    Py_DECREF(lValue);
+  }
+  return lRetval;
+}
+
+static PyObject *mx2py(const mxArray *pArray, PyObject *pOwner)
+{
+  if (mxIsChar(pArray)) {
+    return mx2char(pArray);
+  } else if ((mxIsNumeric(pArray) || mxIsLogical(pArray)) && ! mxIsSparse(pArray)) {
+    if (pOwner != NULL && canShare(pArray)) return mx2shared(pArray, pOwner);
+    return (PyObject *)mx2numeric(pArray);
+  } else if (mxIsCell(pArray)) {
+    return mx2cellstr(pArray);
+  } else if (mxIsStruct(pArray)) {
+    return mx2struct(pArray, pOwner);
+  }
+  PyErr_SetString(PyExc_TypeError, "Only strings, cell arrays of strings, scalar structs and non-sparse numeric arrays are supported.");
+  return NULL;
+}
+
+// A new reference to `pSrc` in native byte order, aligned and in fortran
+// order (`pSrc` itself if it already is all that). NPY_NOTSWAPPED is only
+// honoured when a descr is given, so pass a native-order copy of pSrc's.
+static PyArrayObject *toNativeFortran(const PyArrayObject *pSrc)
+{
+  PyArray_Descr *lDescr =
+    PyArray_DescrNewByteorder(PyArray_DESCR(const_cast<PyArrayObject *>(pSrc)),
+                              NPY_NATIVE);
+  if (lDescr == NULL) return NULL;
+  // steals lDescr
+  return (PyArrayObject *)PyArray_FromArray(const_cast<PyArrayObject *>(pSrc), lDescr,
+                                            NPY_ALIGNED|NPY_F_CONTIGUOUS|NPY_NOTSWAPPED);
 }
 
 static mxArray *makeMxFromNumeric(const PyArrayObject *pSrc)
@@ -320,7 +847,7 @@ static mxArray *makeMxFromNumeric(const PyArrayObject *pSrc)
   mxArray *lRetval = NULL;
   mwSize dims[NPY_MAXDIMS];
   mwSize nDims = pSrc->nd;
-  const PyArrayObject *ap=NULL;
+  PyArrayObject *ap=NULL;
 
   switch (pSrc->nd) {
   case 0:                       // XXX the evil 0D
@@ -351,118 +878,189 @@ static mxArray *makeMxFromNumeric(const PyArrayObject *pSrc)
     lIsComplex = false;
   }
 
-  // converts to fortran order if not already
-  if(!PyArray_ISFORTRAN(pSrc)){ 
-    ap = (PyArrayObject * const)PyArray_FromArray((PyArrayObject*)pSrc,NULL,NPY_ALIGNED|NPY_F_CONTIGUOUS);
-  }
-  else{
-    ap = pSrc;
-  }
+  // converts to (native, aligned) fortran order if not already; 1D arrays
+  // become contiguous
+  ap = toNativeFortran(pSrc);
+  if (ap == NULL) return NULL;
 
   if(lIsNotAMatrix)
     lRetval = mxCreateDoubleMatrix(lRows, lCols, lIsComplex ? mxCOMPLEX : mxREAL);
   else
     lRetval = mxCreateNumericArray(nDims,dims,mxDOUBLE_CLASS,lIsComplex ? mxCOMPLEX : mxREAL);
 
-  if (lRetval == NULL) return NULL;
+  if (lRetval == NULL) {
+    Py_DECREF(ap);
+    return NULL;
+  }
+#ifdef MLABRAW_INTERLEAVED_COMPLEX
+  if (lIsComplex) {
+    lR = (double *)mxGetComplexDoubles(lRetval);
+    lI = lR + 1;
+  } else {
+    lR = mxGetPr(lRetval);
+  }
+  const npy_intp lStep = lIsComplex ? 2 : 1;
+#else
   lR = mxGetPr(lRetval);
   lI = mxGetPi(lRetval);
-  if (lIsNotAMatrix) {
-    void *p = PyArray_DATA(ap);
-    switch (ap->descr->type_num) {
-    case PyArray_CHAR:
-      copyNumericVector2Mx((char *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_UBYTE:
-      copyNumericVector2Mx((unsigned char *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_SBYTE:
-      copyNumericVector2Mx((signed char *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_SHORT:
-      copyNumericVector2Mx((short *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_INT:
-      copyNumericVector2Mx((int *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_LONG:
-      copyNumericVector2Mx((long *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_FLOAT:
-      copyNumericVector2Mx((float *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_DOUBLE:
-      copyNumericVector2Mx((double *)(p), lRows, lR, pSrc->strides);
-      break;
-
-    case PyArray_CFLOAT:
-      copyCplxNumericVector2Mx((float *)(p), lRows, lR, lI, pSrc->strides);
-      break;
-
-    case PyArray_CDOUBLE:
-      copyCplxNumericVector2Mx((double *)(p), lRows, lR, lI, pSrc->strides);
-      break;
-    }
-  } else {
-    void *p = PyArray_DATA(ap);
-    npy_intp size = PyArray_SIZE(pSrc);
+  const npy_intp lStep = 1;
+#endif
+  void *p = PyArray_DATA(ap);
+  npy_intp size = PyArray_SIZE(ap);
 
-    switch (pSrc->descr->type_num) {
-    case PyArray_CHAR:
-      copyNumeric2Mx((char *)p,size,lR);
-      break;
+  switch (ap->descr->type_num) {
+  case PyArray_BOOL:
+    copyToDoubles((npy_bool *)p, size, lR);
+    break;
 
-    case PyArray_UBYTE:
-      copyNumeric2Mx((unsigned char *)p,size,lR);
-      break;
+  case PyArray_CHAR:
+    copyToDoubles((char *)p, size, lR);
+    break;
 
-    case PyArray_SBYTE:
-      copyNumeric2Mx((signed char *)p,size,lR);
-      break;
+  case PyArray_UBYTE:
+    copyToDoubles((unsigned char *)p, size, lR);
+    break;
 
-    case PyArray_SHORT:
-      copyNumeric2Mx((short *)p,size,lR);
-      break;
+  case PyArray_SBYTE:
+    copyToDoubles((signed char *)p, size, lR);
+    break;
 
-    case PyArray_INT:
-      copyNumeric2Mx((int *)p,size,lR);
-      break;
+  case PyArray_SHORT:
+    copyToDoubles((short *)p, size, lR);
+    break;
 
-    case PyArray_LONG:
-      copyNumeric2Mx((long *)p,size,lR);
-      break;
+  case PyArray_USHORT:
+    copyToDoubles((unsigned short *)p, size, lR);
+    break;
 
-    case PyArray_FLOAT:
-      copyNumeric2Mx((float *)p,size,lR);
-      break;
+  case PyArray_INT:
+    copyToDoubles((int *)p, size, lR);
+    break;
 
-    case PyArray_DOUBLE:
-      copyNumeric2Mx((double *)p,size,lR);
-      break;
+  case PyArray_UINT:
+    copyToDoubles((unsigned int *)p, size, lR);
+    break;
 
-    case PyArray_CFLOAT:
-      copyCplxNumeric2Mx((float *)p,size,lR,lI);
-      break;
+  case PyArray_LONG:
+    copyToDoubles((long *)p, size, lR);
+    break;
 
-    case PyArray_CDOUBLE:
-      copyCplxNumeric2Mx((double *)p,size,lR,lI);
-      break;
-    }
+  case PyArray_ULONG:
+    copyToDoubles((unsigned long *)p, size, lR);
+    break;
+
+  case PyArray_LONGLONG:
+    copyToDoubles((npy_longlong *)p, size, lR);
+    break;
+
+  case PyArray_ULONGLONG:
+    copyToDoubles((npy_ulonglong *)p, size, lR);
+    break;
+
+  case PyArray_FLOAT:
+    copyToDoubles((float *)p, size, lR);
+    break;
+
+  case PyArray_DOUBLE:
+    copyBytes(lR, p, size * sizeof(double));
+    break;
+
+  case PyArray_CFLOAT:
+    copyCplxToDoubles((float *)p, size, lR, lI, lStep);
+    break;
+
+  case PyArray_CDOUBLE:
+#ifdef MLABRAW_INTERLEAVED_COMPLEX
+    // `ap` is fortran-contiguous, so this is a plain bulk copy
+    copyBytes(lR, p, size * 2 * sizeof(double));
+#else
+    copyCplxToDoubles((double *)p, size, lR, lI, lStep);
+#endif
+    break;
+
+  default:
+    PyErr_SetString(PyExc_TypeError, "Unsupported numeric array type");
+    mxDestroyArray(lRetval);
+    lRetval = NULL;
   }
   
-  if(ap != pSrc){
-    Py_DECREF(const_cast<PyArrayObject *>(ap));
+  Py_DECREF(ap);
+  return lRetval;
+}
+
+// Stores a real numpy array with its own type (e.g. int32 stays int32, bool
+// becomes logical), with a single bulk copy. Returns NULL *without* an exception
+// set if there's no corresponding matlab class.
+static mxArray *makeMxFromNumericNative(const PyArrayObject *pSrc)
+{
+  mxClassID lClass = npy2mxClass(pSrc);
+  mwSize lDims[NPY_MAXDIMS];
+  mwSize lNDims = PyArray_NDIM(pSrc);
+  mxArray *lRetval;
+  PyArrayObject *ap;
+  if (lClass == mxUNKNOWN_CLASS) return NULL;
+  switch (lNDims) {
+  case 0:
+    lDims[0] = lDims[1] = 1;
+    lNDims = 2;
+    break;
+  case 1: // column vectors, as usual
+    lDims[0] = PyArray_DIM(pSrc, 0);
+    lDims[1] = min(1, lDims[0]);
+    lNDims = 2;
+    break;
+  default:
+    for (mwSize i = 0; i != lNDims; i++) lDims[i] = PyArray_DIM(pSrc, i);
   }
+  ap = toNativeFortran(pSrc);
+  if (ap == NULL) return NULL;
+  if (lClass == mxLOGICAL_CLASS)
+    lRetval = mxCreateLogicalArray(lNDims, lDims);
+  else
+    lRetval = mxCreateNumericArray(lNDims, lDims, lClass, mxREAL);
+  if (lRetval != NULL) {
+    copyBytes(mxGetData(lRetval), PyArray_DATA(ap), PyArray_NBYTES(ap));
+  } else {
+    PyErr_SetString(mlabraw_error, "Unable to create MATLAB(TM) array");
+  }
+  Py_DECREF(ap);
   return lRetval;
 }
 
+static mxArray *py2mx(PyObject *pSrc, bool pNative);
+
+// Dicts become scalar structs.
+static mxArray *makeMxFromDict(PyObject *pSrc, bool pNative)
+{
+  PyObject *lKey, *lValue;
+  Py_ssize_t lPos = 0;
+  mxArray *lRetval = mxCreateStructMatrix(1, 1, 0, NULL);
+  if (lRetval == NULL) {
+    PyErr_SetString(mlabraw_error, "Unable to create MATLAB(TM) struct");
+    return NULL;
+  }
+  while (PyDict_Next(pSrc, &lPos, &lKey, &lValue)) {
+    int lField;
+    mxArray *lItem;
+    if (! PyString_Check(lKey)) {
+      PyErr_SetString(PyExc_TypeError, "Struct field names must be strings");
+      goto error_return;
+    }
+    lField = mxAddField(lRetval, PyString_AS_STRING(lKey));
+    if (lField < 0) {
+      PyErr_Format(mlabraw_error, "Illegal struct field name: '%s'", PyString_AS_STRING(lKey));
+      goto error_return;
+    }
+    lItem = py2mx(lValue, pNative);
+    if (lItem == NULL) goto error_return;
+    mxSetFieldByNumber(lRetval, 0, lField, lItem);
+  }
+  return lRetval;
+ error_return:
+  mxDestroyArray(lRetval);
+  return NULL;
+}
+
 //AWMS: FIXME think about non-numeric sequences and whether we should return a cell array instead
 static mxArray *makeMxFromSeq(const PyObject *pSrc)
 {
@@ -495,6 +1093,167 @@ static mxArray *makeMxFromSeq(const PyObject *pSrc)
   return lRetval;
 }
 
+// Fast path for python numbers: no intermediate arrays at all.
+static mxArray *makeMxFromScalar(PyObject *pSrc)
+{
+  mxArray *lRetval = NULL;
+  if (PyComplex_Check(pSrc)) {
+    Py_complex lVal = PyComplex_AsCComplex(pSrc);
+    lRetval = mxCreateDoubleMatrix(1, 1, lVal.imag != 0.0 ? mxCOMPLEX : mxREAL);
+    pyassert(lRetval, "Out of MATLAB(TM) memory");
+    if (lVal.imag == 0.0) {
+      *mxGetPr(lRetval) = lVal.real;
+    } else {
+#ifdef MLABRAW_INTERLEAVED_COMPLEX
+      mxGetComplexDoubles(lRetval)->real = lVal.real;
+      mxGetComplexDoubles(lRetval)->imag = lVal.imag;
+#else
+      *mxGetPr(lRetval) = lVal.real;
+      *mxGetPi(lRetval) = lVal.imag;
+#endif
+    }
+    return lRetval;
+  }
+  {
+    double lVal = PyFloat_AsDouble(pSrc); // also handles ints and longs
+    if (lVal == -1.0 && PyErr_Occurred()) return NULL;
+#ifdef _V6_5_OR_LATER
+    lRetval = mxCreateDoubleScalar(lVal);
+    pyassert(lRetval, "Out of MATLAB(TM) memory");
+#else
+    lRetval = mxCreateDoubleMatrix(1, 1, mxREAL);
+    pyassert(lRetval, "Out of MATLAB(TM) memory");
+    *mxGetPr(lRetval) = lVal;
+#endif
+  }
+  return lRetval;
+ error_return:
+  return NULL;
+}
+
+// Fast path for flat lists and tuples of real python numbers; converts in a
+// single pass straight into the matlab array. Returns NULL *without* an
+// exception set if `pSrc` doesn't qualify, in which case the caller should
+// fall back on `makeMxFromSeq`.
+static mxArray *makeMxFromRealSeq(PyObject *pSrc)
+{
+  Py_ssize_t lSize;
+  PyObject **lItems;
+  mxArray *lRetval;
+  double *lDst;
+  if (! (PyList_Check(pSrc) || PyTuple_Check(pSrc))) return NULL;
+  lSize = PySequence_Fast_GET_SIZE(pSrc);
+  if (lSize == 0) return NULL; // keep the existing empty array semantics
+  lItems = PySequence_Fast_ITEMS(pSrc);
+  // like 1D arrays, flat sequences become column vectors
+  lRetval = mxCreateDoubleMatrix(static_cast<mwSize>(lSize), 1, mxREAL);
+  if (lRetval == NULL) return NULL;
+  lDst = mxGetPr(lRetval);
+  for (Py_ssize_t i = 0; i != lSize; i++) {
+    PyObject *lItem = lItems[i];
+    if (PyFloat_Check(lItem)) {
+      lDst[i] = PyFloat_AS_DOUBLE(lItem);
+    } else if (PyInt_Check(lItem)) {
+      lDst[i] = static_cast<double>(PyInt_AS_LONG(lItem));
+    } else if (PyLong_Check(lItem)) {
+      lDst[i] = PyLong_AsDouble(lItem);
+      if (lDst[i] == -1.0 && PyErr_Occurred()) {
+        PyErr_Clear();
+        mxDestroyArray(lRetval);
+        return NULL;
+      }
+    } else { // nested or non-real sequence
+      mxDestroyArray(lRetval);
+      return NULL;
+    }
+  }
+  return lRetval;
+}
+
+// `pAllowThreads`: whether the data stays put even if other python threads run
+static mxArray *makeMxFromRawData(const void *pData, char pFormat, npy_intp pSize,
+                                  bool pAllowThreads)
+{
+  mxArray *lRetval = mxCreateDoubleMatrix(static_cast<mwSize>(pSize),
+                                          min(1, pSize), mxREAL);
+  double *lR;
+  if (lRetval == NULL) return NULL;
+  lR = mxGetPr(lRetval);
+  switch (pFormat) {
+  case 'd': copyBytes(lR, pData, pSize * sizeof(double), pAllowThreads); break;
+  case 'f': copyToDoubles((const float *)pData, pSize, lR, pAllowThreads); break;
+  case 'b': copyToDoubles((const signed char *)pData, pSize, lR, pAllowThreads); break;
+  case 'B': copyToDoubles((const unsigned char *)pData, pSize, lR, pAllowThreads); break;
+  case 'h': copyToDoubles((const short *)pData, pSize, lR, pAllowThreads); break;
+  case 'H': copyToDoubles((const unsigned short *)pData, pSize, lR, pAllowThreads); break;
+  case 'i': copyToDoubles((const int *)pData, pSize, lR, pAllowThreads); break;
+  case 'I': copyToDoubles((const unsigned int *)pData, pSize, lR, pAllowThreads); break;
+  case 'l': copyToDoubles((const long *)pData, pSize, lR, pAllowThreads); break;
+  case 'L': copyToDoubles((const unsigned long *)pData, pSize, lR, pAllowThreads); break;
+  default:
+    mxDestroyArray(lRetval);
+    return NULL;
+  }
+  return lRetval;
+}
+
+static size_t formatItemSize(char pFormat)
+{
+  switch (pFormat) {
+  case 'd': return sizeof(double);
+  case 'f': return sizeof(float);
+  case 'b': case 'B': return sizeof(char);
+  case 'h': case 'H': return sizeof(short);
+  case 'i': case 'I': return sizeof(int);
+  case 'l': case 'L': return sizeof(long);
+  default: return 0;
+  }
+}
+
+// Fast path for flat typed buffers (`array.array` and objects supporting the
+// new-style buffer protocol) of native real numbers: a single copy (and cast)
+// into the matlab array. Returns NULL *without* an exception set if `pSrc`
+// doesn't qualify.
+static mxArray *makeMxFromBuffer(PyObject *pSrc)
+{
+  mxArray *lRetval = NULL;
+#if PY_VERSION_HEX >= 0x02060000
+  if (PyObject_CheckBuffer(pSrc)) {
+    Py_buffer lView;
+    if (PyObject_GetBuffer(pSrc, &lView, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) != 0) {
+      PyErr_Clear();
+      return NULL;
+    }
+    const char *lFormat = lView.format ? lView.format : "B";
+    if (*lFormat == '@' || *lFormat == '=') lFormat++;
+    if (lView.ndim <= 1 && lFormat[0] && ! lFormat[1] &&
+        formatItemSize(lFormat[0]) == static_cast<size_t>(lView.itemsize)) {
+      // the view keeps the buffer from being resized
+      lRetval = makeMxFromRawData(lView.buf, lFormat[0], lView.len / lView.itemsize, true);
+    }
+    PyBuffer_Release(&lView);
+    return lRetval;
+  }
+#endif
+  // `array.array` only supports the old-style buffer interface
+  if (PyObject_CheckReadBuffer(pSrc) && PyObject_HasAttrString(pSrc, "typecode")) {
+    const void *lData;
+    Py_ssize_t lLen;
+    char lFormat;
+    size_t lItemSize;
+    PyObject *lTypecode = PyObject_GetAttrString(pSrc, "typecode");
+    if (lTypecode == NULL) { PyErr_Clear(); return NULL; }
+    lFormat = (PyString_Check(lTypecode) && PyString_GET_SIZE(lTypecode) == 1) ?
+      PyString_AS_STRING(lTypecode)[0] : 0;
+    Py_DECREF(lTypecode);
+    lItemSize = formatItemSize(lFormat);
+    if (! lItemSize) return NULL;
+    if (PyObject_AsReadBuffer(pSrc, &lData, &lLen) != 0) { PyErr_Clear(); return NULL; }
+    lRetval = makeMxFromRawData(lData, lFormat, lLen / lItemSize, false);
+  }
+  return lRetval;
+}
+
 static mxArray *numeric2mx(PyObject *pSrc)
 {
   mxArray *lDst = NULL;
@@ -502,22 +1261,18 @@ static mxArray *numeric2mx(PyObject *pSrc)
   pyassert(PyArray_API, "Unable to perform this function without NumPy installed");
   if (PyArray_Check(pSrc)) {
     lDst = makeMxFromNumeric((const PyArrayObject *)pSrc);
+  } else if (PyInt_Check(pSrc) || PyLong_Check(pSrc) ||
+             PyFloat_Check(pSrc) || PyComplex_Check(pSrc)) {
+    lDst = makeMxFromScalar(pSrc);
   } else if (PySequence_Check(pSrc)) {
-    lDst = makeMxFromSeq(pSrc);
+    lDst = makeMxFromRealSeq(pSrc);
+    if (lDst == NULL && ! PyErr_Occurred()) lDst = makeMxFromBuffer(pSrc);
+    if (lDst == NULL && ! PyErr_Occurred()) lDst = makeMxFromSeq(pSrc);
   } else if (PyObject_HasAttrString(pSrc, "__array__")) {
     PyObject *arp;
     arp = PyObject_CallMethod(pSrc, "__array__", NULL);
     lDst = makeMxFromNumeric((const PyArrayObject *)arp);
     Py_DECREF(arp);             // FIXME check this is correct;
-  }
-    else if (PyInt_Check(pSrc) || PyLong_Check(pSrc) ||
-             PyFloat_Check(pSrc) || PyComplex_Check(pSrc)){
-    PyObject *t;
-    t = Py_BuildValue("(O)", pSrc);
-//     t = PyTuple_New(1);
-//     PyTuple_SetItem(t, 0, pSrc);
-    lDst = makeMxFromSeq(t);
-    Py_DECREF(t); // FIXME check this
   } else {
 
   }
@@ -531,7 +1286,19 @@ static mxArray *char2mx(const PyObject *pSrc)
 {
   mxArray *lDst = NULL;
 
-  lDst = mxCreateString(PyString_AsString(const_cast<PyObject *>(pSrc)));
+  if (PyUnicode_Check(pSrc)) {
+    PyObject *lEncoded =
+      PyUnicode_EncodeUTF16(PyUnicode_AS_UNICODE(pSrc), PyUnicode_GET_SIZE(pSrc),
+                            "strict", utf16ByteOrder());
+    if (lEncoded == NULL) return NULL;
+    mwSize lDims[2] = {1, PyString_GET_SIZE(lEncoded) / sizeof(mxChar)};
+    lDst = mxCreateCharArray(2, lDims);
+    if (lDst != NULL)
+      memcpy(mxGetChars(lDst), PyString_AS_STRING(lEncoded), PyString_GET_SIZE(lEncoded));
+    Py_DECREF(lEncoded);
+  } else {
+    lDst = mxCreateString(PyString_AsString(const_cast<PyObject *>(pSrc)));
+  }
   if (lDst == NULL) {
     PyErr_SetString(mlabraw_error, "Unable to create MATLAB(TM) string");
     return NULL;
@@ -540,6 +1307,61 @@ static mxArray *char2mx(const PyObject *pSrc)
   return lDst;
 }
 
+static bool isStringSeq(PyObject *pSrc)
+{
+  if (! (PyList_Check(pSrc) || PyTuple_Check(pSrc)) || ! PySequence_Fast_GET_SIZE(pSrc))
+    return false;
+  for (Py_ssize_t i = 0; i != PySequence_Fast_GET_SIZE(pSrc); i++) {
+    PyObject *lItem = PySequence_Fast_GET_ITEM(pSrc, i);
+    if (! (PyString_Check(lItem) || PyUnicode_Check(lItem))) return false;
+  }
+  return true;
+}
+
+// Lists and tuples of strings become 1xN cell arrays.
+static mxArray *cellstr2mx(PyObject *pSrc)
+{
+  Py_ssize_t lSize = PySequence_Fast_GET_SIZE(pSrc);
+  mxArray *lRetval = mxCreateCellMatrix(1, static_cast<mwSize>(lSize));
+  if (lRetval == NULL) {
+    PyErr_SetString(mlabraw_error, "Unable to create MATLAB(TM) cell array");
+    return NULL;
+  }
+  for (Py_ssize_t i = 0; i != lSize; i++) {
+    mxArray *lItem = char2mx(PySequence_Fast_GET_ITEM(pSrc, i));
+    if (lItem == NULL) { mxDestroyArray(lRetval); return NULL; }
+    mxSetCell(lRetval, static_cast<mwIndex>(i), lItem);
+  }
+  return lRetval;
+}
+
+static mxArray *py2mx(PyObject *pSrc, bool pNative)
+{
+  if (PyString_Check(pSrc) || PyUnicode_Check(pSrc)) return char2mx(pSrc);
+  if (isStringSeq(pSrc)) return cellstr2mx(pSrc);
+  if (PyDict_Check(pSrc)) return makeMxFromDict(pSrc, pNative);
+  if (pNative && PyArray_API && PyArray_Check(pSrc)) {
+    mxArray *lRetval = makeMxFromNumericNative((const PyArrayObject *)pSrc);
+    if (lRetval != NULL || PyErr_Occurred()) return lRetval;
+  }
+  if (PyArray_API && PyArray_Check(pSrc) &&
+      (PyArray_TYPE(pSrc) == NPY_STRING || PyArray_TYPE(pSrc) == NPY_UNICODE)) {
+    mxArray *lRetval;
+    PyObject *lList;
+    if (PyArray_NDIM(pSrc) > 1) {
+      PyErr_SetString(PyExc_TypeError, "Only 0D and 1D string arrays are supported");
+      return NULL;
+    }
+    if (PyArray_SIZE(pSrc) == 0) return mxCreateCellMatrix(0, 0);
+    lList = PyObject_CallMethod(pSrc, "tolist", NULL);
+    if (lList == NULL) return NULL;
+    lRetval = py2mx(lList, pNative);
+    Py_DECREF(lList);
+    return lRetval;
+  }
+  return numeric2mx(pSrc);
+}
+
 //////////////////////////////////////////////////////////////////////////////
 static char open_doc[] =
 #ifdef WIN32
@@ -620,7 +1442,9 @@ static char eval_doc[] =
 "If there is an error a `mlabraw.error` with the error description is raised.\n"
 ;
 
-PyObject * mlabraw_eval(PyObject *, PyObject *args)
+// Evaluates `lStr` (wrapped in a try/catch); returns the output or NULL with a
+// `mlabraw.error` set.
+static PyObject *evalString(PyObject *lHandle, const char *lStr)
 {
   //XXX how large should this be? used to be 10000, but looks like matlab
   // hangs when it gets bigger than ~9000 I'm not aware of some actual limit
@@ -631,15 +1455,8 @@ PyObject * mlabraw_eval(PyObject *, PyObject *args)
   char* fmt = "try, %s; MLABRAW_ERROR_=0; catch, MLABRAW_ERROR_=1; end;";
   char buffer[BUFSIZE];
   char cmd[BUFSIZE];
-  char *lStr;
   char *retStr = buffer;
   PyObject *ret;
-  PyObject *lHandle;
-  if (! PyArg_ParseTuple(args, "Os:eval", &lHandle, &lStr)) return NULL;
-  if (! PyCObject_Check(lHandle)) {
-    PyErr_SetString(PyExc_TypeError, "Invalid object passed as mlabraw session handle");
-	return NULL;
-  }
 
   bool ok = my_snprintf(cmd, BUFSIZE, fmt, lStr);
   if (not ok) {
@@ -649,7 +1466,7 @@ PyObject * mlabraw_eval(PyObject *, PyObject *args)
   }
   // std::cout << "DEBUG: CMD " << cmd << std::endl << std::flush;
   engOutputBuffer((Engine *)PyCObject_AsVoidPtr(lHandle), retStr, BUFSIZE-1);
-  if (engEvalString((Engine *)PyCObject_AsVoidPtr(lHandle), cmd) != 0) {
+  if (_evalMatlabString(lHandle, cmd) != 0) {
     PyErr_SetString(mlabraw_error,
                    "Unable to evaluate string in MATLAB(TM) workspace");
     return NULL;
@@ -669,8 +1486,8 @@ PyObject * mlabraw_eval(PyObject *, PyObject *args)
     mxDestroyArray(lArray);
     if (__mlabraw_error) {
       engOutputBuffer((Engine *)PyCObject_AsVoidPtr(lHandle), retStr2, BUFSIZE-1);
-      if (engEvalString((Engine *)PyCObject_AsVoidPtr(lHandle),
-                        "disp(subsref(lasterror(),struct('type','.','subs','message')))") != 0) {
+      if (_evalMatlabString(lHandle,
+                            "disp(subsref(lasterror(),struct('type','.','subs','message')))") != 0) {
         PyErr_SetString(mlabraw_error, "THIS SHOULD NOT HAVE HAPPENED!!!");
         return NULL;
       }
@@ -683,6 +1500,18 @@ PyObject * mlabraw_eval(PyObject *, PyObject *args)
   return ret;
 }
 
+PyObject * mlabraw_eval(PyObject *, PyObject *args)
+{
+  char *lStr;
+  PyObject *lHandle;
+  if (! PyArg_ParseTuple(args, "Os:eval", &lHandle, &lStr)) return NULL;
+  if (! PyCObject_Check(lHandle)) {
+    PyErr_SetString(PyExc_TypeError, "Invalid object passed as mlabraw session handle");
+	return NULL;
+  }
+  return evalString(lHandle, lStr);
+}
+
 PyObject * mlabraw_oldeval(PyObject *, PyObject *args)
 {
   //XXX how large should this be?
@@ -699,7 +1528,7 @@ PyObject * mlabraw_oldeval(PyObject *, PyObject *args)
     return NULL;
   }
   engOutputBuffer((Engine *)PyCObject_AsVoidPtr(lHandle), retStr, BUFSIZE-1);
-  if (engEvalString((Engine *)PyCObject_AsVoidPtr(lHandle), lStr) != 0) {
+  if (_evalMatlabString(lHandle, lStr) != 0) {
     PyErr_SetString(mlabraw_error,
                    "Unable to evaluate string in MATLAB(TM) workspace");
     return NULL;
@@ -726,31 +1555,38 @@ PyObject * mlabraw_oldeval(PyObject *, PyObject *args)
 }
 
 static char get_doc[] =
-"get(handle, name) -> array\n"
+"get(handle, name[, shared]) -> array\n"
 "\n"
 "Gets a matrix from the MATLAB(TM) session\n"
 "\n"
 "This function extracts the matrix with the given name from a MATLAB\n"
 "session associated with the handle. The handle is the return value from\n"
 "a previous call to open(). The name parameter must be a string describing\n"
-"the name of a matrix in the MATLAB(TM) workspace. On Win32 platforms,\n"
-"only double-precision floating point arrays (real or complex) are supported.\n"
-"1-D character strings are supported on UNIX platforms.\n"
+"the name of a matrix in the MATLAB(TM) workspace. Non-sparse numeric\n"
+"and logical arrays (complex only for double), char arrays, vector cell\n"
+"arrays of strings and scalar structs are supported.\n"
 "\n"
-"Only 2-dimensional arrays are currently supported. Cell\n"
-"arrays, structure arrays, etc. are not yet supported.\n"
+"For numeric arrays, the return value is a NumPy array with the same shape,\n"
+"type and elements as the MATLAB(TM) array. A single-row char array becomes\n"
+"a str (or a unicode, if it contains non-ascii characters); multi-row char\n"
+"arrays and cell arrays of strings become lists of strings and structs\n"
+"dicts (with their fields converted recursively).\n"
 "\n"
-"The return value is a NumPy array with the same shape and elements as the\n"
-"MATLAB(TM) array.\n"
+"If 'shared' is true, numeric arrays (including struct fields) aren't\n"
+"copied at all, but returned as read-only, fortran-ordered views of the\n"
+"memory MATLAB(TM)'s engine library handed over, which is freed once all\n"
+"of them have been garbage collected. (Empty arrays and, unless built for\n"
+"the interleaved complex API, complex arrays are still copied.)\n"
 ;
 PyObject * mlabraw_get(PyObject *, PyObject *args)
 {
   char *lName;
   PyObject *lHandle;
+  int lShared = 0;
   mxArray *lArray = NULL;
   PyObject *lDest = NULL;
 
-  if (! PyArg_ParseTuple(args, "Os:get", &lHandle, &lName)) return NULL;
+  if (! PyArg_ParseTuple(args, "Os|i:get", &lHandle, &lName, &lShared)) return NULL;
   if (! PyCObject_Check(lHandle)) {
     PyErr_SetString(PyExc_TypeError, "Invalid object passed as mlabraw session handle");
     return NULL;
@@ -763,19 +1599,20 @@ PyObject * mlabraw_get(PyObject *, PyObject *args)
     return NULL;
   }
 
-  if (mxIsChar(lArray)) {
-    lDest = (PyObject *)mx2char(lArray);
-  } else if (mxIsDouble(lArray) and not mxIsSparse(lArray)) {
-    lDest = (PyObject *)mx2numeric(lArray);
-  } else {                      // FIXME structs, cells and non-double arrays
-    PyErr_SetString(PyExc_TypeError, "Only strings and non-sparse numeric arrays are supported.");
+  if (lShared) {
+    PyObject *lOwner = newMxOwner(lArray);
+    if (lOwner == NULL) return NULL;
+    lDest = mx2py(lArray, lOwner);
+    Py_DECREF(lOwner); // the views (if any) keep it alive
+    return lDest;
   }
+  lDest = mx2py(lArray);
   mxDestroyArray(lArray);
   return lDest;
 }
 
 static char put_doc[] =
-"put(handle, name, array).\n"
+"put(handle, name, array[, native]).\n"
 "\n"
 "Places a matrix into the MATLAB(TM) session.\n"
 "This function places the given array into a MATLAB(TM) workspace under the\n"
@@ -788,7 +1625,12 @@ static char put_doc[] =
 "exceptions: the element type will always double or complex and the\n"
 "array-rank will always be 2 (i.e. a matrix).\n"
 "\n"
-"A string parameter is converted to a MATLAB char-valued array.\n"
+"A string (or unicode) parameter is converted to a MATLAB char-valued\n"
+"array, a list or tuple of strings or a 1D NumPy string array to a cell\n"
+"array of strings and a dict to a scalar struct (recursively).\n"
+"\n"
+"If 'native' is true, real NumPy arrays keep their type (e.g. int32 or\n"
+"single; bool arrays become logical) instead of being converted to double.\n"
 ;
 PyObject * mlabraw_put(PyObject *, PyObject *args)
 {
@@ -796,19 +1638,16 @@ PyObject * mlabraw_put(PyObject *, PyObject *args)
   PyObject *lHandle;
   PyObject *lSource;
   mxArray *lArray = NULL;
+  int lNative = 0;
   //FIXME should make these objects const
-  if (! PyArg_ParseTuple(args, "OsO:put", &lHandle, &lName, &lSource)) return NULL;
+  if (! PyArg_ParseTuple(args, "OsO|i:put", &lHandle, &lName, &lSource, &lNative)) return NULL;
   if (! PyCObject_Check(lHandle)) {
     PyErr_SetString(PyExc_TypeError, "Invalid object passed as mlabraw session handle");
     return NULL;
   }
   Py_INCREF(lSource);
 
-  if (PyString_Check(lSource)) {
-    lArray = char2mx(lSource);
-  } else {
-    lArray = numeric2mx(lSource);
-  }
+  lArray = py2mx(lSource, lNative != 0);
   Py_DECREF(lSource);
 
   if (lArray == NULL) {
@@ -816,19 +1655,141 @@ PyObject * mlabraw_put(PyObject *, PyObject *args)
   }
 
 
-// for matlab version >= 6.5 (FIXME UNTESTED)
-#ifdef _V6_5_OR_LATER
-  if (engPutVariable((Engine *)PyCObject_AsVoidPtr(lHandle), lName, lArray) != 0) {
-#else
-  mxSetName(lArray, lName);
-  if (engPutArray((Engine *)PyCObject_AsVoidPtr(lHandle), lArray) != 0) {
-#endif
+  if (_putMatlabVar(lHandle, lName, lArray) != 0) {
+    PyErr_SetString(mlabraw_error,
+                   "Unable to put matrix into MATLAB(TM) workspace");
+    mxDestroyArray(lArray);
+    return NULL;
+  }
+  mxDestroyArray(lArray);
+  Py_INCREF(Py_None);
+  return Py_None;
+}
+
+static char set_copy_threads_doc[] =
+"set_copy_threads(threads[, threshold]) -> (threads, threshold)\n"
+"\n"
+"Sets how many threads convert arrays of at least 'threshold' bytes (by\n"
+"default 4MB) in `put` and `get`, and returns the previous settings. 0\n"
+"threads (the default) means one per CPU, 1 turns threading off.\n"
+;
+PyObject * mlabraw_set_copy_threads(PyObject *, PyObject *args)
+{
+  int lThreads;
+  PY_LONG_LONG lThreshold = gCopyThreshold;
+  PyObject *lOld;
+  if (! PyArg_ParseTuple(args, "i|L:set_copy_threads", &lThreads, &lThreshold)) return NULL;
+  if (lThreads < 0 || lThreshold < 0) {
+    PyErr_SetString(PyExc_ValueError, "threads and threshold must not be negative");
+    return NULL;
+  }
+  lOld = Py_BuildValue("(iL)", gCopyThreads, (PY_LONG_LONG)gCopyThreshold);
+  if (lOld == NULL) return NULL;
+  gCopyThreads = lThreads;
+  gCopyThreshold = static_cast<npy_intp>(lThreshold);
+  return lOld;
+}
+
+// Scratch variable for `get_many` and `put_many` (like MLABRAW_ERROR_).
+#define MLABRAW_MANY "MLABRAW_MANY_"
+
+static char get_many_doc[] =
+"get_many(handle, names) -> dict\n"
+"\n"
+"Gets several variables from the MATLAB(TM) session at once.\n"
+"The variables are packed into a struct in MATLAB(TM) and transferred as a\n"
+"whole, so the number of engine calls doesn't depend on the number of\n"
+"variables. Returns a dict mapping each of the names to its value,\n"
+"converted as by `get` (which also raises the same errors).\n"
+;
+PyObject * mlabraw_get_many(PyObject *, PyObject *args)
+{
+  PyObject *lHandle;
+  PyObject *lNames;
+  PyObject *lOut;
+  mxArray *lArray = NULL;
+  PyObject *lDest = NULL;
+
+  if (! PyArg_ParseTuple(args, "OO:get_many", &lHandle, &lNames)) return NULL;
+  if (! PyCObject_Check(lHandle)) {
+    PyErr_SetString(PyExc_TypeError, "Invalid object passed as mlabraw session handle");
+    return NULL;
+  }
+  if ((PyList_Check(lNames) || PyTuple_Check(lNames)) && ! PySequence_Fast_GET_SIZE(lNames))
+    return PyDict_New();
+  if (! isStringSeq(lNames)) {
+    PyErr_SetString(PyExc_TypeError, "names must be a list or tuple of strings");
+    return NULL;
+  }
+  lArray = cellstr2mx(lNames);
+  if (lArray == NULL) return NULL;
+  if (_putMatlabVar(lHandle, MLABRAW_MANY, lArray) != 0) {
     PyErr_SetString(mlabraw_error,
                    "Unable to put matrix into MATLAB(TM) workspace");
     mxDestroyArray(lArray);
     return NULL;
   }
   mxDestroyArray(lArray);
+  lOut = evalString(lHandle, MLABRAW_MANY " = cell2struct(cellfun(@(n) evalin('base', n), "
+                    MLABRAW_MANY "(:), 'UniformOutput', false), " MLABRAW_MANY "(:), 1)");
+  if (lOut == NULL) {
+    _evalMatlabString(lHandle, "clear " MLABRAW_MANY ";");
+    return NULL;
+  }
+  Py_DECREF(lOut);
+  lArray = _getMatlabVar(lHandle, MLABRAW_MANY);
+  _evalMatlabString(lHandle, "clear " MLABRAW_MANY ";");
+  if (lArray == NULL) {
+    PyErr_SetString(mlabraw_error,
+                   "Unable to get matrix from MATLAB(TM) workspace");
+    return NULL;
+  }
+  lDest = mx2py(lArray);
+  mxDestroyArray(lArray);
+  return lDest;
+}
+
+static char put_many_doc[] =
+"put_many(handle, values[, native])\n"
+"\n"
+"Places several variables into the MATLAB(TM) session at once.\n"
+"'values' is a dict mapping variable names to values, which are converted\n"
+"as by `put` and transferred as a single struct that is unpacked in\n"
+"MATLAB(TM).\n"
+;
+PyObject * mlabraw_put_many(PyObject *, PyObject *args)
+{
+  PyObject *lHandle;
+  PyObject *lValues;
+  PyObject *lOut;
+  mxArray *lArray = NULL;
+  int lNative = 0;
+
+  if (! PyArg_ParseTuple(args, "OO!|i:put_many", &lHandle, &PyDict_Type, &lValues, &lNative))
+    return NULL;
+  if (! PyCObject_Check(lHandle)) {
+    PyErr_SetString(PyExc_TypeError, "Invalid object passed as mlabraw session handle");
+    return NULL;
+  }
+  if (PyDict_Size(lValues)) {
+    lArray = makeMxFromDict(lValues, lNative != 0);
+    if (lArray == NULL) return NULL;
+    if (_putMatlabVar(lHandle, MLABRAW_MANY, lArray) != 0) {
+      PyErr_SetString(mlabraw_error,
+                     "Unable to put matrix into MATLAB(TM) workspace");
+      mxDestroyArray(lArray);
+      return NULL;
+    }
+    mxDestroyArray(lArray);
+    lOut = evalString(lHandle, "for MLABRAW_F_ = fieldnames(" MLABRAW_MANY ")', "
+                      "assignin('base', MLABRAW_F_{1}, " MLABRAW_MANY ".(MLABRAW_F_{1})); end; "
+                      "clear " MLABRAW_MANY " MLABRAW_F_");
+    if (lOut == NULL) {
+      _evalMatlabString(lHandle, "clear " MLABRAW_MANY " MLABRAW_F_;");
+      return NULL;
+    }
+    Py_DECREF(lOut);
+  }
   Py_INCREF(Py_None);
   return Py_None;
 }
@@ -840,6 +1801,9 @@ static PyMethodDef MlabrawMethods[] = {
   { "eval",       mlabraw_eval,       METH_VARARGS, eval_doc },  //FIXME doc
   { "get",        mlabraw_get,        METH_VARARGS, get_doc },
   { "put",        mlabraw_put,        METH_VARARGS, put_doc },
+  { "get_many",   mlabraw_get_many,   METH_VARARGS, get_many_doc },
+  { "put_many",   mlabraw_put_many,   METH_VARARGS, put_many_doc },
+  { "set_copy_threads", mlabraw_set_copy_threads, METH_VARARGS, set_copy_threads_doc },
   { NULL,         NULL,               0           , NULL}, // sentinel
 };
 
@@ -855,6 +1819,9 @@ PyMODINIT_FUNC initmlabraw(void)
 "  eval  - Evaluates a string in the MATLAB(tm) session\n"
 "  get   - Gets a matrix from the MATLAB(tm) session\n"
 "  put   - Places a matrix into the MATLAB(tm) session\n"
+"  get_many - Gets several variables in one transfer\n"
+"  put_many - Places several variables in one transfer\n"
+"  set_copy_threads - Sets how many threads convert large arrays\n"
 "\n"
 
 
@@ -891,7 +1858,19 @@ PyMODINIT_FUNC initmlabraw(void)
 
   /* This macro, defined in arrayobject.h, loads the Numeric API interface */
   import_array();
+  MxOwnerType.ob_type = &PyType_Type;
+  MxOwnerType.tp_name = "mlabraw.MxOwner";
+  MxOwnerType.tp_basicsize = sizeof(MxOwner);
+  MxOwnerType.tp_dealloc = (destructor)MxOwner_dealloc;
+  MxOwnerType.tp_flags = Py_TPFLAGS_DEFAULT;
+  MxOwnerType.tp_doc = "Owns the MATLAB(TM) array shared by the results of get(..., shared=True)";
+  if (PyType_Ready(&MxOwnerType) < 0) return;
   PyModule_AddStringConstant(module, "__version__", MLABRAW_VERSION);
+#ifdef MLABRAW_INTERLEAVED_COMPLEX
+  PyModule_AddIntConstant(module, "interleaved_complex", 1);
+#else
+  PyModule_AddIntConstant(module, "interleaved_complex", 0);
+#endif
   mlabraw_error = PyErr_NewException("mlabraw.error", NULL, NULL);
   Py_INCREF(mlabraw_error);
   PyModule_AddObject(module, "error", mlabraw_error);
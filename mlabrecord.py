@@ -0,0 +1,353 @@
+##############################################################################
+########### mlabrecord: record and replay matlab(tm) engine traffic ##########
+##############################################################################
+##
+## o created: 2026-10-19
+## o keywords: matlab benchmark profiling
+## o license: MIT
+## o XXX:
+##   - only the types, shapes and sizes of transferred values are recorded,
+##     not their contents, so replays put zeros; dicts (structs) are replayed
+##     as a struct with a single field of the same total size
+##   - native puts (see ``mlabraw.put``) are replayed as ordinary ones
+
+"""
+mlabrecord
+==========
+
+Records the exact stream of engine operations (``eval``, ``put``, ``get``,
+``put_many`` and ``get_many``) that an `MlabWrap` issues, together with the types, shapes and byte
+sizes of the transferred values and how long each operation took, so that
+slowdowns seen on real workloads can be reproduced (and bridge changes
+benchmarked) offline::
+
+  >>> mlab._record('/tmp/session.log')
+  >>> ... # the workload
+  >>> mlab._record(None)
+
+and later (or elsewhere)::
+
+  >>> import mlabrecord
+  >>> calls = mlabrecord.load('/tmp/session.log')
+  >>> mlabrecord.report(mlabrecord.replay(calls, mlab))
+
+which re-issues every operation against `mlab` and reports the latency
+differences per operation. Without a target, operations are replayed against
+a `StandInEngine`, which needs no matlab at all (evals are no-ops, but puts
+and gets still copy the data), to isolate the costs on the python side.
+
+The same can be done from the command line with ``python mlabrecord.py
+LOGFILE [--stand-in]``.
+
+The log is a text file with one tab-separated line per operation: the
+operation, its start (in seconds since recording started), its duration,
+``ok`` or ``error``, the command or variable name(s) (escaped, separated by
+spaces) and for the other operations the kind, dtype, shape and byte size of
+the transferred value.
+"""
+
+__docformat__ = "restructuredtext en"
+__version__ = '1.1'
+
+import sys
+import time
+import threading
+import numpy
+
+_HEADER = "# mlabrecord 1\n"
+
+def _describe(value):
+    """Returns ``(kind, dtype, shape, nbytes)`` for a value transferred to or
+    from matlab."""
+    if isinstance(value, str):
+        return 'str', '-', (len(value),), len(value)
+    if isinstance(value, unicode):
+        return 'unicode', '-', (len(value),), 2 * len(value)
+    if isinstance(value, dict):
+        nbytes = 0
+        for item in value.values():
+            nbytes += _describe(item)[3]
+        return 'dict', '-', (len(value),), nbytes
+    if isinstance(value, (list, tuple)) and value and \
+       not [s for s in value if not isinstance(s, basestring)]:
+        return 'cellstr', '-', (len(value),), sum([len(s) for s in value])
+    try:
+        value = numpy.asarray(value)
+    except Exception:
+        return 'other', '-', (), 0
+    if value.dtype.kind == 'O':
+        return 'other', '-', value.shape, 0
+    return 'array', value.dtype.str, value.shape, value.nbytes
+
+def _synthesize(kind, dtype, shape, nbytes):
+    """Returns a value matching a `_describe`\ d one (filled with zeros)."""
+    if kind == 'str':
+        return '0' * shape[0]
+    if kind == 'unicode':
+        return u'0' * shape[0]
+    if kind == 'cellstr':
+        n = shape[0]
+        return ['0' * (nbytes // n)] * n
+    if kind == 'dict':
+        return {'data': numpy.zeros(nbytes // 8)}
+    if kind == 'array':
+        return numpy.zeros(shape, dtype)
+    return numpy.zeros(())
+
+def _synthesize_many(names, nbytes):
+    """Returns a dict of `names` to arrays of zeros, `nbytes` bytes in all."""
+    return dict([(name, numpy.zeros(nbytes // 8 // len(names))) for name in names])
+
+class Call(object):
+    """A single recorded engine operation."""
+    def __init__(self, op, start, seconds, ok, what,
+                 kind='-', dtype='-', shape=(), nbytes=0):
+        self.op, self.start, self.seconds, self.ok = op, start, seconds, ok
+        self.what = what
+        """The command (for ``eval``) or variable name(s)."""
+        self.kind, self.dtype, self.shape, self.nbytes = kind, dtype, shape, nbytes
+    def format(self):
+        if isinstance(self.what, unicode):
+            what = self.what.encode('utf-8')
+        else:
+            what = self.what
+        fields = [self.op, "%.6f" % self.start, "%.6f" % self.seconds,
+                  ('error', 'ok')[self.ok], what.encode('string_escape')]
+        if self.op != 'eval':
+            fields += [self.kind, self.dtype,
+                       'x'.join(map(str, self.shape)), str(self.nbytes)]
+        return "\t".join(fields) + "\n"
+    def parse(cls, line):
+        fields = line.rstrip("\n").split("\t")
+        op, start, seconds, ok, what = fields[:5]
+        call = cls(op, float(start), float(seconds), ok == 'ok',
+                   what.decode('string_escape'))
+        if op != 'eval':
+            kind, dtype, shape, nbytes = fields[5:9]
+            call.kind, call.dtype, call.nbytes = kind, dtype, int(nbytes)
+            call.shape = tuple([int(n) for n in shape.split('x') if n])
+        return call
+    parse = classmethod(parse)
+    def __repr__(self):
+        return "<%s %s %r (%.1f ms)>" % (
+            self.op, ('error', 'ok')[self.ok], self.what[:40], self.seconds * 1e3)
+
+class Recorder(object):
+    """Wraps an engine (by default ``mlabraw``) and logs every ``eval``,
+    ``put`` and ``get`` to a file; it can be used wherever ``mlabraw`` is
+    (see `MlabWrap._record`)."""
+    def __init__(self, file_or_name, engine=None):
+        if engine is None:
+            import mlabraw
+            engine = mlabraw
+        self._engine = engine
+        if isinstance(file_or_name, basestring):
+            self._file = open(file_or_name, 'w')
+            self._owns_file = True
+        else:
+            self._file = file_or_name
+            self._owns_file = False
+        self._file.write(_HEADER)
+        self._lock = threading.Lock()
+        self._t0 = time.time()
+    def _log(self, call):
+        self._lock.acquire()
+        try:
+            if self._file is None: return # closed in the meantime
+            self._file.write(call.format())
+            # the interesting case is a session that hangs or dies
+            self._file.flush()
+        finally:
+            self._lock.release()
+    def _run(self, op, what, describe_arg, fn, *args):
+        start = time.time()
+        ok = False
+        result = None
+        try:
+            result = fn(*args)
+            ok = True
+            return result
+        finally:
+            elapsed = time.time() - start
+            call = Call(op, start - self._t0, elapsed, ok, what)
+            if op.startswith('put'):
+                described = describe_arg
+            else:
+                described = result
+            if op != 'eval' and (ok or op.startswith('put')):
+                call.kind, call.dtype, call.shape, call.nbytes = _describe(described)
+            self._log(call)
+    def eval(self, session, cmd):
+        return self._run('eval', cmd, None, self._engine.eval, session, cmd)
+    def put(self, session, name, value, native=False):
+        return self._run('put', name, value, self._engine.put, session, name, value, native)
+    def get(self, session, name, shared=False):
+        return self._run('get', name, None, self._engine.get, session, name, shared)
+    def put_many(self, session, values, native=False):
+        return self._run('put_many', " ".join(values.keys()), values,
+                         self._engine.put_many, session, values, native)
+    def get_many(self, session, names):
+        return self._run('get_many', " ".join(names), None,
+                         self._engine.get_many, session, names)
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._file is not None and self._owns_file:
+                self._file.close()
+            self._file = None
+        finally:
+            self._lock.release()
+
+def load(file_or_name):
+    """Returns the list of `Call`\ s in a log written by a `Recorder`."""
+    if isinstance(file_or_name, basestring):
+        f = open(file_or_name)
+    else:
+        f = file_or_name
+    try:
+        if f.readline() != _HEADER:
+            raise ValueError("Not an mlabrecord log: %r" % (file_or_name,))
+        return [Call.parse(line) for line in f if line.strip()]
+    finally:
+        if f is not file_or_name: f.close()
+
+class StandInEngine(object):
+    """A stand-in for ``mlabraw`` that needs no matlab: ``eval`` does nothing
+    and ``put`` and ``get`` just copy the data (roughly what the real engine
+    has to do at the very least)."""
+    try:
+        import mlabraw
+        error = mlabraw.error
+        del mlabraw
+    except ImportError:
+        class error(Exception): pass
+    def __init__(self):
+        self._workspaces = {}
+        self._count = 0
+    def open(self, cmd=""):
+        self._count += 1
+        self._workspaces[self._count] = {}
+        return self._count
+    def close(self, session):
+        del self._workspaces[session]
+    def eval(self, session, cmd):
+        return ''
+    def _copy(self, value):
+        if isinstance(value, numpy.ndarray):
+            return value.copy()
+        if isinstance(value, dict):
+            return dict([(k, self._copy(v)) for (k, v) in value.items()])
+        if isinstance(value, list):
+            return value[:]
+        return value
+    def put(self, session, name, value, native=False):
+        self._workspaces[session][name] = self._copy(value)
+    def get(self, session, name, shared=False):
+        try:
+            value = self._workspaces[session][name]
+        except KeyError:
+            raise self.error("Unable to get matrix from MATLAB(TM) workspace")
+        if shared and isinstance(value, numpy.ndarray):
+            # a read-only view, like the real engine's
+            value = value.view()
+            value.flags.writeable = False
+            return value
+        return self._copy(value)
+    def put_many(self, session, values, native=False):
+        for name, value in values.items():
+            self.put(session, name, value)
+    def get_many(self, session, names):
+        return dict([(name, self.get(session, name)) for name in names])
+    def prime(self, session, name, value):
+        """Make `value` available as `name` in `session` (as if a matlab
+        computation had produced it)."""
+        self._workspaces[session][name] = value
+
+def replay(calls, target=None):
+    """Re-issues the recorded `calls` against `target` (an `MlabWrap`, or by
+    default a fresh `StandInEngine`) and returns a list of ``(call,
+    seconds)`` pairs with the new timings.
+
+    Values are synthesized from the recorded descriptions; operations fail
+    (and are timed) if they failed in the recording, so failures don't stop
+    the replay."""
+    if target is None:
+        target = StandInEngine()
+    if hasattr(target, '_raw_put'): # an MlabWrap
+        do_eval, do_put, do_get = target._eval, target._raw_put, target._raw_get
+        do_put_many, do_get_many = target._raw_put_many, target._raw_get_many
+        prime = None
+    else:
+        session = target.open("")
+        do_eval = lambda cmd: target.eval(session, cmd)
+        do_put = lambda name, value: target.put(session, name, value)
+        do_get = lambda name: target.get(session, name)
+        do_put_many = lambda values: target.put_many(session, values)
+        do_get_many = lambda names: target.get_many(session, names)
+        prime = lambda name, value: target.prime(session, name, value)
+    results = []
+    for call in calls:
+        if call.op == 'eval':
+            fn, args = do_eval, (call.what,)
+        elif call.op == 'put':
+            fn = do_put
+            args = (call.what, _synthesize(call.kind, call.dtype, call.shape, call.nbytes))
+        elif call.op == 'put_many':
+            fn, args = do_put_many, (_synthesize_many(call.what.split(), call.nbytes),)
+        elif call.op == 'get_many':
+            fn, args = do_get_many, (call.what.split(),)
+            if prime is not None and call.ok:
+                for name, value in _synthesize_many(call.what.split(), call.nbytes).items():
+                    prime(name, value)
+        else:
+            fn, args = do_get, (call.what,)
+            if prime is not None and call.ok:
+                prime(call.what, _synthesize(call.kind, call.dtype, call.shape, call.nbytes))
+        start = time.time()
+        try:
+            fn(*args)
+        except Exception:
+            pass
+        results.append((call, time.time() - start))
+    return results
+
+def report(results, top=10, out=None):
+    """Prints a summary of `replay` `results`: total recorded and replayed
+    times per operation and the `top` operations that got slower (and
+    faster) the most."""
+    if out is None: out = sys.stdout
+    totals = {}
+    for call, seconds in results:
+        count, recorded, replayed, nbytes = totals.get(call.op, (0, 0., 0., 0))
+        totals[call.op] = (count + 1, recorded + call.seconds,
+                           replayed + seconds, nbytes + call.nbytes)
+    print >> out, "%-8s %8s %12s %12s %9s %12s" % (
+        "op", "count", "recorded ms", "replayed ms", "delta", "MB")
+    for op in ['eval', 'put', 'get', 'put_many', 'get_many']:
+        if op not in totals: continue
+        count, recorded, replayed, nbytes = totals[op]
+        print >> out, "%-8s %8d %12.1f %12.1f %+8.1f%% %12.1f" % (
+            op, count, recorded * 1e3, replayed * 1e3,
+            100 * (replayed - recorded) / max(recorded, 1e-9), nbytes / 1e6)
+    deltas = [(seconds - call.seconds, i, call)
+              for (i, (call, seconds)) in enumerate(results)]
+    deltas.sort()
+    for title, chosen in [("slower", [d for d in deltas[::-1][:top] if d[0] > 0]),
+                          ("faster", [d for d in deltas[:top] if d[0] < 0])]:
+        if not chosen: continue
+        print >> out, "\nmost %s:" % title
+        for delta, i, call in chosen:
+            print >> out, "  #%-6d %+10.2f ms  %-8s %r" % (
+                i, delta * 1e3, call.op, call.what[:60])
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if not args or [a for a in args if a.startswith('-') and a != '--stand-in']:
+        print >> sys.stderr, "usage: python mlabrecord.py LOGFILE [--stand-in]"
+        sys.exit(2)
+    calls = load([a for a in args if a != '--stand-in'][0])
+    if '--stand-in' in args:
+        target = None
+    else:
+        from mlabwrap import mlab as target
+    report(replay(calls, target))
@@ -28,7 +28,6 @@
 ##     expected if ``proxy[index]`` is a marshallable value that doesn't need
 ##     to be proxied itself; see below for workaround).
 ## o XXX:
-##   - better support of string 'arrays'
 ##   - multi-dimensional arrays are unsupported
 ##   - treatment of lists, tuples and arrays with non-numerical values (these
 ##     should presumably be wrapped into wrapper classes MlabCell etc.)
@@ -44,7 +43,7 @@
 ##   - delattr
 ##   - better error reporting: test for number of input args etc.
 ##   - add cloning of proxies.
-##   - pickling for nested proxies (and session management for pickling)
+##   - session management for pickling
 ##   - more tests
 ## o !!!:
 ##   - matlab complex arrays are intelligently of type 'double'
@@ -95,10 +94,21 @@ handles what you want.
 Fine points and limitations
 ---------------------------
 
+- strings are passed in both directions without loss: char arrays become
+  `str` (or `unicode`, if they contain non-ascii characters), multi-row char
+  arrays lists of their rows, and lists of strings (or 1D numpy string
+  arrays) become cell arrays of strings (which are returned as lists again if
+  ``mlab._dont_proxy['cell']`` is set).
+
+- pandas DataFrames can be transferred to and from matlab ``table``\s column
+  by column in a single transfer, without widening integer or boolean
+  columns to double (see ``MlabWrap._set_table`` and ``_get_table``).
+
 - Only 2D matrices are directly supported as return values of matlab
   functions (arbitrary matlab classes are supported via proxy objects --
   in most cases this shouldn't make much of a difference (as these proxy
-  objects can be even pickled) -- still this functionality is yet
+  objects can be even pickled, see ``MlabWrap._dump_proxies`` for doing
+  that for many at once) -- still this functionality is yet
   experimental).
 
   One potential pitfall with structs (which are currently proxied) is that
@@ -145,6 +155,31 @@ Fine points and limitations
   rather convoluted semantics see
   <http://www.mathworks.com/access/helpdesk/help/techdoc/apiref/engopen.html>.
 
+- a single `MlabWrap` (e.g. ``mlab``) can be shared between threads: every
+  call uses its own uniquely named temporaries in the matlab workspace and
+  the individual engine calls are serialized by ``mlab._lock``.
+
+- temporaries that are left behind in the matlab workspace (e.g. because a
+  call failed) are swept up periodically; ``mlab._memory_report()`` shows
+  what uses up the workspace's memory and ``mlab._memory_soft_limit`` and
+  ``mlab._memory_hard_limit`` let you bound it (see `MlabWrap._sweep`).
+
+- ``mlab`` can be used from the workers of a process pool (e.g.
+  ``multiprocessing.Pool``): a forked process transparently gets a matlab
+  session of its own, commands like ``mlab.sin`` can be pickled (by name)
+  and `init_worker` starts and sets up each worker's session in advance.
+
+- many processes can share a pool of already running matlab engines via a
+  broker process (see `mlabbroker`); set ``MLABWRAP_BROKER`` to the
+  broker's socket to use it.
+
+- ``mlab._record(filename)`` logs all engine traffic (with timings) for
+  later replay and benchmarking with `mlabrecord`.
+
+- ``mlab._profile(True)`` runs all calls of matlab functions under matlab's
+  profiler, to separate the time spent in matlab from the bridge overhead
+  (see `mlabprofile`).
+
 - if you don't want to use numpy arrays, but something else that's fine
   too::
 
@@ -171,11 +206,13 @@ __docformat__ = "restructuredtext en"
 __version__ = '1.1'
 __author__   = "Alexander Schmolck <a.schmolck@gmx.net>"
 import warnings
-from pickle import PickleError
 import operator
 import os, sys, re
 import weakref
+import hashlib
 import atexit
+import threading, thread
+import signal
 try:
     import numpy
     ndarray = numpy.ndarray
@@ -186,6 +223,7 @@ except ImportError:
 
 from tempfile import gettempdir
 import mlabraw
+from mlabmat import saveMat, loadMat
 
 from awmstools import update, gensym, slurp, spitOut, isString, escape, strToTempfile, __saveVarsHelper
 
@@ -194,11 +232,9 @@ def _flush_write_stdout(s):
     """Writes `s` to stdout and flushes. Default value for ``handle_out``."""
     sys.stdout.write(s); sys.stdout.flush()
 
-# XXX I changed this to no longer use weakrefs because it didn't seem 100%
-# reliable on second thought; need to check if we need to do something to
-# speed up proxy reclamation on the matlab side.
 class CurlyIndexer(object):
     """A helper class to mimick ``foo{bar}``-style indexing in python."""
+    __slots__ = ('proxy',)
     def __init__(self, proxy):
         self.proxy = proxy
     def __getitem__(self, index):
@@ -206,6 +242,99 @@ class CurlyIndexer(object):
     def __setitem__(self, index, value):
         self.proxy.__setitem__(index, value, '{}')
 
+class _MetaCache(dict):
+    """Maps the matlab expressions for a root proxy and its parts to their
+    metadata (see `MlabWrap._probe`). Handle objects can change behind our
+    back, so nothing gets cached anymore once one is encountered."""
+    volatile = False
+    def add(self, expr, meta):
+        if meta['handle']:
+            self.volatile = True
+            self.clear()
+        elif not self.volatile:
+            self[expr] = meta
+
+class _ProxyTable(object):
+    """The live root proxies of an `MlabWrap`, by integer id: the proxy with
+    id ``i`` holds its value in the matlab variable ``PROXY_VAL<i>__``.
+
+    Ids are reused once their proxy is gone, so the table (a list of weak
+    references) only grows with the number of proxies alive at the same time.
+    Live proxies can also be looked up by variable name (``name in table``,
+    ``table[name]``)."""
+    _NAME_RE = re.compile(r'^PROXY_VAL(\d+)__$')
+    def __init__(self):
+        self._refs = []
+        self._free = []
+        self._lock = threading.RLock()
+    def name(proxy_id):
+        return "PROXY_VAL%d__" % proxy_id
+    name = staticmethod(name)
+    def reserve(self):
+        """Return an unused id (`set` its proxy, or `release` it again)."""
+        self._lock.acquire()
+        try:
+            if self._free:
+                proxy_id = self._free.pop()
+            else:
+                proxy_id = len(self._refs)
+                self._refs.append(None)
+            self._refs[proxy_id] = _reserved
+            return proxy_id
+        finally:
+            self._lock.release()
+    def set(self, proxy_id, proxy):
+        self._refs[proxy_id] = weakref.ref(proxy)
+    def release(self, proxy_id):
+        self._lock.acquire()
+        try:
+            if self._refs[proxy_id] is not None:
+                self._refs[proxy_id] = None
+                self._free.append(proxy_id)
+        finally:
+            self._lock.release()
+    def get(self, proxy_id, default=None):
+        """The live proxy with id `proxy_id` (or `default`)."""
+        try:
+            ref = self._refs[proxy_id]
+        except IndexError:
+            return default
+        if ref is None: return default
+        proxy = ref()
+        if proxy is None: return default
+        return proxy
+    def _id(self, name):
+        match = isString(name) and self._NAME_RE.match(name)
+        if not match: return None
+        return int(match.group(1))
+    def __len__(self):
+        return len(self._refs) - len(self._free)
+    def __contains__(self, name):
+        """Whether `name` belongs to a live proxy, or one being created."""
+        proxy_id = self._id(name)
+        if proxy_id is None or proxy_id >= len(self._refs): return False
+        ref = self._refs[proxy_id]
+        return ref is _reserved or (ref is not None and ref() is not None)
+    def __getitem__(self, name):
+        proxy_id = self._id(name)
+        if proxy_id is not None:
+            proxy = self.get(proxy_id)
+            if proxy is not None: return proxy
+        raise KeyError(name)
+    def values(self):
+        return [proxy for proxy in [self.get(i) for i in range(len(self._refs))]
+                if proxy is not None]
+    def keys(self):
+        return [proxy._name for proxy in self.values()]
+
+_unpickling = threading.local()
+"""``_unpickling.mlabwrap`` is the `MlabWrap` that proxies are unpickled into
+(see `MlabWrap._loads`)."""
+
+def _reserved():
+    """A stand-in (dead) weak reference for ids that aren't `set` yet."""
+    return None
+
 class MlabObjectProxy(object):
     """A proxy class for matlab objects that can't be converted to python
     types.
@@ -231,57 +360,51 @@ class MlabObjectProxy(object):
 
 
        """
+    __slots__ = ('_mlabwrap', '_id', '_expr', '_parent', '_cache', '__weakref__')
     def __init__(self, mlabwrap, name, parent=None):
-        self.__dict__['_mlabwrap'] = mlabwrap
-        self.__dict__['_name'] = name
-        """The name is the name of the proxies representation in matlab."""
-        self.__dict__['_parent'] = parent
+        """`name` is the id (in ``mlabwrap._proxies``) of a root proxy, or the
+        matlab expression for a part of the proxy `parent`."""
+        setattr = object.__setattr__
+        setattr(self, '_mlabwrap', mlabwrap)
+        if parent is None:
+            setattr(self, '_id', name)
+            setattr(self, '_expr', None)
+        else:
+            setattr(self, '_id', None)
+            setattr(self, '_expr', name)
+        setattr(self, '_parent', parent)
         """To fake matlab's ``obj{foo}`` style indexing."""
+        setattr(self, '_cache', None)
+    def _get_name(self):
+        if self._expr is None: return _ProxyTable.name(self._id)
+        return self._expr
+    _name = property(_get_name, doc=
+        """The name of the proxy's representation in matlab (an expression,
+        for parts of other proxies).""")
+    def _get_meta_cache(self):
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        if root._cache is None: # shared by all proxies for parts of the value
+            object.__setattr__(root, '_cache', _MetaCache())
+        return root._cache
+    _meta_cache = property(_get_meta_cache)
+    _ = property(CurlyIndexer, doc="``proxy._[i]`` is matlab's ``proxy{i}``.")
     def __getstate__(self):
-        "Experimental pickling support."
-        if self.__dict__['_parent']:
-            raise PickleError(
-                "Only root instances of %s can currently be pickled." % \
-                type(self).__name__)
-        tmp_filename = os.path.join(gettempdir(), "mlab_pickle_%s.mat" % self._mlabwrap._session)
-        try:
-            mlab.save(tmp_filename, self._name)
-            mlab_contents = slurp(tmp_filename, binary=1)
-        finally:
-            if os.path.exists(tmp_filename): os.remove(tmp_filename)
-
-        return {'mlab_contents' : mlab_contents,
-                'name': self._name}
-
-
+        """Pickling support: the state is a serialized copy of the matlab
+        value (see `MlabWrap._dump_proxies`)."""
+        return self._mlabwrap._dump_proxies([self])[0]
     def __setstate__(self, state):
-        "Experimental unpickling support."
-        global mlab         #XXX this should be dealt with correctly
-        old_name = state['name']
-        mlab_name = "UNPICKLED%s__" % gensym('')
-        tmp_filename = None
-        try:
-            tmp_filename = strToTempfile(
-                state['mlab_contents'], suffix='.mat', binary=1)
-            mlabraw.eval(mlab._session,
-                       "TMP_UNPICKLE_STRUCT__ = load('%s', '%s');" % (
-                tmp_filename, old_name))
-            mlabraw.eval(mlab._session,
-                       "%s = TMP_UNPICKLE_STRUCT__.%s;" % (mlab_name, old_name))
-            mlabraw.eval(mlab._session, "clear TMP_UNPICKLE_STRUCT__;")
-            # XXX
-            mlab._make_proxy(mlab_name, constructor=lambda *args: self.__init__(*args) or self)
-            mlabraw.eval(mlab._session, 'clear %s;' % mlab_name)
-        finally:
-            if tmp_filename and os.path.exists(tmp_filename):
-                os.remove(tmp_filename)
-            # FIXME clear'ing in case of error
+        """Unpickling support (see `MlabWrap._load_proxies`): the value is
+        loaded into the session of `mlab` (or of the `MlabWrap` whose
+        `_loads` does the unpickling)."""
+        (getattr(_unpickling, 'mlabwrap', None) or mlab)._load_proxies([state], [self])
 
     def __repr__(self):
         output = []
         mlab._do('disp(%s)' % self._name, nout=0, handle_out=output.append)
         rep = "".join(output)
-        klass = self._mlabwrap._do("class(%s)" % self._name)
+        klass = self._meta()['class']
 ##         #XXX what about classes?
 ##         if klass == "struct":
 ##             rep = "\n" + self._mlabwrap._format_struct(self._name)
@@ -292,27 +415,66 @@ class MlabObjectProxy(object):
             self._name, ['yes', 'no'][self._parent is None],
             rep)
     def __del__(self):
-        if self._parent is None:
-            mlabraw.eval(self._mlabwrap._session, 'clear %s;' % self._name)
+        try:
+            proxy_id = self._id
+        except AttributeError: # never initialized
+            return
+        if proxy_id is not None:
+            try:
+                # a forked child mustn't start a session just for this
+                if self._mlabwrap._pid == os.getpid():
+                    self._mlabwrap._eval('clear %s;' % self._name)
+            finally:
+                self._mlabwrap._proxies.release(proxy_id)
+    def _meta(self):
+        """The (cached) class, size etc. of the proxied value (see
+        `MlabWrap._probe`)."""
+        return self._part_meta(self._name)
+    def _part_meta(self, expr):
+        meta = self._meta_cache.get(expr)
+        if meta is None:
+            meta = self._mlabwrap._probe(expr)
+            self._meta_cache.add(expr, meta)
+        return meta
     def _get_part(self, to_get):
-        if self._mlabwrap._var_type(to_get) in self._mlabwrap._mlabraw_can_convert:
-            #!!! need assignment to TMP_VAL__ because `mlabraw.get` only works
-            # with 'atomic' values like ``foo`` and not e.g. ``foo.bar``.
-            mlabraw.eval(self._mlabwrap._session, "TMP_VAL__=%s" % to_get)
-            return self._mlabwrap._get('TMP_VAL__', remove=True)
-        return type(self)(self._mlabwrap, to_get, self)
+        mlabwrap = self._mlabwrap
+        mlabwrap._enter()
+        try:
+            if mlabwrap._meta_type(self._part_meta(to_get)) in mlabwrap._mlabraw_can_convert:
+                #!!! need assignment to TMP_VAL__ because `mlabraw.get` only works
+                # with 'atomic' values like ``foo`` and not e.g. ``foo.bar``.
+                tmp_name = mlabwrap._tmp_name("TMP_VAL")
+                mlabwrap._eval("%s=%s;" % (tmp_name, to_get))
+                try:
+                    return mlabwrap._postprocess(mlabwrap._raw_get(tmp_name))
+                finally:
+                    mlabwrap._clear_vars([tmp_name])
+            return type(self)(mlabwrap, to_get, self)
+        finally:
+            mlabwrap._leave()
     def _set_part(self, to_set, value):
         #FIXME s.a.
-        if isinstance(value, MlabObjectProxy):
-            mlabraw.eval(self._mlabwrap._session, "%s = %s;" % (to_set, value._name))
-        else:
-            self._mlabwrap._set("TMP_VAL__", value)
-            mlabraw.eval(self._mlabwrap._session, "%s = TMP_VAL__;" % to_set)
-            mlabraw.eval(self._mlabwrap._session, 'clear TMP_VAL__;')
+        try:
+            if isinstance(value, MlabObjectProxy):
+                self._mlabwrap._eval("%s = %s;" % (to_set, value._name))
+            else:
+                self._mlabwrap._enter()
+                try:
+                    tmp_name = self._mlabwrap._tmp_name("TMP_VAL")
+                    self._mlabwrap._set(tmp_name, value)
+                    self._mlabwrap._eval("%s = %s; clear %s;" % (to_set, tmp_name, tmp_name))
+                    self._mlabwrap._forget([tmp_name])
+                finally:
+                    self._mlabwrap._leave()
+        finally:
+            # the types and sizes of any part (and the whole) may have changed
+            self._meta_cache.clear()
 
     def __getattr__(self, attr):
-        if attr == "_":
-            return self.__dict__.setdefault('_', CurlyIndexer(self))
+        # matlab names can't start with an underscore, so these are e.g.
+        # pickle's ``__getnewargs__`` or slots that aren't initialized yet
+        if attr.startswith('_'):
+            raise AttributeError, attr
         else:
             return self._get_part("%s.%s" % (self._name, attr))
     def __setattr__(self, attr, value):
@@ -369,10 +531,381 @@ class MlabObjectProxy(object):
         return self._set_part("".join([self._name,parens[0],index,parens[1]]),
                                       value)
 
+class MlabSyncedArray(object):
+    """A python array that mirrors a (double) matlab workspace variable and
+    keeps it in sync incrementally. Create it with ``mlab._sync(name,
+    value)``.
+
+    Assigning to ``synced[index]`` only modifies the local array (available
+    as ``synced.array``) and records `index` as dirty; `push` then transfers
+    just the dirty regions to matlab, so that the cost of keeping a big
+    matrix up to date is proportional to what changed, not to its size::
+
+      state = mlab._sync('state', numpy.zeros((10000, 100)))
+      for step in steps:
+          state[step.row, :] = step.values
+          state.push()
+          mlab.update_state(nout=0)
+          state.pull((slice(None), 0)) # the first column is computed by matlab
+
+    Only basic indices (integers, slices and ``Ellipsis``) are supported. If
+    you modify ``synced.array`` directly, use `mark_dirty` to tell about it.
+    """
+    _full_push_fraction = 0.5
+    """If the dirty regions cover more than this fraction of the array, just
+    transfer the whole thing."""
+    def __init__(self, mlabwrap, name, value):
+        self._mlabwrap = mlabwrap
+        self.name = name
+        value = numpy.asarray(value)
+        self.array = numpy.array(value, (numpy.float64, numpy.complex128)[
+            numpy.iscomplexobj(value)])
+        self._dirty = []
+        self._mlabwrap._set(name, self.array)
+    def __array__(self, *args):
+        return numpy.asarray(self.array, *args)
+    def __len__(self):
+        return len(self.array)
+    def __getitem__(self, index):
+        return self.array[index]
+    def __setitem__(self, index, value):
+        self.array[index] = value
+        self.mark_dirty(index)
+    def _region(self, index):
+        """Normalize `index` into a tuple with one step-1-or-more slice per
+        dimension (integers become length-1 slices, so dimensions are kept)."""
+        if not isinstance(index, tuple): index = (index,)
+        if Ellipsis in index:
+            i = list(index).index(Ellipsis)
+            index = (index[:i] + (slice(None),) * (self.array.ndim - len(index) + 1)
+                     + index[i+1:])
+        if len(index) > self.array.ndim:
+            raise IndexError("Too many indices for %d-D array" % self.array.ndim)
+        index = index + (slice(None),) * (self.array.ndim - len(index))
+        region = []
+        for i, n in zip(index, self.array.shape):
+            if isinstance(i, slice):
+                start, stop, step = i.indices(n)
+                if stop < 0: stop = None # running backwards to the start
+                region.append(slice(start, stop, step))
+            elif operator.isNumberType(i):
+                i = int(i)
+                if i < 0: i += n
+                if not 0 <= i < n: raise IndexError("Index %d out of range" % i)
+                region.append(slice(i, i+1, 1))
+            else:
+                raise TypeError("Unsupported index type: %r." % type(i))
+        return tuple(region)
+    def _subscript(self, region):
+        subs = []
+        for s, n in zip(region, self.array.shape):
+            start, stop, step = s.indices(n)
+            last = start + (len(range(start, stop, step)) - 1) * step
+            subs.append('%d:%d:%d' % (start + 1, step, last + 1))
+        if len(subs) == 1: # matlab stores 1D arrays as columns
+            subs.append('1')
+        return "%s(%s)" % (self.name, ",".join(subs))
+    def mark_dirty(self, index=Ellipsis):
+        """Record that ``self.array[index]`` has been modified locally."""
+        self._dirty.append(self._region(index))
+    def push(self):
+        """Transfer all regions modified since the last `push` to matlab (with
+        one put per region and a single assignment eval)."""
+        dirty, self._dirty = self._dirty, []
+        regions = [r for r in dirty if self.array[r].size]
+        if not regions: return
+        if sum([self.array[r].size for r in regions]) > \
+               self._full_push_fraction * self.array.size:
+            self._mlabwrap._set(self.name, self.array)
+            return
+        mlabwrap = self._mlabwrap
+        mlabwrap._enter()
+        try:
+            patches = []
+            try:
+                for region in regions:
+                    patches.append(mlabwrap._tmp_name("TMP_PATCH"))
+                    mlabwrap._raw_put(patches[-1], self.array[region])
+                mlabwrap._eval(" ".join(["%s = %s;" % (self._subscript(region), patch)
+                                         for (region, patch) in zip(regions, patches)]))
+                mlabwrap._clear_vars(patches)
+            except:
+                self._dirty[:0] = dirty # so that the user can retry
+                raise
+        finally:
+            mlabwrap._leave()
+    def pull(self, index=Ellipsis):
+        """Update ``self.array[index]`` (by default everything) from matlab, in
+        a single transfer."""
+        region = self._region(index)
+        if not self.array[region].size: return
+        mlabwrap = self._mlabwrap
+        mlabwrap._enter()
+        try:
+            if region == self._region(Ellipsis):
+                values = mlabwrap._get(self.name)
+            else:
+                tmp_name = mlabwrap._tmp_name("TMP_PATCH")
+                mlabwrap._eval("%s = %s;" % (tmp_name, self._subscript(region)))
+                values = mlabwrap._get(tmp_name, remove=True)
+        finally:
+            mlabwrap._leave()
+        self.array[region] = numpy.reshape(numpy.asarray(values), self.array[region].shape)
+    def __repr__(self):
+        return "<%s for matlab variable %r (%d dirty regions)>\n%r" % (
+            type(self).__name__, self.name, len(self._dirty), self.array)
+
 class MlabConversionError(Exception):
     """Raised when a mlab type can't be converted to a python primitive."""
     pass
 
+class MlabTimeoutError(mlabraw.error):
+    """Raised when a matlab call doesn't finish within its ``timeout``."""
+    pass
+
+_open_sessions = []
+"""The handles of all currently open matlab sessions (with the engine and the
+id of the process that opened them)."""
+def _close_session(handle):
+    for engine, open_handle, pid in _open_sessions[:]:
+        if open_handle is handle:
+            _open_sessions.remove((engine, open_handle, pid))
+            # a forked child mustn't close the sessions of its parent
+            if pid != os.getpid(): continue
+            try:
+                engine.close(handle)
+            except mlabraw.error: pass # e.g. because the engine was killed
+def _close_open_sessions():
+    for engine, handle, pid in _open_sessions[:]:
+        _close_session(handle)
+atexit.register(_close_open_sessions)
+_fork_lock = threading.Lock()
+
+_EVAL_LIMIT = 4000
+"""Longer commands are transferred as a string and run with matlab's ``eval``
+(``mlabraw.eval`` takes at most 4096 bytes, including its error handling)."""
+
+_TEMP_NAME_RE = re.compile(r'^(?:TMP\w*?|RES\d+_|arg\d+_|UNPICKLED|PROXY_VAL)\d+__$')
+"""Matches the workspace names of mlabwrap's temporaries and proxy values."""
+
+class _Watchdog(object):
+    """Interrupts the matlab engine process of a `MlabWrap` if the call it
+    guards is still inside an engine operation after `timeout` seconds and
+    kills it if it's still in there ``_interrupt_grace`` seconds after that.
+    Once expired, it doesn't let the call start any more engine operations."""
+    def __init__(self, mlabwrap, timeout):
+        self.pid = mlabwrap._engine_pid
+        self.grace = mlabwrap._interrupt_grace
+        self.expired = self.killed = self.inside = False
+        self.done = threading.Event()
+        self.state = threading.Lock()
+        self.timer = threading.Timer(timeout, self._expire)
+        self.timer.setDaemon(True)
+    def start(self):
+        self.timer.start()
+    def enter(self):
+        self.state.acquire()
+        try:
+            if self.expired: raise MlabTimeoutError("Call timed out")
+            self.inside = True
+        finally:
+            self.state.release()
+    def leave(self):
+        self.state.acquire()
+        try:
+            self.inside = False
+        finally:
+            self.state.release()
+    def _expire(self):
+        interrupt = not sys.platform.startswith('win')
+        self.state.acquire()
+        try:
+            if self.done.isSet(): return
+            self.expired = True
+            # can't do anything but wait, or nothing to interrupt
+            if self.pid is None or not self.inside: return
+            if interrupt:
+                try:
+                    os.kill(self.pid, signal.SIGINT)
+                except OSError: return
+        finally:
+            self.state.release()
+        if interrupt:
+            self.done.wait(self.grace)
+        self.state.acquire()
+        try:
+            if self.done.isSet() or not self.inside: return
+            try:
+                os.kill(self.pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+                self.killed = True
+            except OSError: pass
+        finally:
+            self.state.release()
+    def stop(self):
+        self.done.set()
+        self.timer.cancel()
+        self.timer.join()
+
+class MlabCommand(object):
+    """A matlab function as returned by ``mlab.foo`` (see
+    `MlabWrap._make_mlab_command`). Commands are pickled by name, and
+    unpickled as commands of the unpickling process's `mlab`, so they can be
+    passed to the workers of a process pool (see `init_worker`)."""
+    def __init__(self, mlabwrap, name, nout, doc=None):
+        self._mlabwrap = mlabwrap
+        self.name = name
+        self.nout = nout
+        self.__doc__ = doc and "\n" + doc
+    def __call__(self, *args, **kwargs):
+        mlabwrap = self._mlabwrap
+        kwargs = update({'nout':self.nout}, kwargs)
+        if mlabwrap._single_flight:
+            key = _fingerprint((self.name, args, kwargs))
+            if key is not None:
+                return mlabwrap._coalesce(key, self._call, args, kwargs)
+        return self._call(args, kwargs)
+    def _call(self, args, kwargs):
+        mlabwrap = self._mlabwrap
+        if mlabwrap._profiler is not None:
+            return mlabwrap._profiler.profile(self.name, mlabwrap._do, self.name,
+                                              *args, **kwargs)
+        return mlabwrap._do(self.name, *args, **kwargs)
+    def __reduce__(self):
+        return (_unpickle_command, (self.name, self.nout))
+    def __repr__(self):
+        return "<%s %s, nout=%d>" % (type(self).__name__, self.name, self.nout)
+
+def _fingerprint(value):
+    """A hashable key that is equal for equal (call) arguments, or `None` if
+    `value` contains something that can't be compared."""
+    if isinstance(value, (float, complex, numpy.generic)):
+        # by the exact bits, since e.g. ``-0.0 == 0.0``
+        return (type(value), numpy.asarray(value).tostring())
+    if isinstance(value, (basestring, int, long, type(None))):
+        return (type(value), value)
+    if isinstance(value, ndarray):
+        if value.dtype.hasobject: return None
+        return (ndarray, value.dtype.str, value.shape,
+                hashlib.sha1(numpy.ascontiguousarray(value)).digest())
+    if isinstance(value, MlabObjectProxy):
+        return (MlabObjectProxy, value._name)
+    if isinstance(value, (list, tuple)):
+        keys = map(_fingerprint, value)
+        if None in keys: return None
+        return (type(value), tuple(keys))
+    if isinstance(value, dict):
+        keys = [(k, _fingerprint(v)) for (k, v) in value.items()]
+        if [k for (k, key) in keys if key is None]: return None
+        keys.sort()
+        return (dict, tuple(keys))
+    # e.g. a ``cast`` function
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return (object, value)
+
+class _Flight(object):
+    """A call in progress, whose result is shared by identical calls."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.exc_info = None
+    def wait(self):
+        self.done.wait()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+def _unpickle_command(name, nout):
+    # reuse `mlab`'s cached command (and its doc) if there is one
+    command = mlab.__dict__.get(name) or mlab.__dict__.get(name + "_")
+    if isinstance(command, MlabCommand) and command.nout == nout:
+        return command
+    return mlab._make_mlab_command(name, nout)
+
+_MATLAB_TOKEN_RE = re.compile(r"""
+   (?P<comment>%[^\n]*)
+  |(?P<string>"(?:[^"\n]|"")*")
+  |(?P<name>[A-Za-z]\w*)'*
+  |[\)\]\}.\d]'+                    # transposes
+  |(?P<chars>'(?:[^'\n]|'')*')""", re.VERBOSE)
+
+class MlabSnippet(object):
+    """A piece of matlab code with `inputs` and `outputs`, callable like a
+    function (see `MlabWrap._compile`)."""
+    def __init__(self, mlabwrap, code, inputs, outputs):
+        for var in inputs + outputs:
+            if not re.match(r'[A-Za-z]\w*$', var):
+                raise ValueError("Not a matlab variable name: %r" % var)
+        self._mlabwrap = mlabwrap
+        self.code = code
+        self.inputs = inputs
+        self.outputs = outputs
+        # `code` split into alternating literal text and variables to rename
+        self._parts = []
+        last = 0
+        for m in _MATLAB_TOKEN_RE.finditer(code):
+            var = m.group('name')
+            if var not in inputs and var not in outputs: continue
+            if m.start() and code[m.start() - 1] == '.': continue # a field
+            self._parts.extend([code[last:m.start()], var])
+            last = m.end('name')
+        self._parts.append(code[last:])
+    def __call__(self, *args, **kwargs):
+        """Run the code with the `inputs` bound to `args` and `kwargs`;
+        returns the values of the `outputs` like `MlabWrap._do`."""
+        if len(args) > len(self.inputs):
+            raise TypeError("Expected at most %d arguments, got %d"
+                            % (len(self.inputs), len(args)))
+        values = dict(zip(self.inputs, args))
+        for var, value in kwargs.items():
+            if var not in self.inputs or var in values:
+                raise TypeError("Unexpected or repeated argument %r" % var)
+            values[var] = value
+        if len(values) < len(self.inputs):
+            raise TypeError("Missing arguments: %s" % ", ".join(
+                [var for var in self.inputs if var not in values]))
+        mlab = self._mlabwrap
+        mlab._enter()
+        try:
+            names = {}
+            for var in self.inputs + self.outputs:
+                if var not in names: names[var] = mlab._tmp_name("TMP_%s_" % var)
+            fetch_names = [mlab._tmp_name(prefix)
+                           for prefix in ("TMP_FETCH", "TMP_NAMES", "TMP_KEEP")]
+            outnames = [names[var] for var in self.outputs]
+            inputs_only = [names[var] for var in self.inputs if var not in self.outputs]
+            try:
+                if values:
+                    mlab._set_many(dict([(names[var], value)
+                                         for (var, value) in values.items()]))
+                cmd = []
+                if mlab._autosync_dirs:
+                    cmd.append("cd('%s');" % os.getcwd().replace("'", "''"))
+                for i, part in enumerate(self._parts):
+                    cmd.append((part, names.get(part))[i % 2])
+                cmd.append("\n")
+                if inputs_only:
+                    cmd.append("clear('%s');" % "','".join(inputs_only))
+                if outnames:
+                    cmd.append(mlab._fetch_cmd(outnames, fetch_names))
+                _flush_write_stdout(mlab._eval("".join(cmd)))
+                if not outnames: return None
+                res = []
+                fetched = mlab._fetched(mlab._raw_get(fetch_names[0], mlab._zero_copy))
+                for name, (ok, value) in zip(outnames, fetched):
+                    if not ok: value = mlab._get(name)
+                    res.append(value)
+            finally:
+                mlab._clear_vars(names.values() + fetch_names)
+            if len(res) == 1: return res[0]
+            return tuple(res)
+        finally:
+            mlab._leave()
+    def __repr__(self):
+        return "<%s (%s) -> (%s)>" % (type(self).__name__, ", ".join(self.inputs),
+                                      ", ".join(self.outputs))
+
 class MlabWrap(object):
     """This class does most of the wrapping work. It manages a single matlab
        session (you can in principle have multiple open sessions if you want,
@@ -401,21 +934,365 @@ class MlabWrap(object):
         call. Otherwise they are left to be (partly) overwritten by the next
         function call. This saves a function call in matlab but means that the
         memory used up by the arguments will remain unreclaimed till
-        overwritten."""
-        self._session = mlabraw.open(os.getenv("MLABRAW_CMD_STR", ""))
-        atexit.register(lambda handle=self._session: mlabraw.close(handle))
-        self._proxies = weakref.WeakValueDictionary()
+        overwritten (it also means the argument names are no longer unique per
+        call, so the session shouldn't be shared between threads)."""
+        self._lock = threading.RLock()
+        """Serializes access to the matlab engine. All workspace temporaries
+        get unique names, so this is only held for the duration of each
+        individual engine call, which makes it safe to share a single
+        `MlabWrap` between threads."""
+        self._tmp_count = 0
+        self._timeout = None
+        """The default ``timeout`` (in seconds) for calls (see `_do`); `None`
+        means calls can take forever."""
+        self._interrupt_grace = 5.
+        """How many seconds to give matlab to react to an interrupt after a
+        timeout, before the engine process is killed and the session
+        restarted."""
+        self._stats = {'timeouts': 0, 'restarts': 0, 'sweeps': 0, 'swept': 0,
+                       'coalesced': 0}
+        """Counters for noteworthy events in the session's life."""
+        self._temps = {}
+        """Maps the names of all live workspace temporaries to the thread
+        that created them (see `_tmp_name`)."""
+        self._orphans = []
+        """Temporaries left behind by finished operations (e.g. because of an
+        exception); they are removed by the next `_sweep`."""
+        self._local = threading.local()
+        self._active = 0
+        self._op_count = 0
+        self._sweep_interval = 100
+        """Sweep orphaned temporaries (and check the memory limits) after
+        every this many operations, or as soon as there are more orphans than
+        that."""
+        self._memory_soft_limit = None
+        """If the matlab workspace grows beyond this many bytes, also sweep
+        all unreferenced mlabwrap temporaries and proxy values (see
+        `_sweep`)."""
+        self._memory_hard_limit = None
+        """If the matlab workspace *still* uses more than this many bytes
+        after a sweep, the session is recycled (which invalidates all existing
+        proxies)."""
+        self._single_flight = False
+        """If true, a call of a matlab function (``mlab.foo(...)``) that is
+        identical to one that another thread has already started (same
+        function, equal arguments and keyword arguments) doesn't run again,
+        but waits for the other call and returns its result (or raises its
+        exception). Those results are then shared between the callers, so
+        they mustn't be modified in place. ``_stats['coalesced']`` counts the
+        calls that were saved. Only use this for functions without side
+        effects."""
+        self._flights = {}
+        """Maps the fingerprints of calls in progress to their `_Flight`."""
+        self._watchdog = None
+        """The `_Watchdog` of the timed call that currently holds the engine."""
+        self._recorder = None
+        """An `mlabrecord.Recorder` that logs all engine calls while
+        recording (see `_record`)."""
+        self._engine = mlabraw
+        """The engine interface: ``mlabraw`` or something with the same API,
+        such as a `mlabbroker.BrokerClient` (which is used if the environment
+        variable ``MLABWRAP_BROKER`` is set to a broker's socket)."""
+        if os.getenv("MLABWRAP_BROKER"):
+            import mlabbroker
+            self._engine = mlabbroker.BrokerClient(os.getenv("MLABWRAP_BROKER"))
+        self._profiler = None
+        """An `mlabprofile.MlabProfiler` that times all calls of matlab
+        functions while profiling (see `_profile`)."""
+        self._open_session()
+        self._proxies = _ProxyTable()
         """Use ``mlab._proxies.values()`` for a list of matlab object's that
         are currently proxied."""
-        self._proxy_count = 0
+        self._byte_streams = None
+        self._zero_copy = False
+        """Return numeric results as read-only, fortran-ordered views of the
+        memory matlab's engine library hands over, rather than copying them
+        into fresh arrays (see ``mlabraw.get``). Use ``numpy.array(x)`` to get
+        a writable copy of such a result `x`. This doesn't save anything with
+        a `mlabbroker`, whose results always have to be copied."""
         self._mlabraw_can_convert = ('double', 'char')
         """The matlab(tm) types that mlabraw will automatically convert for us."""
-        self._dont_proxy = {'cell' : False}
+        self._dont_proxy = {'cell' : False, 'string' : True}
         """The matlab(tm) types we can handle ourselves with a bit of
            effort. To turn on autoconversion for e.g. cell arrays do:
-           ``mlab._dont_proxy["cell"] = True``."""
+           ``mlab._dont_proxy["cell"] = True``. (Vector ``string`` arrays
+           are converted to lists of strings and string scalars to strings by
+           default.)"""
     def __del__(self):
-        mlabraw.close(self._session)
+        # at interpreter exit the module might already have been torn down,
+        # but then `_close_open_sessions` has taken care of things anyway
+        if _close_session is not None:
+            _close_session(self._session)
+    def _open_session(self):
+        self._session = self._engine.open(os.getenv("MLABRAW_CMD_STR", ""))
+        self._pid = os.getpid()
+        _open_sessions.append((self._engine, self._session, self._pid))
+        # so that the watchdog can interrupt runaway calls
+        try:
+            self._engine.eval(self._session, "MLABRAW_PID_ = feature('getpid');")
+            self._engine_pid = int(self._engine.get(self._session, "MLABRAW_PID_").flat[0])
+            self._engine.eval(self._session, "clear MLABRAW_PID_;")
+        except mlabraw.error:
+            self._engine_pid = None
+    def _restart_session(self, dead_session):
+        """Replaces `dead_session` by a freshly started one (unless that
+        already happened). Note that all existing proxies become invalid."""
+        self._lock.acquire()
+        try:
+            if self._session is dead_session:
+                _close_session(dead_session)
+                self._open_session()
+                self._orphans = []
+                self._count('restarts')
+        finally:
+            self._lock.release()
+    def _check_fork(self):
+        """Give a forked child process a fresh session of its own, instead of
+        sharing the parent's engine (pipe or broker connection). All proxies
+        inherited from the parent are invalid in the child."""
+        if self._pid == os.getpid(): return
+        _fork_lock.acquire()
+        try:
+            if self._pid == os.getpid(): return
+            # other threads of the parent might have held these at the fork
+            self._lock = threading.RLock()
+            self._local = threading.local()
+            self._active = 0
+            self._temps = {}
+            self._orphans = []
+            self._flights = {}
+            self._watchdog = None
+            # the recording belongs to the parent
+            self._recorder = None
+            self._open_session()
+            self._count('forks')
+        finally:
+            _fork_lock.release()
+    def _engine_call(self, op, *args):
+        """Calls the engine's `op` with the session and `args` (honouring the
+        `_Watchdog` of a timed call in progress)."""
+        self._check_fork()
+        self._lock.acquire()
+        try:
+            watchdog = self._watchdog
+            if watchdog is not None: watchdog.enter()
+            try:
+                return getattr(self._recorder or self._engine, op)(self._session, *args)
+            finally:
+                if watchdog is not None: watchdog.leave()
+        finally:
+            self._lock.release()
+    def _eval(self, cmd):
+        if len(cmd) <= _EVAL_LIMIT:
+            return self._engine_call('eval', cmd)
+        code_name = self._tmp_name("TMP_CODE")
+        try:
+            self._raw_put(code_name, cmd)
+            res = self._engine_call('eval', "eval(%s); clear %s" % (code_name, code_name))
+        except:
+            self._clear_vars([code_name])
+            raise
+        self._forget([code_name])
+        return res
+    def _raw_put(self, name, value, native=False):
+        return self._engine_call('put', name, value, native)
+    def _raw_get(self, name, shared=False):
+        return self._engine_call('get', name, shared)
+    def _raw_put_many(self, values, native=False):
+        return self._engine_call('put_many', values, native)
+    def _raw_get_many(self, names):
+        return self._engine_call('get_many', names)
+    def _record(self, filename):
+        r"""Start logging every engine call (with the types, shapes and sizes
+        of the transferred values and how long it took) to `filename`, or stop
+        recording if `filename` is `None`.
+
+        The log can be replayed for benchmarking, see `mlabrecord`."""
+        import mlabrecord
+        self._lock.acquire()
+        try:
+            if self._recorder is not None:
+                self._recorder.close()
+                self._recorder = None
+            if filename is not None:
+                self._recorder = mlabrecord.Recorder(filename, self._engine)
+        finally:
+            self._lock.release()
+    def _profile(self, on=True):
+        r"""Turn profiling of all calls of matlab functions (i.e.
+        ``mlab.foo(...)``) with matlab's profiler on or off.
+
+        Returns the `mlabprofile.MlabProfiler` that collects the matlab
+        function timings and bridge overheads per function name; see
+        `mlabprofile` for the reports."""
+        if on:
+            if self._profiler is None:
+                import mlabprofile
+                self._profiler = mlabprofile.MlabProfiler(self)
+            return self._profiler
+        profiler, self._profiler = self._profiler, None
+        return profiler
+    def _count(self, what, n=1):
+        self._lock.acquire()
+        try:
+            self._stats[what] = self._stats.get(what, 0) + n
+        finally:
+            self._lock.release()
+    def _tmp_name(self, prefix):
+        """Returns a fresh name (starting with `prefix`) for a temporary in the
+        matlab workspace."""
+        self._lock.acquire()
+        try:
+            self._tmp_count += 1
+            name = "%s%d__" % (prefix, self._tmp_count)
+            self._temps[name] = thread.get_ident()
+            return name
+        finally:
+            self._lock.release()
+    def _forget(self, names):
+        """Stop tracking the temporaries `names` (after they've been cleared)."""
+        self._lock.acquire()
+        try:
+            for name in names:
+                self._temps.pop(name, None)
+        finally:
+            self._lock.release()
+    def _clear_vars(self, names):
+        if not names: raise ValueError("No varnames") #to prevent clear('')
+        self._eval("clear('%s');" % "','".join(names))
+        self._forget(names)
+    # Every operation (`_do`, `_get`, proxy attribute access etc.) is bracketed
+    # by `_enter` and `_leave`; whatever temporaries a thread still owns when
+    # its outermost operation finishes must have leaked and become orphans.
+    def _enter(self):
+        self._check_fork()
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            self._lock.acquire()
+            try:
+                self._active += 1
+            finally:
+                self._lock.release()
+        self._local.depth = depth + 1
+    def _leave(self):
+        if self._local.depth > 1:
+            self._local.depth -= 1
+            return
+        try:
+            self._orphan_temps()
+            try:
+                self._housekeep()
+            except mlabraw.error, msg:
+                warnings.warn("Couldn't clean up matlab workspace: %s" % msg)
+        finally:
+            self._local.depth = 0
+            self._lock.acquire()
+            try:
+                self._active -= 1
+            finally:
+                self._lock.release()
+    def _orphan_temps(self):
+        me = thread.get_ident()
+        self._lock.acquire()
+        try:
+            for name, owner in self._temps.items():
+                if owner == me:
+                    del self._temps[name]
+                    self._orphans.append(name)
+        finally:
+            self._lock.release()
+    def _housekeep(self):
+        # a forked child has nothing to clean up until it has a session
+        if self._pid != os.getpid(): return
+        self._lock.acquire()
+        try:
+            self._op_count += 1
+            if (self._op_count % self._sweep_interval and
+                len(self._orphans) <= self._sweep_interval):
+                return
+        finally:
+            self._lock.release()
+        self._sweep()
+        soft, hard = self._memory_soft_limit, self._memory_hard_limit
+        if soft is None and hard is None: return
+        total = self._memory_report()['total']
+        if soft is not None and total > soft:
+            self._sweep(deep=True)
+            total = self._memory_report()['total']
+        if hard is not None and total > hard:
+            self._lock.acquire()
+            try:
+                # other threads might still be using the workspace
+                if self._active > 1: return
+                warnings.warn("matlab workspace uses %d bytes (more than %d); "
+                              "restarting the session, existing proxies are "
+                              "now invalid" % (total, hard))
+                self._restart_session(self._session)
+                self._count('recycles')
+            finally:
+                self._lock.release()
+    def _sweep(self, deep=False):
+        """Remove the orphaned temporaries left behind by failed operations
+        from the matlab workspace, in a single ``clear``.
+
+        If `deep` is true, every variable that looks like one of mlabwrap's
+        temporaries or proxy values, but isn't used by a running operation or
+        referenced by a live proxy anymore, is removed as well (e.g. leftovers
+        from earlier sessions or proxies that never got their ``__del__``
+        called)."""
+        if self._pid != os.getpid(): return # the orphans are the parent's
+        self._enter()
+        try:
+            if deep:
+                who, names = self._tmp_name("TMP_WHO"), self._tmp_name("TMP_WHO_STR")
+                self._eval("%(w)s = who; %(s)s = sprintf('%%s ', %(w)s{:}); clear %(w)s;"
+                           % dict(w=who, s=names))
+                self._forget([who])
+                names = self._get(names, remove=True).split()
+            self._lock.acquire()
+            try:
+                doomed, self._orphans = self._orphans, []
+                if deep:
+                    doomed.extend([name for name in names
+                                   if _TEMP_NAME_RE.match(name)
+                                   and name not in self._temps
+                                   and name not in self._proxies])
+                if doomed:
+                    self._count('sweeps')
+                    self._count('swept', len(doomed))
+                    self._eval("clear('%s');" % "','".join(doomed))
+            finally:
+                self._lock.release()
+        finally:
+            self._leave()
+    def _memory_report(self):
+        """Returns a dict describing how much memory (in bytes) the matlab
+        workspace uses: ``'variables'`` maps each variable's name to its size,
+        ``'proxies'`` and ``'temporaries'`` are the parts of that attributable
+        to live proxies (by internal name, see ``_proxies``) and to mlabwrap's
+        temporaries respectively, and ``'total'`` is the sum of everything.
+
+        The whole report is fetched from matlab in a single transfer."""
+        self._enter()
+        try:
+            whos, report = self._tmp_name("TMP_WHOS"), self._tmp_name("TMP_WHOS_STR")
+            self._eval("%(w)s = whos; %(w)s = [{%(w)s.name}; num2cell([%(w)s.bytes])];"
+                       "%(s)s = sprintf('%%s %%d\\n', %(w)s{:}); clear %(w)s;"
+                       % dict(w=whos, s=report))
+            self._forget([whos])
+            sizes = {}
+            for line in self._get(report, remove=True).splitlines():
+                name, nbytes = line.split()
+                sizes[name] = int(nbytes)
+        finally:
+            self._leave()
+        return {'total': sum(sizes.values()),
+                'variables': sizes,
+                'proxies': dict([(name, nbytes) for (name, nbytes) in sizes.items()
+                                 if name in self._proxies]),
+                'temporaries': dict([(name, nbytes) for (name, nbytes) in sizes.items()
+                                     if _TEMP_NAME_RE.match(name)
+                                     and name not in self._proxies])}
     def _format_struct(self, varname):
         res = []
         fieldnames = self._do("fieldnames(%s)" % varname)
@@ -429,12 +1306,35 @@ class MlabWrap(object):
 ##         return "\n".join(["%*s: %s" % (maxlen, (`fv`,`fv`[:20] + '...')[len(`fv`) > 23])
 ##                                        for fv in fieldvalues])
 
+    def _probe(self, expr):
+        r"""Returns the metadata of the value of the matlab expression `expr`
+        (fetched in one go): a dict with its ``class``, size (``dims``),
+        ``fields`` (for structs and objects) and whether it is ``sparse`` and
+        a ``handle`` object."""
+        tmp_name = self._tmp_name("TMP_META")
+        self._eval("%(t)s = struct('class', class(%(x)s), 'dims', size(%(x)s),"
+                   " 'sparse', issparse(%(x)s), 'handle', isa(%(x)s, 'handle'),"
+                   " 'fields', {{}});"
+                   "if isstruct(%(x)s) || isobject(%(x)s),"
+                   " %(t)s.fields = fieldnames(%(x)s); end;" % dict(x=expr, t=tmp_name))
+        try:
+            meta = self._raw_get(tmp_name)
+        finally:
+            self._clear_vars([tmp_name])
+        meta['dims'] = tuple(numpy.ravel(meta['dims']).astype(int))
+        meta['sparse'] = bool(numpy.ravel(meta['sparse'])[0])
+        meta['handle'] = bool(numpy.ravel(meta['handle'])[0])
+        return meta
+    def _meta_type(self, meta):
+        """The type (as returned by `_var_type`) for the `_probe`\ d `meta`."""
+        return meta['class'] + ('', '-sparse')[meta['sparse']]
     def _var_type(self, varname):
-        mlabraw.eval(self._session,
-                     "TMP_CLS__ = class(%(x)s); if issparse(%(x)s),"
-                     "TMP_CLS__ = [TMP_CLS__,'-sparse']; end;" % dict(x=varname))
-        res_type = mlabraw.get(self._session, "TMP_CLS__")
-        mlabraw.eval(self._session, "clear TMP_CLS__;") # unlikely to need try/finally to ensure clear
+        tmp_name = self._tmp_name("TMP_CLS")
+        self._eval(
+            "%(t)s = class(%(x)s); if issparse(%(x)s),"
+            "%(t)s = [%(t)s,'-sparse']; end;" % dict(x=varname, t=tmp_name))
+        res_type = self._raw_get(tmp_name)
+        self._clear_vars([tmp_name]) # if this fails the temp gets swept eventually
         return res_type
 
     def _make_proxy(self, varname, parent=None, constructor=MlabObjectProxy):
@@ -442,47 +1342,187 @@ class MlabWrap(object):
 
         XXX create and cache nested proxies also here.
         """
-        # FIXME why not just use gensym here?
-        proxy_val_name = "PROXY_VAL%d__" % self._proxy_count
-        self._proxy_count += 1
-        mlabraw.eval(self._session, "%s = %s;" % (proxy_val_name, varname))
-        res = constructor(self, proxy_val_name, parent)
-        self._proxies[proxy_val_name] = res
+        proxy_id = self._proxies.reserve()
+        try:
+            # the metadata is probed on demand (see `MlabObjectProxy._meta`)
+            self._eval("%s = %s;" % (_ProxyTable.name(proxy_id), varname))
+            res = constructor(self, proxy_id, parent)
+        except:
+            self._proxies.release(proxy_id)
+            raise
+        # from here on, the proxy releases its id itself
+        self._proxies.set(proxy_id, res)
         return res
 
+    def _has_byte_streams(self):
+        """Whether matlab can (de)serialize values in memory."""
+        if self._byte_streams is None:
+            self._byte_streams = bool(numpy.ravel(
+                self._do("exist('getByteStreamFromArray')"))[0])
+        return self._byte_streams
+    def _dump_proxies(self, proxies):
+        r"""Returns the states (as used for pickling) of all `proxies`, i.e.
+        serialized copies of their matlab values, fetched in one go.
+
+        Proxies of parts of matlab values (e.g. ``proxy.field``) can be
+        dumped, too; they are loaded as root proxies of a copy of the part.
+        Unless matlab lacks in-memory serialization, no temporary files are
+        involved. See `_load_proxies`."""
+        if not proxies: return []
+        if not self._has_byte_streams():
+            return [self._dump_to_mat_file(proxy) for proxy in proxies]
+        tmp_name = self._tmp_name("TMP_PICKLE")
+        self._enter()
+        try:
+            try:
+                self._eval("%(tmp)s = cellfun(@(x) reshape(getByteStreamFromArray(x), 1, []),"
+                           " {%(names)s}, 'UniformOutput', false);"
+                           "%(tmp)s = struct('sizes', cellfun(@numel, %(tmp)s),"
+                           " 'bytes', [%(tmp)s{:}]);"
+                           % dict(tmp=tmp_name,
+                                  names=", ".join([proxy._name for proxy in proxies])))
+                got = self._raw_get(tmp_name)
+            finally:
+                self._clear_vars([tmp_name])
+        finally:
+            self._leave()
+        data = got['bytes'].tostring()
+        states, offset = [], 0
+        for proxy, size in zip(proxies, numpy.ravel(got['sizes']).astype(int)):
+            states.append({'mlab_bytes': data[offset:offset+size], 'name': proxy._name})
+            offset += size
+        return states
+    def _dump_to_mat_file(self, proxy):
+        tmp_name = self._tmp_name("TMP_PICKLE")
+        tmp_filename = os.path.join(gettempdir(), "mlab_pickle_%s.mat" % tmp_name)
+        self._enter()
+        try:
+            try:
+                self._eval("%s = %s; save('%s', '%s');" % (
+                    tmp_name, proxy._name, tmp_filename, tmp_name))
+                mlab_contents = slurp(tmp_filename, binary=1)
+            finally:
+                self._clear_vars([tmp_name])
+                if os.path.exists(tmp_filename): os.remove(tmp_filename)
+        finally:
+            self._leave()
+        return {'mlab_contents' : mlab_contents, 'name': tmp_name}
+    def _loads(self, string):
+        """Like ``cPickle.loads``, but proxies are unpickled into this
+        session (rather than into that of `mlab`)."""
+        import cPickle
+        outer, _unpickling.mlabwrap = getattr(_unpickling, 'mlabwrap', None), self
+        try:
+            return cPickle.loads(string)
+        finally:
+            _unpickling.mlabwrap = outer
+    def _load_proxies(self, states, instances=None):
+        r"""Returns proxies for the values serialized in `states` (as returned
+        by `_dump_proxies`), transferred in one go.
+
+        If given, the (uninitialized) proxy `instances` are initialized
+        instead of creating new ones."""
+        if not states: return []
+        if instances is None: instances = [None] * len(states)
+        ids = [self._proxies.reserve() for state in states]
+        names = map(_ProxyTable.name, ids)
+        cmds, tmp_filenames, data = [], [], []
+        tmp_name = self._tmp_name("TMP_UNPICKLE")
+        self._enter()
+        try:
+            try:
+                try:
+                    offset = 0
+                    for name, state in zip(names, states):
+                        if 'mlab_bytes' in state:
+                            size = len(state['mlab_bytes'])
+                            cmds.append("%s = getArrayFromByteStream(%s(%d:%d)');" % (
+                                name, tmp_name, offset + 1, offset + size))
+                            data.append(state['mlab_bytes'])
+                            offset += size
+                        else: # a .mat file
+                            tmp_filenames.append(strToTempfile(
+                                state['mlab_contents'], suffix='.mat', binary=1))
+                            cmds.append("%s = load('%s', '%s'); %s = %s.%s;" % (
+                                name, tmp_filenames[-1], state['name'],
+                                name, name, state['name']))
+                    if data:
+                        self._raw_put(tmp_name, numpy.fromstring("".join(data), numpy.uint8),
+                                      native=True)
+                    self._eval("".join(cmds))
+                finally:
+                    if data: self._clear_vars([tmp_name])
+                    else:    self._forget([tmp_name])
+                    for tmp_filename in tmp_filenames:
+                        if os.path.exists(tmp_filename): os.remove(tmp_filename)
+            except:
+                for proxy_id in ids:
+                    self._proxies.release(proxy_id)
+                raise
+            # register the proxies before `_leave` can sweep their values
+            proxies = []
+            for proxy_id, instance in zip(ids, instances):
+                if instance is None:
+                    instance = MlabObjectProxy(self, proxy_id)
+                else:
+                    instance.__init__(self, proxy_id)
+                self._proxies.set(proxy_id, instance)
+                proxies.append(instance)
+            return proxies
+        finally:
+            self._leave()
+
     def _get_cell(self, varname):
         # XXX can currently only handle ``{}`` and 1D cells
-        mlabraw.eval(self._session,
-                   "TMP_SIZE_INFO__ = \
+        tmp_name = self._tmp_name("TMP_SIZE_INFO")
+        self._eval(
+                   "%(tn)s = \
                    [all(size(%(vn)s) == 0), \
                     min(size(%(vn)s)) == 1 & ndims(%(vn)s) == 2, \
-                    max(size(%(vn)s))];" % {'vn':varname})
-        is_empty, is_rank1, cell_len = map(int,
-                                           self._get("TMP_SIZE_INFO__", remove=True).flat)
+                    max(size(%(vn)s)), iscellstr(%(vn)s)];" % {'vn':varname, 'tn':tmp_name})
+        is_empty, is_rank1, cell_len, is_cellstr = map(int,
+                                           self._get(tmp_name, remove=True).flat)
         if is_empty:
             return []
-        elif is_rank1:
-            cell_bits = (["TMP%i%s__" % (i, gensym('_'))
-                           for i in range(cell_len)])
-            mlabraw.eval(self._session, '[%s] = deal(%s{:});' %
+        elif is_rank1 and is_cellstr:
+            # mlabraw converts these in one go (unless there are e.g.
+            # multi-row strings in there)
+            try:
+                return self._raw_get(varname)
+            except TypeError: pass
+        if is_rank1:
+            cell_bits = [self._tmp_name("TMP%i_" % i) for i in range(cell_len)]
+            self._eval('[%s] = deal(%s{:});' %
                        (",".join(cell_bits), varname))
             # !!! this recursive call means we have to take care with
             # overwriting temps!!!
             return self._get_values(cell_bits)
         else:
             raise MlabConversionError("Not a 1D cell array")
+    def _get_cellstr(self, expr):
+        """Returns the strings in ``cellstr(expr)`` (transferred in one go)."""
+        tmp_name = self._tmp_name("TMP_CELLSTR")
+        try:
+            try:
+                self._eval("%s = cellstr(%s);" % (tmp_name, expr))
+                return self._raw_get(tmp_name)
+            except (mlabraw.error, TypeError), msg: # e.g. missing or 2D strings
+                raise MlabConversionError(str(msg))
+        finally:
+            self._clear_vars([tmp_name])
     def _manually_convert(self, varname, vartype):
         if vartype == 'cell':
             return self._get_cell(varname)
+        elif vartype == 'string':
+            strings = self._get_cellstr(varname)
+            # string scalars are really 1x1 string arrays
+            if len(strings) == 1: return strings[0]
+            return strings
 
 
     def _get_values(self, varnames):
         if not varnames: raise ValueError("No varnames") #to prevent clear('')
-        res = []
-        for varname in varnames:
-            res.append(self._get(varname))
-        mlabraw.eval(self._session, "clear('%s');" % "','".join(varnames)) #FIXME wrap try/finally?
-        return res
+        return self._get_many(varnames, remove=True)
 
     def _do(self, cmd, *args, **kwargs):
         """Semi-raw execution of a matlab command.
@@ -506,13 +1546,53 @@ class MlabWrap(object):
         ``cast`` specifies which typecast should be applied to the result
         (e.g. `int`), it defaults to none.
 
+        ``timeout`` (default: ``self._timeout``) is the number of seconds after
+        which a call that hasn't finished yet is interrupted and a
+        `MlabTimeoutError` raised. If matlab doesn't react to the interrupt,
+        the engine process is killed and the session transparently restarted
+        (which invalidates all existing proxies). The time only starts once
+        the call has the engine to itself: a timed call holds ``_lock``
+        throughout, so calls from other threads wait for it to finish.
+
         XXX: should we add ``parens`` parameter?
         """
+        self._enter()
+        try:
+            timeout = kwargs.get('timeout', self._timeout)
+            if timeout is None:
+                return self._do_untimed(cmd, *args, **kwargs)
+            # the engine is held for the whole call, so that the deadline
+            # only covers this call's own engine operations (and the
+            # watchdog never interrupts those of other threads)
+            self._lock.acquire()
+            try:
+                session = self._session
+                watchdog = _Watchdog(self, timeout)
+                outer, self._watchdog = self._watchdog, watchdog
+                watchdog.start()
+                try:
+                    try:
+                        return self._do_untimed(cmd, *args, **kwargs)
+                    except mlabraw.error:
+                        if not watchdog.expired: raise
+                finally:
+                    watchdog.stop()
+                    self._watchdog = outer
+                self._count('timeouts')
+                if watchdog.killed:
+                    self._restart_session(session)
+                raise MlabTimeoutError("%r didn't finish within %s seconds" % (cmd, timeout))
+            finally:
+                self._lock.release()
+        finally:
+            self._leave()
+
+    def _do_untimed(self, cmd, *args, **kwargs):
         handle_out = kwargs.get('handle_out', _flush_write_stdout)
         #self._session = self._session or mlabraw.open()
         # HACK
         if self._autosync_dirs:
-            mlabraw.eval(self._session,  "cd('%s');" % os.getcwd().replace("'", "''"))
+            self._eval("cd('%s');" % os.getcwd().replace("'", "''"))
         nout =  kwargs.get('nout', 1)
         #XXX what to do with matlab screen output
         argnames = []
@@ -522,7 +1602,10 @@ class MlabWrap(object):
                 if isinstance(arg, MlabObjectProxy):
                     argnames.append(arg._name)
                 else:
-                    nextName = 'arg%d__' % count
+                    if self._clear_call_args:
+                        nextName = self._tmp_name('arg%d_' % count)
+                    else:
+                        nextName = 'arg%d__' % count
                     argnames.append(nextName)
                     tempargs.append(nextName)
                     # have to convert these by hand
@@ -531,7 +1614,7 @@ class MlabWrap(object):
     ##                 except TypeError:
     ##                     raise TypeError("Illegal argument type (%s.:) for %d. argument" %
     ##                                     (type(arg), type(count)))
-                    mlabraw.put(self._session,  argnames[-1], arg)
+                    self._raw_put(argnames[-1], arg)
 
             if args:
                 cmd = "%s(%s)%s" % (cmd, ", ".join(argnames),
@@ -539,11 +1622,11 @@ class MlabWrap(object):
             # got three cases for nout:
             # 0 -> None, 1 -> val, >1 -> [val1, val2, ...]
             if nout == 0:
-                handle_out(mlabraw.eval(self._session, cmd))
+                handle_out(self._eval(cmd))
                 return
             # deal with matlab-style multiple value return
-            resSL = ((["RES%d__" % i for i in range(nout)]))
-            handle_out(mlabraw.eval(self._session, '[%s]=%s;' % (", ".join(resSL), cmd)))
+            resSL = [self._tmp_name("RES%d_" % i) for i in range(nout)]
+            handle_out(self._eval('[%s]=%s;' % (", ".join(resSL), cmd)))
             res = self._get_values(resSL)
 
             if nout == 1: res = res[0]
@@ -555,41 +1638,145 @@ class MlabWrap(object):
                 return res
         finally:
             if len(tempargs) and self._clear_call_args:
-                mlabraw.eval(self._session, "clear('%s');" %
-                             "','".join(tempargs))
+                self._clear_vars(tempargs)
     # this is really raw, no conversion of [[]] -> [], whatever
     def _get(self, name, remove=False):
         r"""Directly access a variable in matlab space. 
 
         This should normally not be used by user code."""
         # FIXME should this really be needed in normal operation?
-        if name in self._proxies: return self._proxies[name]
+        try:
+            return self._proxies[name]
+        except KeyError: pass
         varname = name
-        vartype = self._var_type(varname)
-        if vartype in self._mlabraw_can_convert:
-            var = mlabraw.get(self._session, varname)
-            if isinstance(var, ndarray):
-                if self._flatten_row_vecs and numpy.shape(var)[0] == 1:
-                    var.shape = var.shape[1:2]
-                elif self._flatten_col_vecs and numpy.shape(var)[1] == 1:
-                    var.shape = var.shape[0:1]
-                if self._array_cast:
-                    var = self._array_cast(var)
+        self._enter()
+        try:
+            vartype = self._var_type(varname)
+            if vartype in self._mlabraw_can_convert:
+                var = self._postprocess(self._raw_get(varname, self._zero_copy))
+            else:
+                var = None
+                if self._dont_proxy.get(vartype):
+                    # manual conversions may fail (e.g. for multidimensional
+                    # cell arrays), in that case just fall back on proxying.
+                    try:
+                        var = self._manually_convert(varname, vartype)
+                    except MlabConversionError: pass
+                if var is None:
+                    # we can't convert this to a python object, so we just
+                    # create a proxy, and don't delete the real matlab
+                    # reference until the proxy is garbage collected
+                    var = self._make_proxy(varname)
+            if remove:
+                self._clear_vars([varname])
+            return var
+        finally:
+            self._leave()
+
+    def _fetch(self, name_or_proxy, paths):
+        r"""Returns a dict mapping each of the `paths` (e.g. ``'a.b'``,
+        ``'c{3}'`` or ``'(2).x'``) to the corresponding part of the matlab
+        value `name_or_proxy`, all fetched in a single transfer.
+
+        Parts are converted just like by ``proxy.a.b`` etc., i.e. those that
+        can't be converted to python come back as proxies, but this needs a
+        lot fewer engine calls than walking the paths one by one::
+
+          >>> mlab._fetch(s, ['a.b', 'c{3}', 'meta.size'])
+          {'a.b': array([[ 1.]]), 'c{3}': 'foo', 'meta.size': array([[ 3.,  4.]])}
+        """
+        if isinstance(name_or_proxy, MlabObjectProxy):
+            root = name_or_proxy._name
         else:
-            var = None
-            if self._dont_proxy.get(vartype):
-                # manual conversions may fail (e.g. for multidimensional
-                # cell arrays), in that case just fall back on proxying.
-                try:
-                    var = self._manually_convert(varname, vartype)
-                except MlabConversionError: pass
-            if var is None:
-                # we can't convert this to a python object, so we just
-                # create a proxy, and don't delete the real matlab
-                # reference until the proxy is garbage collected
-                var = self._make_proxy(varname)
-        if remove:
-            mlabraw.eval(self._session, "clear('%s');" % varname)
+            root = name_or_proxy
+        def full(path):
+            if not path or path[0] in '({': return root + path
+            return "%s.%s" % (root, path)
+        if not paths: return {}
+        self._enter()
+        try:
+            res = {}
+            for path, (ok, value) in zip(paths, self._fetch_exprs(map(full, paths))):
+                if ok:
+                    res[path] = value
+                elif isinstance(name_or_proxy, MlabObjectProxy):
+                    res[path] = type(name_or_proxy)(self, full(path), name_or_proxy)
+                else:
+                    res[path] = self._make_proxy(full(path))
+            return res
+        finally:
+            self._leave()
+    def _fetch_exprs(self, exprs):
+        r"""Evaluates the matlab expressions `exprs` and returns a list of
+        ``(True, value)`` pairs for the values that can be converted directly
+        (see `_mlabraw_can_convert`) and ``(False, None)`` for the others,
+        fetching all in a single transfer."""
+        fetch_names = [self._tmp_name(prefix)
+                       for prefix in ("TMP_FETCH", "TMP_NAMES", "TMP_KEEP")]
+        try:
+            self._eval(self._fetch_cmd(exprs, fetch_names))
+            got = self._raw_get(fetch_names[0], self._zero_copy)
+        finally:
+            self._clear_vars(fetch_names)
+        return self._fetched(got)
+    def _fetch_cmd(self, exprs, fetch_names):
+        """The matlab code that packs the values of `exprs` into the first of
+        the three temporaries `fetch_names`, to be converted by `_fetched`."""
+        tmp_name, names_name, keep_name = fetch_names
+        convertible = "{%s}" % ", ".join(["'%s'" % t for t in self._mlabraw_can_convert])
+        return ("%(t)s = struct(); %(assignments)s"
+                "%(n)s = fieldnames(%(t)s);"
+                "%(k)s = structfun(@(v) any(strcmp(class(v), %(convertible)s))"
+                " && ~issparse(v), %(t)s);"
+                "%(t)s = struct('values', rmfield(%(t)s, %(n)s(~%(k)s)),"
+                " 'keep', %(k)s);"
+                % dict(t=tmp_name, n=names_name, k=keep_name,
+                       convertible=convertible,
+                       assignments="".join(["%s.f%d = %s;" % (tmp_name, i, expr)
+                                            for (i, expr) in enumerate(exprs)])))
+    def _fetched(self, got):
+        res = []
+        for i, keep in enumerate(numpy.ravel(got['keep'])):
+            if keep:
+                res.append((True, self._postprocess(got['values']['f%d' % i])))
+            else:
+                res.append((False, None))
+        return res
+
+    def _get_many(self, names, remove=False):
+        r"""Like `_get` for each of `names`, returning a list of the values;
+        but all values that can be converted directly are fetched in a single
+        transfer (only the others, e.g. those that get proxied, need more
+        engine calls)."""
+        names = list(names)
+        self._enter()
+        try:
+            fetched = {}
+            # proxy values are returned as they are, see `_get`
+            todo = [name for name in names if name not in self._proxies]
+            if todo:
+                for name, (ok, value) in zip(todo, self._fetch_exprs(todo)):
+                    if ok: fetched[name] = value
+            res = []
+            for name in names:
+                if name in fetched: res.append(fetched[name])
+                else:               res.append(self._get(name))
+            if remove and names:
+                self._clear_vars(names)
+            return res
+        finally:
+            self._leave()
+
+    def _postprocess(self, var):
+        """Flattens and casts arrays as configured (see ``_flatten_row_vecs``
+        etc.)."""
+        if isinstance(var, ndarray):
+            if self._flatten_row_vecs and numpy.shape(var)[0] == 1:
+                var.shape = var.shape[1:2]
+            elif self._flatten_col_vecs and numpy.shape(var)[1] == 1:
+                var.shape = var.shape[0:1]
+            if self._array_cast:
+                var = self._array_cast(var)
         return var
 
     def _set(self, name, value):
@@ -597,16 +1784,415 @@ class MlabWrap(object):
         
         This should normally not be used in user code."""
         if isinstance(value, MlabObjectProxy):
-            mlabraw.eval(self._session, "%s = %s;" % (name, value._name))
+            self._eval("%s = %s;" % (name, value._name))
         else:
-##             mlabraw.put(self._session, name, self._as_mlabable_type(value))
-            mlabraw.put(self._session, name, value)
+##             self._raw_put(name, self._as_mlabable_type(value))
+            self._raw_put(name, value)
+
+    def _set_many(self, values):
+        r"""Set several variables in matlab space at once: `values` maps the
+        names to the values (as for `_set`), which are transferred together.
+
+        This should normally not be used in user code."""
+        proxied = [(name, value) for (name, value) in values.items()
+                   if isinstance(value, MlabObjectProxy)]
+        others = dict([(name, value) for (name, value) in values.items()
+                       if not isinstance(value, MlabObjectProxy)])
+        if others:
+            self._raw_put_many(others)
+        if proxied:
+            self._eval("".join(["%s = %s;" % (name, value._name)
+                                for (name, value) in proxied]))
+
+    def _sync(self, name, value):
+        r"""Set the variable `name` in matlab space to (a double array copy
+        of) `value` and return a `MlabSyncedArray` that can keep it up to date
+        incrementally."""
+        return MlabSyncedArray(self, name, value)
+
+    def _set_table(self, name, frame):
+        r"""Set the variable `name` in matlab space to a ``table`` holding the
+        columns of the pandas DataFrame `frame`.
+
+        All columns are transferred in one go (as a struct of columns) and
+        numeric and boolean columns keep their type (bool becomes logical);
+        columns of strings become cellstrs. The index is ignored."""
+        columns, names = {}, []
+        for i, col in enumerate(frame.columns):
+            values = frame.iloc[:, i].values
+            if values.dtype.kind == 'O':
+                values = list(values)
+                if [v for v in values if not isString(v)]:
+                    raise TypeError("Column %r: only columns of strings are "
+                                    "supported, not arbitrary objects" % (col,))
+            elif values.dtype.kind not in 'biufc':
+                raise TypeError("Column %r: unsupported type %s" % (col, values.dtype))
+            columns['c%05d' % i] = values
+            if not isString(col): col = str(col)
+            names.append(col)
+        if not names: # an empty struct and name list don't make a table
+            self._eval("%s = array2table(zeros(%d, 0));" % (name, len(frame)))
+            return
+        tmp_name = self._tmp_name("TMP_TABLE")
+        self._enter()
+        try:
+            try:
+                self._raw_put(tmp_name, {'data': columns, 'names': names}, native=True)
+                # orderfields, since dicts don't keep the column order
+                self._eval("%(name)s = struct2table(orderfields(structfun("
+                           "@(c) c(:), %(tmp)s.data, 'UniformOutput', false)));"
+                           "%(name)s.Properties.VariableNames = %(tmp)s.names;"
+                           % dict(name=name, tmp=tmp_name))
+            finally:
+                self._clear_vars([tmp_name])
+        finally:
+            self._leave()
+
+    def _get_table(self, name_or_proxy):
+        r"""Return the matlab ``table`` `name_or_proxy` as a pandas DataFrame.
+
+        The inverse of `_set_table`: all variables of the table are fetched
+        in a single transfer and numeric and logical columns keep their type;
+        cellstr, string and categorical columns become columns of strings.
+        Only single-column variables are supported."""
+        import pandas
+        if isinstance(name_or_proxy, MlabObjectProxy):
+            varname = name_or_proxy._name
+        else:
+            varname = name_or_proxy
+        tmp_name, i_name = self._tmp_name("TMP_TABLE"), self._tmp_name("TMP_I")
+        self._enter()
+        try:
+            try:
+                self._eval("%(tmp)s = struct('names', {%(var)s.Properties.VariableNames},"
+                           " 'data', struct(), 'v', []);"
+                           "for %(i)s=1:numel(%(tmp)s.names),"
+                           " %(tmp)s.v = %(var)s.(%(tmp)s.names{%(i)s});"
+                           " if isa(%(tmp)s.v, 'string') || iscategorical(%(tmp)s.v),"
+                           " %(tmp)s.v = cellstr(%(tmp)s.v); end;"
+                           " %(tmp)s.data.(sprintf('c%%05d', %(i)s-1)) = %(tmp)s.v;"
+                           "end;"
+                           "%(tmp)s = rmfield(%(tmp)s, 'v');"
+                           % dict(tmp=tmp_name, var=varname, i=i_name))
+                try:
+                    got = self._raw_get(tmp_name)
+                except TypeError, msg: # e.g. datetime or cell columns
+                    raise MlabConversionError(str(msg))
+            finally:
+                self._clear_vars([tmp_name, i_name])
+        finally:
+            self._leave()
+        names = got['names']
+        columns = {}
+        for i, col in enumerate(names):
+            values = got['data']['c%05d' % i]
+            if isString(values): # a one-row char column
+                values = [values]
+            elif isinstance(values, ndarray):
+                if values.ndim != 2 or values.shape[1] != 1:
+                    raise MlabConversionError(
+                        "Table variable %r has more than one column" % (col,))
+                values = values[:,0]
+            columns[col] = values
+        return pandas.DataFrame(columns, columns=names)
+
+    def _chunk_subscript(self, varname, ndims, axis, start, stop):
+        subs = [':'] * ndims
+        subs[axis] = '%d:%d' % (start + 1, stop)
+        return "%s(%s)" % (varname, ",".join(subs))
+
+    def _iter_chunks(self, name_or_proxy, axis=0, chunk=1024, prefetch=False):
+        r"""Iterate over the matlab variable (or proxy) `name_or_proxy` in
+        blocks of at most `chunk` slices along `axis`.
+
+        Only one block at a time is transferred across the bridge, so even
+        huge matlab results can be consumed with bounded memory::
+
+          for block in mlab._iter_chunks('bigresult', axis=1, chunk=10000):
+              process(block)
+
+        If `prefetch` is true, the next block is fetched by a background
+        thread whilst the current one is being processed.
+
+        Note that, as usual, blocks are returned as (at least) 2D arrays."""
+        if isinstance(name_or_proxy, MlabObjectProxy):
+            varname = name_or_proxy._name
+        else:
+            varname = name_or_proxy
+        if chunk < 1: raise ValueError("chunk must be positive, not %r" % chunk)
+        dims = [int(d) for d in numpy.ravel(self._do("size(%s)" % varname))]
+        if axis < 0: axis += len(dims)
+        if not 0 <= axis < len(dims):
+            raise ValueError("Illegal axis %r for %d-D matlab variable %r" % (
+                axis, len(dims), varname))
+        bounds = [(start, min(start + chunk, dims[axis]))
+                  for start in range(0, dims[axis], chunk)]
+        def fetch(start, stop):
+            self._enter()
+            try:
+                tmp_name = self._tmp_name("TMP_CHUNK")
+                self._eval("%s = %s;" % (
+                    tmp_name, self._chunk_subscript(varname, len(dims), axis, start, stop)))
+                return self._get(tmp_name, remove=True)
+            finally:
+                self._leave()
+        if not prefetch:
+            for start, stop in bounds:
+                yield fetch(start, stop)
+            return
+        import threading, Queue
+        blocks = Queue.Queue(1)
+        done = threading.Event()
+        def hand_over(item):
+            # don't block forever if the consumer has gone away
+            while not done.isSet():
+                try:
+                    blocks.put(item, True, 0.1)
+                    return True
+                except Queue.Full: pass
+            return False
+        def worker():
+            try:
+                for start, stop in bounds:
+                    if not hand_over((fetch(start, stop), None)): return
+            except Exception:
+                hand_over((None, sys.exc_info()))
+        fetcher = threading.Thread(target=worker)
+        fetcher.setDaemon(True)
+        fetcher.start()
+        try:
+            for i in range(len(bounds)):
+                block, exc_info = blocks.get()
+                if exc_info: raise exc_info[0], exc_info[1], exc_info[2]
+                yield block
+        finally:
+            done.set()
+            fetcher.join()
+
+    def _vmap(self, fname, batch, *args, **kwargs):
+        r"""Apply the matlab function `fname` to every slice of `batch` along
+        ``axis`` (default 0), i.e. compute the equivalent of::
+
+          numpy.array([mlab.fname(x, *args) for x in batch])
+
+        but with a constant number of round trips instead of one per slice:
+        `batch` (an array or a list of equally shaped arrays) is transferred
+        in one go, matlab loops over the slices and the (equally shaped)
+        results come back stacked along a new leading axis. The extra `args`
+        are passed unchanged to every call. Instead of a function name,
+        `fname` can also be a matlab expression evaluating to a function handle
+        (e.g. ``'@(x) x.^2'``).
+
+        ``nout`` (default 1) works as for `_do`; ``timeout`` and
+        ``handle_out`` apply to the whole batch."""
+        axis = kwargs.get('axis', 0)
+        nout = kwargs.get('nout', 1)
+        if nout < 1: raise ValueError("nout must be positive, not %r" % nout)
+        batch = numpy.asarray(batch)
+        if batch.dtype == object:
+            raise TypeError("Can't map over a batch of %r" % type(batch.flat[0]))
+        if axis < 0: axis += batch.ndim
+        if not 0 <= axis < batch.ndim:
+            raise ValueError("Illegal axis %r for %d-D batch" % (axis, batch.ndim))
+        n = batch.shape[axis]
+        if not n: raise ValueError("Can't map over an empty batch")
+        # the mapped axis goes last, so that slice k is just ``X(:,...,:,k)``
+        batch = numpy.rollaxis(batch, axis, batch.ndim)
+        self._enter()
+        try:
+            xname, k = self._tmp_name("TMP_VMAP_X"), self._tmp_name("TMP_VMAP_K")
+            argnames = []
+            tempargs = [xname, k]
+            self._raw_put(xname, batch)
+            for count, arg in enumerate(args):
+                if isinstance(arg, MlabObjectProxy):
+                    argnames.append(arg._name)
+                else:
+                    argnames.append(self._tmp_name('arg%d_' % (count + 1)))
+                    tempargs.append(argnames[-1])
+                    self._raw_put(argnames[-1], arg)
+            if re.match(r'^[A-Za-z]\w*$', fname):
+                func = fname
+            else:
+                func = self._tmp_name("TMP_VMAP_F")
+                tempargs.append(func)
+                self._eval("%s = %s;" % (func, fname))
+            x_k = "%s(%s)" % (xname, ",".join([':'] * (batch.ndim - 1) + [k]))
+            resSL = [self._tmp_name("RES%d_" % i) for i in range(nout)]
+            sizeSL = [self._tmp_name("TMP_VMAP_SIZE") for i in range(nout)]
+            code = ["%s = cell(1,%d);" % (res, n) for res in resSL]
+            code.append("for %s = 1:%d, [%s] = %s(%s); end;" % (
+                k, n, ",".join(["%s{%s}" % (res, k) for res in resSL]),
+                func, ", ".join([x_k] + argnames)))
+            for res, size in zip(resSL, sizeSL):
+                code.append("%(s)s = size(%(r)s{1}); %(r)s = cat(numel(%(s)s)+1, %(r)s{:});"
+                            " %(r)s = permute(%(r)s, [numel(%(s)s)+1, 1:numel(%(s)s)]);"
+                            % dict(r=res, s=size))
+            try:
+                self._do(" ".join(code), nout=0, **dict([(key, kwargs[key])
+                                                        for key in ('timeout', 'handle_out')
+                                                        if kwargs.has_key(key)]))
+            finally:
+                self._clear_vars(tempargs)
+            values = self._get_values(resSL + sizeSL)
+        finally:
+            self._leave()
+        res = []
+        for stacked, size in zip(values[:nout], values[nout:]):
+            if isinstance(stacked, ndarray):
+                stacked = numpy.reshape(stacked, (n,) + tuple(map(int, numpy.ravel(size))))
+            res.append(stacked)
+        if nout == 1: return res[0]
+        else:         return tuple(res)
+
+    def _block_slices(self, shape, block_shape):
+        """Returns the index tuples for all blocks of `block_shape` tiling an
+        array of `shape` (in C order)."""
+        block_shape = tuple(block_shape) + tuple(shape[len(block_shape):])
+        if len(block_shape) != len(shape) or [b for b in block_shape if b < 1]:
+            raise ValueError("Illegal block shape %r for array of shape %r" % (
+                block_shape, shape))
+        res = [()]
+        for n, b in zip(shape, block_shape):
+            res = [index + (slice(start, min(start + b, n)),)
+                   for index in res for start in range(0, n, b)]
+        return res
+
+    def _map_blocks(self, fname, array, block_shape, *args, **kwargs):
+        r"""Apply the matlab function `fname` block by block to `array` (which
+        can be e.g. a `numpy.memmap`), for arrays too big to be sent to matlab
+        in one go::
+
+          mlab._map_blocks('medfilt2', huge, (1000, 1000), [3, 3], out='res.dat')
+
+        `fname` must map each block to a result of the same shape (extra
+        `args` are passed unchanged to every call). The results are written
+        into ``out``, which is either a preallocated array, a filename (for a
+        fresh `numpy.memmap` of doubles) or `None` (the default, a fresh array
+        of doubles) and returned.
+
+        Only two blocks are in flight at any time, so memory use stays bounded:
+        whilst matlab works on a block, the next one is cut out of `array` by
+        one thread and the previous result written to ``out`` by another
+        (engine calls release the GIL). ``timeout`` and ``handle_out`` apply to
+        each block."""
+        import Queue
+        array = numpy.asarray(array)
+        out = kwargs.get('out')
+        if out is None:
+            out = numpy.empty(array.shape, 'd')
+        elif isString(out):
+            out = numpy.memmap(out, dtype='d', mode='w+', shape=array.shape)
+        if numpy.shape(out) != array.shape:
+            raise ValueError("out has shape %r, but array has shape %r" % (
+                numpy.shape(out), array.shape))
+        do_kwargs = dict([(key, kwargs[key]) for key in ('timeout', 'handle_out')
+                          if kwargs.has_key(key)])
+        blocks, results = Queue.Queue(2), Queue.Queue(2)
+        done = threading.Event()
+        errors = []
+        def hand_over(item):
+            # don't block forever if the engine loop has given up
+            while not done.isSet():
+                try:
+                    blocks.put(item, True, 0.1)
+                    return True
+                except Queue.Full: pass
+            return False
+        def cut():
+            try:
+                for index in self._block_slices(array.shape, block_shape):
+                    if not hand_over((index, numpy.array(array[index]), None)): return
+                hand_over(None)
+            except Exception:
+                hand_over((None, None, sys.exc_info()))
+        def assemble():
+            while True:
+                item = results.get()
+                if item is None: return
+                if errors: continue # just drain
+                index, res = item
+                try:
+                    out[index] = res
+                except Exception:
+                    errors.append(sys.exc_info())
+        cutter = threading.Thread(target=cut)
+        assembler = threading.Thread(target=assemble)
+        for t in cutter, assembler:
+            t.setDaemon(True)
+            t.start()
+        try:
+            while not errors:
+                item = blocks.get()
+                if item is None: break
+                index, block, exc_info = item
+                if exc_info: raise exc_info[0], exc_info[1], exc_info[2]
+                res = numpy.asarray(self._do(fname, block, *args, **do_kwargs))
+                if res.size != block.size:
+                    raise ValueError("%s returned %d elements for a block of shape %r"
+                                     % (fname, res.size, block.shape))
+                results.put((index, res.reshape(block.shape)))
+        finally:
+            done.set()
+            results.put(None)
+            cutter.join()
+            assembler.join()
+        if errors: raise errors[0][0], errors[0][1], errors[0][2]
+        if hasattr(out, 'flush'): out.flush()
+        return out
+
+    def _compile(self, code, inputs=(), outputs=()):
+        r"""Returns a function that runs the matlab `code` (any number of
+        statements) with the variables `inputs` bound to its arguments and
+        returns the values of the variables `outputs` (like `_do`)::
+
+          >>> f = mlab._compile("y = a + b; z = y * c;", ['a', 'b', 'c'], ['y', 'z'])
+          >>> f(1, 2, c=3)
+          (array([[ 3.]]), array([[ 9.]]))
+
+        `code` is parsed only once. Each call transfers the arguments
+        together, runs all of `code` in a single ``eval`` and fetches the
+        outputs in a single transfer. Code too long for ``mlabraw.eval``
+        (about 4000 characters, see `_EVAL_LIMIT`) costs one more transfer: it
+        is put into the workspace as a string and run with matlab's ``eval``
+        (so it has no length limit). The inputs and outputs get unique
+        temporary names on each call, so calls from several threads don't
+        interfere; other variables assigned by `code` are left in the
+        workspace and shared, though."""
+        return MlabSnippet(self, code, list(inputs), list(outputs))
+
+    def _coalesce(self, key, fn, *args):
+        """Returns ``fn(*args)``, unless a call with the same `key` is already
+        in progress, in which case its result is returned (see
+        `_single_flight`)."""
+        self._lock.acquire()
+        try:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        finally:
+            self._lock.release()
+        if not leader:
+            self._count('coalesced')
+            return flight.wait()
+        try:
+            try:
+                flight.result = fn(*args)
+                return flight.result
+            except:
+                flight.exc_info = sys.exc_info()
+                raise
+        finally:
+            self._lock.acquire()
+            try:
+                del self._flights[key]
+            finally:
+                self._lock.release()
+            flight.done.set()
 
     def _make_mlab_command(self, name, nout, doc=None):
-        def mlab_command(*args, **kwargs):
-            return self._do(name, *args, **update({'nout':nout}, kwargs))
-        mlab_command.__doc__ = "\n" + doc
-        return mlab_command
+        return MlabCommand(self, name, nout, doc)
 
     # XXX this method needs some refactoring, but only after it is clear how
     # things should be done (e.g. what should be extracted from docstrings and
@@ -645,13 +2231,36 @@ class MlabWrap(object):
 mlab = MlabWrap()
 MlabError = mlabraw.error
 
+def init_worker(setup=None):
+    """Initializer for the worker processes of a process pool, e.g.
+    ``multiprocessing.Pool(4, init_worker, ("addpath('~/matlab');",))``.
+
+    Makes sure `mlab` has a session of its own in the worker process (a
+    forked worker would otherwise only get one on its first call) and
+    evaluates the matlab code `setup` in it. Commands such as ``mlab.sin`` can
+    then be sent to the workers like any other picklable function."""
+    import multiprocessing.util
+    mlab._check_fork()
+    # pool workers leave via ``os._exit``, which skips the `atexit` handlers
+    multiprocessing.util.Finalize(None, _close_open_sessions, exitpriority=0)
+    if setup:
+        mlab._do(setup, nout=0)
+
 def saveVarsInMat(filename, varNamesStr, outOf=None, **opts):
     """Hacky convinience function to dump a couple of python variables in a
        .mat file. See `awmstools.saveVars`.
+
+       Unless some of the variables are proxies, the file is written directly
+       (see `mlabmat.saveMat`), without a detour through the matlab session.
     """
     from mlabwrap import mlab
     filename, varnames, outOf = __saveVarsHelper(
         filename, varNamesStr, outOf, '.mat', **opts)
+    if not [v for v in varnames if isinstance(outOf[v], MlabObjectProxy)]:
+        # numeric values are cast to double, just as they would by `mlab._set`
+        saveMat(filename, dict([(v, outOf[v]) for v in varnames]),
+                cast_to_double=True)
+        return
     try:
         for varname in varnames:
             mlab._set(varname, outOf[varname])
@@ -660,7 +2269,8 @@ def saveVarsInMat(filename, varNamesStr, outOf=None, **opts):
         assert varnames
         mlab._do("clear('%s')" % "', '".join(varnames), nout=0)
 
-__all__ = ['mlab', 'saveVarsInMat', 'MlabWrap', 'MlabError']
+__all__ = ['mlab', 'saveVarsInMat', 'saveMat', 'loadMat', 'MlabWrap', 'MlabError',
+           'MlabTimeoutError', 'init_worker']
 
 # Uncomment the following line to make the `mlab` object a library so that
 # e.g. ``from mlabwrap.mlab import plot`` will work
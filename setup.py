@@ -11,10 +11,14 @@ __version__ = '1.1'
 ####################################################################
 MATLAB_COMMAND = 'matlab'   # specify a full path if not in PATH
 MATLAB_VERSION = None       # e.g: 6 (one of (6, 6.5, 7, 7.3))
-                            #      7.3 includes later versions as well
+                            #      7.3 includes later versions as well; write
+                            #      two-digit minor versions as '9.10' or (9, 10)
 MATLAB_DIR= None            # e.g: '/usr/local/matlab'; 'c:/matlab6'
 PLATFORM_DIR=None           # e.g: 'glnx86'; r'win32/microsoft/msvc60'
 EXTRA_COMPILE_ARGS=None     # e.g: ['-G']
+INTERLEAVED_COMPLEX=None    # use matlab's interleaved complex API (faster
+                            # transfer of complex arrays)? Needs matlab >= 9.4
+                            # (R2018a); by default used if available
 
 # hopefully these 3 won't need modification
 MATLAB_LIBRARIES=None       # e.g: ['eng', 'mx', 'mat', 'mi', 'ut']
@@ -77,6 +81,13 @@ if PYTHON_INCLUDE_DIR is None and not USE_NUMERIC:
         except ImportError:
             print >> sys.stderr, "CANNOT FIND EITHER NUMPY *OR* NUMERIC"
 
+def version_tuple(version):
+    """``(major, minor)`` for versions like ``7``, ``7.3``, ``'9.10'`` or
+    ``(9, 10)`` (so that 9.10 sorts after 9.4)."""
+    if isinstance(version, tuple): return version
+    match = re.match(r'(\d+)(?:\.(\d+))?', str(version))
+    return (int(match.group(1)), int(match.group(2) or 0))
+
 def matlab_params(cmd, is_windows, extra_args):
     param_fname = mktemp()
     # XXX I have no idea why '\n' instead of the ``%c...,10`` hack fails - bug
@@ -96,8 +107,7 @@ PLEASE MAKE SURE matlab IS IN YOUR PATH!
 ''' % (" ".join(cmd), error))
         fh = open(param_fname)
         ver, pth, platform = iter(fh)
-        return (float(re.match(r'\d+.\d+',ver).group()),
-                pth.rstrip(), platform.rstrip().lower())
+        return (version_tuple(ver), pth.rstrip(), platform.rstrip().lower())
     finally:
         if fh: fh.close()
         try:
@@ -132,6 +142,10 @@ if None in (MATLAB_VERSION, MATLAB_DIR, PLATFORM_DIR):
     MATLAB_VERSION = MATLAB_VERSION or queried_version
     MATLAB_DIR = MATLAB_DIR or queried_dir
     PLATFORM_DIR = PLATFORM_DIR or queried_platform_dir
+if MATLAB_VERSION == "WHATEVER": # not building: pass all the version checks
+    MATLAB_VERSION = (sys.maxint, 0)
+else:
+    MATLAB_VERSION = version_tuple(MATLAB_VERSION)
 if WINDOWS:
     WINDOWS=True
     EXTENSION_NAME = 'mlabraw'
@@ -141,17 +155,19 @@ if WINDOWS:
 else:
     EXTENSION_NAME = 'mlabrawmodule'
     if not MATLAB_LIBRARIES:
-        if MATLAB_VERSION >= 6.5:
+        if MATLAB_VERSION >= (6, 5):
             MATLAB_LIBRARIES = 'eng mx mat ut'.split()
         else:
             MATLAB_LIBRARIES = 'eng mx mat mi ut'.split()
-    CPP_LIBRARIES = ['stdc++'] #XXX strangely  only needed on some linuxes
+    CPP_LIBRARIES = ['stdc++', 'pthread'] #XXX strangely stdc++ only needed on some linuxes
     if sys.platform.startswith('sunos'):
         EXTRA_COMPILE_ARGS = EXTRA_COMPILE_ARGS or ['-G']
+    else: # so that the conversion loops get vectorized
+        EXTRA_COMPILE_ARGS = EXTRA_COMPILE_ARGS or ['-O3']
 
 
 
-if MATLAB_VERSION >= 7 and not WINDOWS:
+if MATLAB_VERSION >= (7, 0) and not WINDOWS:
     MATLAB_LIBRARY_DIRS = [MATLAB_DIR + "/bin/" + PLATFORM_DIR]
 else:
     MATLAB_LIBRARY_DIRS = [MATLAB_DIR + "/extern/lib/" + PLATFORM_DIR]
@@ -164,10 +180,15 @@ if WINDOWS:
         print "Not using Visual C++; fiddling paths for Borland C++ compatibility"
         MATLAB_LIBRARY_DIRS = [mld.replace('/','\\') for mld in  MATLAB_LIBRARY_DIRS]
 DEFINE_MACROS=[]
-if MATLAB_VERSION >= 6.5:
+if MATLAB_VERSION >= (6, 5):
     DEFINE_MACROS.append(('_V6_5_OR_LATER',1))
-if MATLAB_VERSION >= 7.3:
+if MATLAB_VERSION >= (7, 3):
     DEFINE_MACROS.append(('_V7_3_OR_LATER',1))
+if INTERLEAVED_COMPLEX is None:
+    INTERLEAVED_COMPLEX = MATLAB_VERSION >= (9, 4)
+if INTERLEAVED_COMPLEX:
+    # what ``mex -R2018a`` does
+    DEFINE_MACROS.append(('MATLAB_DEFAULT_RELEASE', 'R2018a'))
 if USE_NUMERIC:
     DEFINE_MACROS.append(('MLABRAW_USE_NUMERIC', 1))
 setup (# Distribution meta-data
@@ -176,7 +197,7 @@ setup (# Distribution meta-data
        description = "A high-level bridge to matlab",
        author = "Alexander Schmolck",
        author_email = "A.Schmolck@gmx.net",
-       py_modules = ["mlabwrap"] + SUPPORT_MODULES,
+       py_modules = ["mlabwrap", "mlabmat", "mlabrecord", "mlabprofile", "mlabbroker"] + SUPPORT_MODULES,
        url='http://mlabwrap.sourceforge.net',
        ext_modules = [
           Extension(EXTENSION_NAME, ['mlabraw.cpp'],
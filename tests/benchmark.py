@@ -0,0 +1,124 @@
+# Primitive benchmarks for the costs of bridging to matlab; run with ``python
+# benchmark.py``. Absolute numbers are meaningless without a reference (and
+# dominated by matlab's engine interface), so compare runs before and after a
+# change on the same machine.
+
+import sys
+import timeit
+import weakref
+from array import array
+import numpy
+import mlabraw
+from mlabwrap import mlab
+
+def report(title, stmt, number, setup="from __main__ import *"):
+    best = min(timeit.Timer(stmt, setup).repeat(3, number)) / number
+    print "%-45s %10.1f usec" % (title, best * 1e6)
+    return best
+
+session = mlab._session
+small_list = range(10)
+small_tuple = tuple(small_list)
+small_array = array('d', small_list)
+small_ndarray = numpy.arange(10.)
+
+def bench_call_overhead(number=200):
+    print "== small-argument call overhead =="
+    report("mlabraw.eval(session, '1;')", "mlabraw.eval(session, '1;')", number)
+    for title, arg in [("float", "3.0"), ("int", "3"), ("complex", "3+1j"),
+                       ("list (10)", "small_list"), ("tuple (10)", "small_tuple"),
+                       ("array.array (10)", "small_array"),
+                       ("ndarray (10)", "small_ndarray")]:
+        report("mlabraw.put(session, 'x', %s)" % title,
+               "mlabraw.put(session, 'x', %s)" % arg, number)
+    report("mlab.sin(3.0)", "mlab.sin(3.0)", number)
+    report("mlab.sin(small_list)", "mlab.sin(small_list)", number)
+    mlab.clear('x')
+
+batch = numpy.random.random((1000, 10))
+
+def bench_vmap(number=3):
+    print "== mapping a function over 1000 small arrays =="
+    report("[mlab.sum(x) for x in batch]", "[mlab.sum(x) for x in batch]", number)
+    report("mlab._vmap('sum', batch)", "mlab._vmap('sum', batch)", number)
+
+big = numpy.random.random((4000, 4000))
+
+def bench_map_blocks(number=1):
+    print "== sqrt of a 4000x4000 array in 500x4000 blocks =="
+    report("sequential mlab.sqrt per block",
+           "for i in range(0, 4000, 500): mlab.sqrt(big[i:i+500])", number)
+    report("mlab._map_blocks('sqrt', big, (500,))",
+           "mlab._map_blocks('sqrt', big, (500,))", number)
+
+def bench_struct_walk(number=20):
+    print "== attribute access on a proxied struct =="
+    global sct
+    sct = mlab._do("struct('a', struct('b', struct('c', 1)))")
+    report("sct.a.b.c", "sct.a.b.c", number)
+    report("sct.a.b.c (new proxy each time)",
+           "mlab._do(\"struct('a', struct('b', struct('c', 1)))\").a.b.c", number)
+    del sct
+
+def bench_proxies(number=100000):
+    print "== creating and dropping proxies =="
+    global root
+    root = mlab._do("struct('a', 1)")
+    # the proxy, its weak reference and its slot in ``mlab._proxies``
+    print "%-45s %10d bytes" % ("per root proxy", sys.getsizeof(root)
+                                + sys.getsizeof(weakref.ref(root)) + 8)
+    # part proxies are created without asking matlab anything
+    report("MlabObjectProxy(mlab, 'x.a', root)",
+           "MlabObjectProxy(mlab, 'x.a', root)", number,
+           "from __main__ import *; from mlabwrap import MlabObjectProxy")
+    report("list of %d part proxies" % number,
+           "[MlabObjectProxy(mlab, 'x.a', root) for i in xrange(%d)]" % number, 1,
+           "from __main__ import *; from mlabwrap import MlabObjectProxy")
+    report("mlab._make_proxy('1') (and clearing it)", "mlab._make_proxy('1')", 200)
+    del root
+
+def bench_conversion(megabytes=512, number=3):
+    print "== conversion throughput for %d MB of doubles (GB/s) ==" % megabytes
+    shape = (megabytes * 2**20 // 8 // 1000, 1000)
+    for threads, title in [(1, "1 thread"), (0, "1 thread per CPU")]:
+        old = mlabraw.set_copy_threads(threads)
+        try:
+            for dtype in ['float64', 'float32', 'int64', 'int32', 'int16', 'uint8',
+                          'bool', 'complex128']:
+                x = numpy.asfortranarray(numpy.ones(shape, dtype))
+                nbytes = x.size * numpy.dtype(('float64', 'complex128')[x.dtype.kind == 'c']).itemsize
+                put = min(timeit.Timer(lambda: mlabraw.put(session, 'x', x)).repeat(number, 1))
+                get = min(timeit.Timer(lambda: mlabraw.get(session, 'x')).repeat(number, 1))
+                print "%-16s %-10s put %6.2f GB/s   get %6.2f GB/s" % (
+                    title, dtype, nbytes / put / 1e9, nbytes / get / 1e9)
+        finally:
+            mlabraw.set_copy_threads(*old)
+    mlab.clear('x')
+
+def bench_zero_copy(megabytes=512, number=3):
+    print "== getting %d MB of doubles ==" % megabytes
+    mlabraw.put(session, 'x', numpy.ones((megabytes * 2**20 // 8 // 1000, 1000)))
+    report("mlabraw.get(session, 'x')", "mlabraw.get(session, 'x')", number)
+    report("mlabraw.get(session, 'x', True)", "mlabraw.get(session, 'x', True)", number)
+    mlab.clear('x')
+
+def bench_compile(number=100):
+    print "== three dependent statements =="
+    global snippet, x
+    x = numpy.random.random((10, 10))
+    snippet = mlab._compile("y = a * b; z = y + c; w = z';",
+                            ['a', 'b', 'c'], ['w'])
+    report("mlab.ctranspose(mlab.plus(mlab.mtimes(x, x), x))",
+           "mlab.ctranspose(mlab.plus(mlab.mtimes(x, x), x))", number)
+    report("snippet(x, x, x)", "snippet(x, x, x)", number)
+    del snippet, x
+
+if __name__ == '__main__':
+    bench_call_overhead()
+    bench_vmap()
+    bench_map_blocks()
+    bench_struct_walk()
+    bench_proxies()
+    bench_conversion()
+    bench_zero_copy()
+    bench_compile()
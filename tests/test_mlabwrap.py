@@ -212,7 +212,6 @@ class mlabwrapTC(NumericTestCase):
         _clear_call_args
         _session
         _proxies
-        _proxy_count
         _mlabraw_can_convert
         _dont_proxy""".split():
            self.backup[opt] = mlab.__dict__[opt]
@@ -221,6 +220,41 @@ class mlabwrapTC(NumericTestCase):
     def tearDown(self):
         """Reset options."""
         mlab.__dict__.update(self.backup)
+    def testBroker(self):
+        """Test sharing engines between processes via a broker."""
+        import threading, time, mlabwrap, mlabbroker
+        address = mktemp()
+        broker = mlabbroker.Broker(address, 1, lease_timeout=1)
+        server = threading.Thread(target=broker.serve_forever)
+        server.setDaemon(True)
+        server.start()
+        while not os.path.exists(address) or os.path.isfile(address):
+            time.sleep(0.05)
+        os.environ['MLABWRAP_BROKER'] = address
+        try:
+            client = MlabWrap()
+            # all engines are leased
+            self.assertRaises(mlabbroker.BrokerError, MlabWrap)
+            big = rand(300, 300) # transferred via shared memory
+            assert numpy.all(client.sum(big) == mlab.sum(big))
+            client._set('x', 'secret')
+            mlabwrap._close_session(client._session)
+            client = MlabWrap() # gets the same engine, but cleared
+            self.assertRaises(MlabError, client._get, 'x')
+            mlabwrap._close_session(client._session)
+            # shared memory files of failed requests don't pile up
+            shm_files = lambda: [f for f in os.listdir(mlabbroker.SHM_DIR)
+                                 if f.startswith('mlabbroker')]
+            before = shm_files()
+            connection = mlabbroker._Connection(address) # without an engine
+            try:
+                self.assertRaises(mlabbroker.BrokerError, connection.request,
+                                  'put', 'x', mlabbroker._pack(big), False)
+            finally:
+                connection.close()
+            self.assertEqual(shm_files(), before)
+        finally:
+            del os.environ['MLABWRAP_BROKER']
     def testCallArgs(self):
         mlab._dont_proxy['cell'] = True
         try:
@@ -233,6 +267,485 @@ class mlabwrapTC(NumericTestCase):
         finally:
             mlab._clear_call_args = True
             mlab._dont_proxy['cell'] = False
+    def testCompile(self):
+        """Test running precompiled snippets of matlab code."""
+        f = mlab._compile("y = a' + b; % a and b\nz = {y * c, 'a'};",
+                          ['a', 'b', 'c'], ['y', 'z'])
+        mlab._dont_proxy['cell'] = True
+        try:
+            for i in range(2):
+                y, z = f(numpy.array([[1., 2.]]), b=i, c=2)
+                self.assertEqual(y, numpy.array([[1.+i], [2.+i]]))
+                self.assertEqual(z[0], 2 * y)
+                self.assertEqual(z[1], 'a')
+            self.assertRaises(TypeError, f, 1, 2)
+            self.assertRaises(MlabError, f, numpy.array([[1., 2.]]), 0, numpy.ones((3, 3)))
+            assert not [v for v in mlab.who() if v.startswith('TMP_')]
+        finally:
+            mlab._dont_proxy['cell'] = False
+        # proxies are passed and returned as usual
+        g = mlab._compile("s.x = s.x + 1;", ['s'], ['s'])
+        sct = mlab.struct('x', 1)
+        self.assertEqual(g(g(sct)).x, numpy.array([[3.]]))
+        self.assertEqual(sct.x, numpy.array([[1.]]))
+        # snippets longer than mlabraw.eval's buffer still run in one go
+        code = "y = a;\n" + "y = y + 1; % increment\n" * 300
+        assert len(code) > BUFSIZE
+        h = mlab._compile(code, ['a'], ['y'])
+        self.assertEqual(h(numpy.array([[1., 2.]])), numpy.array([[301., 302.]]))
+        self.assertEqual(h(0), numpy.array([[300.]]))
+        mlab._dont_proxy['cell'] = True
+        try:
+            assert not [v for v in mlab.who() if v.startswith('TMP_')]
+        finally:
+            mlab._dont_proxy['cell'] = False
+    def testFetch(self):
+        """Test fetching many parts of a proxied value at once."""
+        import mlabwrap
+        s = mlab._do("struct('a', struct('b', 1), 'c', {{'x', 'y', 'foo'}},"
+                     " 'meta', struct('size', [3 4]))")
+        got = mlab._fetch(s, ['a.b', 'c{3}', 'meta.size', 'c', 'a'])
+        self.assertEqual(sorted(got), sorted(['a.b', 'c{3}', 'meta.size', 'c', 'a']))
+        self.assertEqual(got['a.b'], numpy.array([[1.]]))
+        self.assertEqual(got['c{3}'], 'foo')
+        self.assertEqual(got['meta.size'], numpy.array([[3., 4.]]))
+        assert isinstance(got['c'], mlabwrap.MlabObjectProxy)
+        self.assertEqual(got['a'].b, numpy.array([[1.]]))
+        self.assertEqual(mlab._fetch(s, []), {})
+        mlab._do("v = struct('x', {1, 2});", nout=0)
+        try:
+            self.assertEqual(mlab._fetch('v', ['(2).x'])['(2).x'], numpy.array([[2.]]))
+        finally:
+            mlab.clear('v')
+    def testGetSetMany(self):
+        """Test transferring many variables at once."""
+        import mlabwrap, mlabraw
+        sct = mlab.struct('x', 1)
+        mlab._set_many({'many_a': numpy.array([[1., 2.], [3., 4.]]), 'many_b': 'foo',
+                        'many_c': sct})
+        a, b, c = mlab._get_many(['many_a', 'many_b', 'many_c'], remove=True)
+        self.assertEqual(a, numpy.array([[1., 2.], [3., 4.]]))
+        self.assertEqual(b, 'foo')
+        assert isinstance(c, mlabwrap.MlabObjectProxy) and c is not sct
+        self.assertEqual(c.x, numpy.array([[1.]]))
+        assert not [v for v in mlab.who() if v.startswith('many_')]
+        # far more than fits into a single `mlabraw.eval`
+        names = ['many_variable_with_a_long_name_%d' % i for i in range(150)]
+        mlab._set_many(dict([(name, sct) for name in names]))
+        values = mlab._get_many(names, remove=True)
+        self.assertEqual(values[-1].x, numpy.array([[1.]]))
+        mlabraw.put_many(mlab._session, {'many_d': numpy.array([1, 2], 'int8'),
+                                         'many_e': 'bar'}, True)
+        got = mlabraw.get_many(mlab._session, ['many_d', 'many_e'])
+        self.assertEqual(got['many_d'].dtype, numpy.dtype('int8'))
+        self.assertEqual(got['many_e'], 'bar')
+        self.assertEqual(mlabraw.get_many(mlab._session, []), {})
+        self.assertRaises(mlabraw.error, mlabraw.get_many, mlab._session, ['many_nonesuch'])
+        mlab.clear('many_d', 'many_e')
+    def testIterChunks(self):
+        a = numpy.arange(24.).reshape(4,6)
+        mlab._set('a', a)
+        try:
+            for axis in [0, 1, -1]:
+                for prefetch in [False, True]:
+                    blocks = list(mlab._iter_chunks('a', axis=axis, chunk=4,
+                                                    prefetch=prefetch))
+                    self.assertEqual(len(blocks), -(-a.shape[axis] // 4))
+                    self.assertEqual(numpy.concatenate(blocks, axis), a)
+            # abandoning a prefetching iteration mustn't hang
+            for block in mlab._iter_chunks('a', chunk=1, prefetch=True):
+                break
+            self.assertRaises(ValueError, list, mlab._iter_chunks('a', axis=2))
+        finally:
+            mlab.clear('a')
+        mlab._dont_proxy['cell'] = True
+        try:
+            assert not [v for v in mlab.who() if v.startswith('TMP_CHUNK')]
+        finally:
+            mlab._dont_proxy['cell'] = False
+    def testMapBlocks(self):
+        a = numpy.random.random((53, 20))
+        self.assertAlmostEqual(mlab._map_blocks('sqrt', a, (10, 7)), numpy.sqrt(a))
+        self.assertAlmostEqual(mlab._map_blocks('power', a, (16,), 2), a**2)
+        filename = mktemp(suffix='.dat')
+        try:
+            res = mlab._map_blocks('sqrt', a, (8,), out=filename)
+            assert isinstance(res, numpy.memmap)
+            self.assertAlmostEqual(numpy.asarray(res), numpy.sqrt(a))
+            del res
+        finally:
+            os.remove(filename)
+        self.assertRaises(ValueError, mlab._map_blocks, 'sum', a, (10, 7))
+        self.assertRaises(MlabError, mlab._map_blocks, 'dontexist', a, (10, 7))
+    def testMatFiles(self):
+        """Test the native .mat file reader/writer against matlab."""
+        filename = mktemp(suffix='.mat')
+        big = numpy.random.random((300, 500))
+        try:
+            for compress in [False, True]:
+                saveMat(filename, {'a': numpy.arange(6.).reshape(2,3),
+                                   'i': numpy.arange(3, dtype='int32'),
+                                   's': 'foo', 'c': ['x', 1.]},
+                        compress=compress)
+                mlab._do("load('%s')" % filename, nout=0)
+                try:
+                    self.assertEqual(mlab._get('a'), numpy.arange(6.).reshape(2,3))
+                    assert mlab._do("class(i)") == 'int32'
+                    assert mlab._do("double(isequal(i, int32([0;1;2])))")
+                    assert mlab._get('s') == 'foo'
+                    assert mlab._do("double(iscell(c) && isequal(c{2}, 1))")
+                finally:
+                    mlab.clear('a', 'i', 's', 'c')
+            # empty values are 0x0, as with `mlab._set`
+            saveMat(filename, {'e': numpy.zeros(0), 'l': []})
+            loaded = loadMat(filename)
+            self.assertEqual(loaded['e'].shape, (0, 0))
+            self.assertEqual(loaded['l'].shape, (0, 0))
+            mlab._set('big', big)
+            mlab._do("save('%s', '-v6', 'big')" % filename, nout=0)
+            mlab.clear('big')
+            loaded = loadMat(filename)['big']
+            self.assertEqual(loaded, big)
+            # large uncompressed variables are memory-mapped
+            assert not loaded.flags.writeable and loaded.flags.f_contiguous
+            del loaded
+        finally:
+            os.remove(filename)
+    def testPickle(self):
+        """Test (batch) pickling of (nested) proxies."""
+        import cPickle
+        sct = mlab._do("struct('x', {1, 2}, 'y', {'a', struct('z', {3, 4})})")
+        nested = sct[1].y
+        assert nested._parent is not None
+        for protocol in [0, 2]:
+            copy = cPickle.loads(cPickle.dumps(nested, protocol))
+            assert copy._parent is None
+            self.assertEqual(copy[1].z, numpy.array([[4]]))
+        sct2, nested2 = mlab._load_proxies(mlab._dump_proxies([sct, nested]))
+        self.assertEqual(sct2[0].x, numpy.array([[1]]))
+        self.assertEqual(mlab.size(nested2), numpy.array([[1., 2.]]))
+        self.assertEqual(mlab._dump_proxies([]), [])
+        self.assertEqual(mlab._loads(cPickle.dumps(nested, 2))[0].z, numpy.array([[3]]))
+        # big batches, even if sweeping after every operation
+        mlab._sweep_interval, mlab._memory_soft_limit = 1, 0
+        try:
+            copies = mlab._load_proxies(mlab._dump_proxies([sct] * 100))
+            self.assertEqual(copies[-1][1].x, numpy.array([[2]]))
+        finally:
+            mlab._sweep_interval, mlab._memory_soft_limit = 100, None
+    def testProcesses(self):
+        """Test using `mlab` from the (forked) workers of a process pool."""
+        import cPickle, multiprocessing
+        assert cPickle.loads(cPickle.dumps(mlab.sqrt, 2)) is mlab.sqrt
+        session = mlab._session
+        pool = multiprocessing.Pool(2, init_worker, ("MLABWRAP_SETUP_ = 1;",))
+        try:
+            self.assertEqual(map(toscalar, pool.map(mlab.sqrt, [4., 9., 16.])),
+                             [2., 3., 4.])
+            self.assertEqual(map(toscalar, pool.map(mlab.exist, ['MLABWRAP_SETUP_'] * 2)),
+                             [1., 1.])
+        finally:
+            pool.close()
+            pool.join()
+        # the workers had sessions of their own
+        assert mlab._session is session
+        self.assertEqual(toscalar(mlab.exist('MLABWRAP_SETUP_')), 0.)
+        self.assertEqual(mlab.plus(1, 1), numpy.array([[2.]]))
+        # a child that never uses matlab doesn't start a session for cleaning up
+        sct = mlab.struct('a', 1)
+        pid = os.fork()
+        if not pid:
+            try:
+                del sct
+                gc.collect()
+                mlab._sweep()
+                os._exit(mlab._session is not session)
+            except:
+                os._exit(2)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertEqual(sct.a, numpy.array([[1.]]))
+    def testProfile(self):
+        """Test profiling matlab function calls."""
+        from StringIO import StringIO
+        mlab._profile(True)
+        try:
+            mlab.linspace(0, 1, 5)
+            mlab.linspace(0, 1, 5)
+        finally:
+            profiler = mlab._profile(False)
+        count, wall, own, other = profiler.calls['linspace']
+        self.assertEqual(count, 2)
+        assert 0 < own <= wall
+        folded = StringIO()
+        profiler.write_collapsed(folded)
+        stacks = [line.rsplit(' ', 1)[0] for line in folded.getvalue().splitlines()]
+        assert 'linspace;linspace' in stacks
+        assert not [s for s in stacks if not s.startswith('linspace;')]
+        # profiling is off again
+        mlab.linspace(0, 1, 5)
+        self.assertEqual(profiler.calls['linspace'][0], 2)
+    def testProxyTable(self):
+        """Test that proxies are compact and their ids get reused."""
+        gc.collect()
+        before = len(mlab._proxies)
+        sct = mlab.struct('a', 1)
+        assert not hasattr(sct, '__dict__')
+        assert sct._ is not sct._ # no cached indexer keeping the proxy alive
+        assert mlab._proxies[sct._name] is sct
+        assert sct in mlab._proxies.values()
+        assert len(mlab._proxies) == before + 1
+        name = sct._name
+        del sct
+        assert name not in mlab._proxies
+        assert len(mlab._proxies) == before
+        # the id of the dead proxy is reused
+        self.assertEqual(mlab.struct('b', 2)._name, name)
+    def testProxyMeta(self):
+        """Test that proxies cache their metadata (until modified)."""
+        s = mlab._do("struct('a', struct('b', 1), 'c', 'x')")
+        assert not s._meta_cache # probed on demand only
+        self.assertEqual(s._meta()['class'], 'struct')
+        self.assertEqual(s._meta()['fields'], ['a', 'c'])
+        self.assertEqual(s._meta()['dims'], (1, 1))
+        self.assertEqual(s.a.b, numpy.array([[1]]))
+        assert s._name + '.a.b' in s._meta_cache
+        s.a = 'now a string'
+        assert not s._meta_cache
+        self.assertEqual(s.a, 'now a string')
+        s.c = mlab._do("struct('b', {1, 2, 3})")
+        self.assertEqual(s.c._meta()['dims'], (1, 3))
+        self.assertEqual(s.c[2].b, numpy.array([[3]]))
+    def testRecord(self):
+        """Test recording and replaying engine calls."""
+        import mlabrecord
+        log = mktemp()
+        mlab._record(log)
+        try:
+            mlab._set('x', numpy.arange(6.).reshape(2,3))
+            mlab._do("x = x * 2;", nout=0)
+            mlab._get('x')
+        finally:
+            mlab._record(None)
+        try:
+            calls = mlabrecord.load(log)
+            self.assertEqual([c.op for c in calls if c.what == 'x'], ['put', 'get'])
+            put = [c for c in calls if c.op == 'put' and c.what == 'x'][0]
+            self.assertEqual((put.kind, put.shape, put.nbytes), ('array', (2,3), 48))
+            assert [c for c in calls if c.op == 'eval' and "x = x * 2" in c.what]
+            for target in [mlab, None]:
+                results = mlabrecord.replay(calls, target)
+                self.assertEqual([c for (c, t) in results], calls)
+            self.assertEqual(mlab._get('x').shape, (2,3))
+        finally:
+            os.remove(log)
+            mlab.clear('x')
+    def testSingleFlight(self):
+        """Identical concurrent calls should share a single execution."""
+        import threading, time
+        coalesced = mlab._stats['coalesced']
+        results = []
+        def work():
+            mlab.pause(1, nout=0)
+            results.append(mlab.plus(numpy.array([[1., 2.]]), 1))
+        mlab._single_flight = True
+        try:
+            start = time.time()
+            threads = [threading.Thread(target=work) for i in range(4)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+            assert time.time() - start < 3
+        finally:
+            mlab._single_flight = False
+        assert mlab._stats['coalesced'] > coalesced
+        self.assertEqual(len(results), 4)
+        for res in results:
+            self.assertEqual(res, numpy.array([[2., 3.]]))
+        self.assertEqual(mlab._flights, {})
+        # arguments that compare equal but aren't the same aren't shared
+        import mlabwrap
+        assert mlabwrap._fingerprint((0.0, -1.)) != mlabwrap._fingerprint((-0.0, -1.))
+        assert mlabwrap._fingerprint(-0j) != mlabwrap._fingerprint(0j)
+        results = {}
+        def angle(y):
+            mlab.pause(1, nout=0)
+            results[repr(y)] = mlab.atan2(y, -1.)
+        mlab._single_flight = True
+        try:
+            threads = [threading.Thread(target=angle, args=(y,)) for y in (0.0, -0.0)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        finally:
+            mlab._single_flight = False
+        self.assertAlmostEqual(results['0.0'], numpy.array([[numpy.pi]]))
+        self.assertAlmostEqual(results['-0.0'], numpy.array([[-numpy.pi]]))
+    def testStrings(self):
+        """Test (unicode) strings, char matrices and cellstr conversion."""
+        s = u'gr\xfc\xdfe \u20ac'
+        mlab._set('s', s)
+        self.assertEqual(mlab._get('s'), s)
+        assert toscalar(mlab._do("double(s(end))")) == 0x20ac
+        self.assertEqual(mlab._do("['ab ';'cde']"), ['ab ', 'cde'])
+        mlab._set('s', 'plain')
+        assert type(mlab._get('s')) is str
+        labels = ['a', u'\xfcber', 'ccc', '']
+        mlab._set('c', labels)
+        try:
+            assert mlab._do("double(iscellstr(c) && isequal(size(c), [1 4]))")
+            mlab._dont_proxy['cell'] = True
+            self.assertEqual(mlab._get('c'), labels)
+            mlab._set('c', numpy.array(['x', 'yy']))
+            self.assertEqual(mlab._get('c'), ['x', 'yy'])
+            # cells with char matrices still work, just more slowly
+            mlab._do("c{3} = ['ab';'cd'];", nout=0)
+            self.assertEqual(mlab._get('c'), ['x', 'yy', ['ab', 'cd']])
+            if not toscalar(mlab._do("double(verLessThan('matlab', '9.1'))")):
+                self.assertEqual(mlab._do("string('foo')"), 'foo')
+                self.assertEqual(mlab._do("string({'x', 'y'})"), ['x', 'y'])
+        finally:
+            mlab._dont_proxy['cell'] = False
+            mlab.clear('s', 'c')
+    def testSweep(self):
+        """Test memory accounting and sweeping of leaked temporaries."""
+        exists = lambda name: toscalar(mlab._do("double(exist('%s', 'var'))" % name))
+        # a temporary left behind by a failed operation ...
+        mlab._sweep_interval = sys.maxint
+        mlab._enter()
+        try:
+            leaked = mlab._tmp_name("TMP_LEAK")
+            mlab._eval("%s = zeros(100, 10);" % leaked)
+        finally:
+            mlab._leave()
+        assert leaked in mlab._orphans
+        mlab._set('mem_test', numpy.zeros((100, 10)))
+        try:
+            report = mlab._memory_report()
+            self.assertEqual(report['variables']['mem_test'], 8000)
+            self.assertEqual(report['temporaries'][leaked], 8000)
+            assert report['total'] >= 16000
+            # ... gets cleared by the next sweep
+            swept = mlab._stats['swept']
+            mlab._sweep()
+            assert not exists(leaked)
+            self.assertEqual(mlab._stats['swept'], swept + 1)
+            # a deep sweep also catches stale proxy values, but not live ones
+            mlab._eval("PROXY_VAL99999__ = 1; s.a = 1;")
+            proxy = mlab._get('s', remove=True)
+            assert proxy._name in mlab._memory_report()['proxies']
+            mlab._sweep(deep=True)
+            assert not exists('PROXY_VAL99999__')
+            assert exists(proxy._name)
+            assert exists('mem_test')
+            del proxy
+        finally:
+            mlab._sweep_interval = 100
+            mlab.clear('mem_test')
+    def testSyncedArray(self):
+        a = numpy.random.random((8, 5))
+        synced = mlab._sync('synced', a)
+        try:
+            synced[2, 1:3] = -1
+            synced[::-3, ...] = -2
+            synced[-1] = -3
+            a[2, 1:3] = -1; a[::-3, ...] = -2; a[-1] = -3
+            synced.push()
+            self.assertEqual(mlab._get('synced'), a)
+            mlab._do("synced(:,1) = 42;", nout=0)
+            synced.pull((slice(None), 0))
+            a[:,0] = 42
+            self.assertEqual(synced.array, a)
+            # 1D arrays live as column vectors in matlab
+            vec = mlab._sync('vec', numpy.arange(5.))
+            vec[3:0:-2] = 9
+            vec.push()
+            self.assertEqual(mlab._get('vec'), numpy.array([[0., 9., 2., 9., 4.]]).T)
+            mlab.clear('vec')
+        finally:
+            mlab.clear('synced')
+    def testTables(self):
+        """Test DataFrame <-> table transfer."""
+        try:
+            import pandas
+        except ImportError:
+            return
+        if toscalar(mlab._do("double(verLessThan('matlab', '8.2'))")):
+            return # no tables
+        frame = pandas.DataFrame({'n': numpy.arange(3, dtype='int32'),
+                                  'x': [0.5, -1., 2.],
+                                  'ok': [True, False, True],
+                                  'name': ['a', 'bb', u'\xfc']},
+                                 columns=['n', 'x', 'ok', 'name'])
+        mlab._set_table('t', frame)
+        try:
+            assert mlab._do("double(istable(t) && isa(t.n, 'int32') && islogical(t.ok))")
+            self.assertEqual(mlab._do("t.Properties.VariableNames"), list(frame.columns))
+            back = mlab._get_table('t')
+            self.assertEqual(list(back.columns), list(frame.columns))
+            for col in frame.columns:
+                self.assertEqual(back[col].dtype, frame[col].dtype)
+                self.assertEqual(list(back[col]), list(frame[col]))
+            mlab._do("t.wide = [t.x, t.x];", nout=0)
+            import mlabwrap
+            self.assertRaises(mlabwrap.MlabConversionError, mlab._get_table, 't')
+            # no columns (but rows)
+            mlab._set_table('t', pandas.DataFrame(index=range(3)))
+            assert mlab._do("double(istable(t))")
+            self.assertEqual(mlab._do("size(t)"), numpy.array([[3., 0.]]))
+        finally:
+            mlab.clear('t')
+    def testThreads(self):
+        """Concurrent calls mustn't clobber each others args and results."""
+        import threading
+        errors = []
+        def work(offset):
+            try:
+                for i in range(20):
+                    x = offset + i
+                    assert toscalar(mlab.plus(x, 1)) == x + 1
+                    assert mlab.sort([x+2, x, x+1], nout=2)[1].flat[0] == 2
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=work, args=(1000*i,))
+                   for i in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(errors, [])
+    def testTimeout(self):
+        import time
+        timeouts = mlab._stats['timeouts']
+        self.assertRaises(MlabTimeoutError, mlab._do, "pause(30)",
+                          nout=0, timeout=1)
+        self.assertRaises(MlabTimeoutError, mlab.pause, 30, timeout=1)
+        self.assertEqual(mlab._stats['timeouts'], timeouts + 2)
+        # the session must be usable again, even if it had to be restarted
+        self.assertEqual(mlab.plus(1, 1), numpy.array([[2.]]))
+        # calls only time out because of their own engine work, not because
+        # they had to wait for another thread's call
+        import threading
+        slow = threading.Thread(target=mlab.pause, args=(3,), kwargs={'nout': 0})
+        slow.start()
+        try:
+            time.sleep(.5)
+            self.assertEqual(mlab.plus(1, 1, timeout=1), numpy.array([[2.]]))
+        finally:
+            slow.join()
+        self.assertEqual(mlab._stats['timeouts'], timeouts + 2)
+        # don't let `tearDown` restore a dead session
+        self.backup['_session'] = mlab._session
+    def testVmap(self):
+        batch = numpy.random.random((5, 3, 2))
+        self.assertAlmostEqual(mlab._vmap('sum', batch),
+                               numpy.array([mlab.sum(x) for x in batch]))
+        self.assertAlmostEqual(mlab._vmap('sum', batch, 2),
+                               numpy.array([mlab.sum(x, 2) for x in batch]))
+        self.assertAlmostEqual(mlab._vmap('@(x) x.^2', batch, axis=2),
+                               numpy.array([x**2 for x in numpy.rollaxis(batch, 2)]))
+        # lists of vectors and multiple return values
+        vals, idx = mlab._vmap('sort', [[3, 1, 2], [0, 2, 1]], nout=2)
+        # (1D slices are passed as column vectors)
+        self.assertEqual(vals, numpy.array([[1., 2., 3.], [0., 1., 2.]]).reshape(2,3,1))
+        self.assertEqual(idx, numpy.array([[2., 3., 1.], [1., 3., 2.]]).reshape(2,3,1))
+        self.assertRaises(ValueError, mlab._vmap, 'sum', [])
+        self.assertRaises(MlabError, mlab._vmap, 'sqrt', [1, 2], 3)
     def testXXXSubtler(self):
         """test more subtle stuff. This must come last, hence the XXX"""
         import os, cPickle
@@ -402,6 +915,61 @@ class mlabwrapTC(NumericTestCase):
             self.assertEqual(mlabraw.eval(mlab._session, r"1"),'')
         finally:
             mlabraw.eval(mlab._session,'clear ans')
+        # complex data, whichever way matlab stores it
+        assert mlabraw.interleaved_complex in (0, 1)
+        for value in [numpy.array([1j, 2., -3-4j]),
+                      numpy.array([[1j, 2.], [3., 4-1j]], 'F'),
+                      numpy.array([[1j, 2.], [3., 4-1j]]).T]:
+            mlabraw.put(mlab._session, 'z', value)
+            self.assertEqual(mlabraw.get(mlab._session, 'z'),
+                             _canonicalMShape(numpy.asarray(value, 'D')))
+        mlabraw.put(mlab._session, 'z', numpy.array(1-2j))
+        self.assertEqual(mlabraw.get(mlab._session, 'z'), numpy.array([[1-2j]]))
+        # other numeric classes and structs
+        mlabraw.put(mlab._session, 'z', numpy.array([1, -2], 'int16'), True)
+        assert toscalar(mlab._do("double(isa(z, 'int16'))"))
+        self.assertEqual(mlabraw.get(mlab._session, 'z').dtype, numpy.dtype('int16'))
+        # byte-swapped data gets converted, not copied raw
+        value = numpy.arange(6.).reshape(2, 3)
+        mlabraw.put(mlab._session, 'z', value.astype(numpy.dtype('d').newbyteorder()))
+        self.assertEqual(mlabraw.get(mlab._session, 'z'), value)
+        mlabraw.put(mlab._session, 'z', (value - 1j*value).astype(
+            numpy.dtype('D').newbyteorder()))
+        self.assertEqual(mlabraw.get(mlab._session, 'z'), value - 1j*value)
+        mlabraw.put(mlab._session, 'z',
+                    numpy.array([1, -2, 300], numpy.dtype('int16').newbyteorder()), True)
+        self.assertEqual(mlabraw.get(mlab._session, 'z'), numpy.array([[1], [-2], [300]]))
+        mlabraw.put(mlab._session, 'z', {'a': numpy.array([True]), 'b': 'foo'}, True)
+        z = mlabraw.get(mlab._session, 'z')
+        self.assertEqual(sorted(z), ['a', 'b'])
+        self.assertEqual(z['a'].dtype, numpy.dtype(bool))
+        self.assertEqual(z['b'], 'foo')
+        # threaded conversion (forced for small arrays)
+        old = mlabraw.set_copy_threads(3, 0)
+        try:
+            for value in [numpy.arange(1000.), numpy.arange(12, dtype='uint32').reshape(3, 4),
+                          numpy.arange(60, dtype='float32').reshape(3, 4, 5),
+                          (numpy.arange(10) * 1j).reshape(5, 2)]:
+                mlabraw.put(mlab._session, 'z', value)
+                self.assertEqual(mlabraw.get(mlab._session, 'z'), _canonicalMShape(
+                    numpy.asarray(value, ('d', 'D')[value.dtype.kind == 'c'])))
+        finally:
+            mlabraw.set_copy_threads(*old)
+        # shared (zero-copy) get
+        value = numpy.arange(12.).reshape(3, 4)
+        mlabraw.put(mlab._session, 'z', {'a': value, 'b': numpy.zeros((0, 2))})
+        z = mlabraw.get(mlab._session, 'z', True)
+        self.assertEqual(z['a'], value)
+        assert z['a'].flags.f_contiguous and not z['a'].flags.writeable
+        assert z['a'].base is not None
+        self.assertEqual(z['b'].shape, (0, 2))
+        mlab._zero_copy = True
+        try:
+            self.assertEqual(mlab.plus(value, 1), value + 1)
+            assert not mlab.plus(value, 1).flags.writeable
+        finally:
+            mlab._zero_copy = False
+        mlabraw.eval(mlab._session, 'clear z')
         #print "tested mlabraw"
 
     def testOrder(self):